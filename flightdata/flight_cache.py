@@ -0,0 +1,185 @@
+# persistent cache of converted flights.  The normalized (columnar)
+# result of a load is saved as an uncompressed .npz file (one array per
+# channel/field) keyed by the source path and channel/field selection.
+# Each entry remembers the fingerprint (size + mtime, and optionally a
+# content hash) of the source files, so a changed source is reloaded.
+# Total cache size is capped with least recently used eviction.
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from .flight_data import FlightChannel, FlightData, from_records
+
+cache_version = 6
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME",
+                          os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "flightdata")
+
+# the files that make up a flight log (a single file, or every file in a
+# flight directory such as an aura csv/hdf5 flight)
+def source_files(path):
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+        files = []
+        for name in sorted(os.listdir(path)):
+            file = os.path.join(path, name)
+            if os.path.isfile(file):
+                files.append(file)
+        return files
+    else:
+        return [ path ]
+
+def file_hash(filename):
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        while True:
+            block = f.read(1024*1024)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+class FlightCache():
+    def __init__(self, cache_dir=None, max_bytes=2*1024*1024*1024,
+                 content_hash=False):
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.content_hash = content_hash
+
+    def fingerprint(self, path):
+        result = []
+        for file in source_files(path):
+            st = os.stat(file)
+            entry = [ os.path.basename(file), st.st_size, st.st_mtime_ns ]
+            if self.content_hash:
+                entry.append(file_hash(file))
+            result.append(entry)
+        return result
+
+    # the legacy (columnar=False) loaders can return other fields than
+    # the columnar ones (e.g. psix/psiy), so the two are cached separately
+    def entry_path(self, path, channels=None, fields=None, columnar=True):
+        if channels is not None:
+            channels = sorted(channels)
+        if fields is not None:
+            fields = { key: sorted(fields[key]) for key in sorted(fields) }
+        key = json.dumps([ cache_version, os.path.abspath(path), channels,
+                           fields, bool(columnar) ])
+        name = hashlib.sha1(key.encode()).hexdigest() + ".npz"
+        return os.path.join(self.cache_dir, name)
+
+    # return (FlightData, flight_format) or None if the path is not
+    # cached (or the cached entry is stale)
+    def get(self, path, channels=None, fields=None, columnar=True):
+        if not os.path.exists(path):
+            return None
+        entry = self.entry_path(path, channels, fields, columnar)
+        if not os.path.exists(entry):
+            return None
+        try:
+            with np.load(entry, allow_pickle=False) as npz:
+                meta = json.loads(str(npz["__meta__"]))
+                if meta["fingerprint"] != self.fingerprint(path):
+                    stale = True
+                else:
+                    stale = False
+                    result = FlightData()
+                    for name in meta["channels"]:
+                        result[name] = FlightChannel()
+                    for key in npz.files:
+                        if key == "__meta__":
+                            continue
+                        (name, field) = key.split("/", 1)
+                        col = npz[key]
+                        if col.dtype.kind == "U":
+                            col = col.astype(object)
+                        result[name].columns[field] = col
+        except (OSError, ValueError, KeyError):
+            stale = True
+        if stale:
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+            return None
+        # touch the entry so eviction sees it as recently used (it may
+        # have just been evicted by another process, the data is loaded)
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return result, meta["flight_format"]
+
+    def put(self, path, flight_data, flight_format, channels=None,
+            fields=None, columnar=True):
+        flight_data = from_records(flight_data)
+        arrays = {}
+        for name in flight_data:
+            for field, col in flight_data[name].columns.items():
+                if col.dtype.kind == "O":
+                    # only string columns can be stored without pickle
+                    if not all(isinstance(v, str) for v in col):
+                        return False
+                    col = col.astype(str)
+                arrays[name + "/" + field] = col
+        meta = {
+            "fingerprint": self.fingerprint(path),
+            "flight_format": flight_format,
+            "channels": list(flight_data.keys())
+        }
+        arrays["__meta__"] = np.array(json.dumps(meta))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = self.entry_path(path, channels, fields, columnar)
+        # write to a temp file and rename so readers never see a partial
+        # entry
+        (fd, tmp) = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, entry)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict()
+        return True
+
+    # remove least recently used entries until the cache fits max_bytes
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz"):
+                continue
+            file = os.path.join(self.cache_dir, name)
+            # another process may evict the same entries at the same time
+            try:
+                st = os.stat(file)
+            except FileNotFoundError:
+                continue
+            entries.append( (st.st_mtime, st.st_size, file) )
+            total += st.st_size
+        entries.sort()
+        for (mtime, size, file) in entries:
+            if total <= self.max_bytes:
+                break
+            # the space is freed either way
+            total -= size
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                continue
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz"):
+                os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,191 @@
+# columnar flight data container.  Each channel (imu, gps, air, filter,
+# pilot, act, ap, health, event, ...) is stored as a set of contiguous
+# numpy arrays keyed by field name instead of a list of per-sample
+# dicts.  Indexing a channel by field name returns the column array,
+# indexing by an integer returns a legacy style record dict, so most
+# older scripts keep working unchanged.
+
+import numpy as np
+
+class FlightChannel():
+    def __init__(self, columns=None):
+        self.columns = {}
+        if columns is not None:
+            for key in columns:
+                self.columns[key] = np.asarray(columns[key])
+
+    def __len__(self):
+        if "time" in self.columns:
+            return len(self.columns["time"])
+        for key in self.columns:
+            return len(self.columns[key])
+        return 0
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.columns[key]
+        elif isinstance(key, slice):
+            return self.take(key)
+        else:
+            return self.record(key)
+
+    def __setitem__(self, key, value):
+        self.columns[key] = np.asarray(value)
+
+    # iterate like the legacy list of records
+    def __iter__(self):
+        return iter(self.records())
+
+    def keys(self):
+        return list(self.columns.keys())
+
+    def nbytes(self):
+        return sum(col.nbytes for col in self.columns.values())
+
+    # return a new channel with the rows selected by a slice, index
+    # array or boolean mask (slices share memory with this channel)
+    def take(self, index):
+        result = FlightChannel()
+        for key in self.columns:
+            result.columns[key] = self.columns[key][index]
+        return result
+
+    def record(self, i):
+        record = {}
+        for key in self.columns:
+            record[key] = _value(self.columns[key][i])
+        return record
+
+    # legacy list-of-dicts view
+    def records(self):
+        keys = list(self.columns.keys())
+        values = [ self.columns[key].tolist() for key in keys ]
+        return [ dict(zip(keys, row)) for row in zip(*values) ]
+
+class FlightData(dict):
+    # channel name -> FlightChannel
+
+    def nbytes(self):
+        return sum(self[key].nbytes() for key in self)
+
+    # legacy dict of lists of dicts view (for old scripts)
+    def as_records(self):
+        result = {}
+        for key in self:
+            result[key] = self[key].records()
+        return result
+
+def _value(v):
+    if isinstance(v, np.ndarray):
+        return v.tolist()
+    elif isinstance(v, np.generic):
+        return v.item()
+    else:
+        return v
+
+# build a column array from a list of (python or numpy) values, None
+# marks a value missing from that record
+def _column(values):
+    present = [ v for v in values if v is not None ]
+    if not len(present):
+        return np.full(len(values), np.nan)
+    if len(present) < len(values):
+        if isinstance(present[0], (str, bytes)):
+            fill = type(present[0])()
+        else:
+            fill = np.nan
+        values = [ fill if v is None else v for v in values ]
+    if isinstance(present[0], (str, bytes)):
+        return np.array(values, dtype=object)
+    return np.array(values)
+
+# convert a single list of record dicts into a FlightChannel
+def channel_from_records(records):
+    keys = []
+    for record in records:
+        for key in record:
+            if key not in keys:
+                keys.append(key)
+    channel = FlightChannel()
+    for key in keys:
+        channel.columns[key] = _column([ record.get(key) for record in records ])
+    return channel
+
+# join channel pieces end to end (a field missing from some of the
+# pieces is filled with nan there, like channel_from_records())
+def concat(pieces):
+    pieces = [ piece for piece in pieces if len(piece.columns) ]
+    if not len(pieces):
+        return FlightChannel()
+    elif len(pieces) == 1:
+        return pieces[0]
+    keys = []
+    for piece in pieces:
+        for key in piece.columns:
+            if key not in keys:
+                keys.append(key)
+    result = FlightChannel()
+    for key in keys:
+        cols = []
+        for piece in pieces:
+            if key in piece.columns:
+                cols.append(piece.columns[key])
+            else:
+                cols.append(np.full(len(piece), np.nan))
+        result.columns[key] = np.concatenate(cols)
+    return result
+
+# convert a legacy loader result (dict of lists of record dicts) into a
+# columnar FlightData object
+def from_records(data):
+    if isinstance(data, FlightData):
+        return data
+    result = FlightData()
+    for key in data:
+        if isinstance(data[key], FlightChannel):
+            result[key] = data[key]
+        else:
+            result[key] = channel_from_records(data[key])
+    return result
+
+# channel / field selection (projection) shared by the format loaders.
+# channels is a list of channel names to load (None = all), fields is a
+# dict of channel name -> list of field names to keep (channels not
+# listed keep all their fields, 'time' is always kept.)
+
+def want(channels, name):
+    return channels is None or name in channels
+
+def keep_fields(fields, name):
+    if fields is None or name not in fields:
+        return None
+    keep = list(fields[name])
+    if "time" not in keep:
+        keep.insert(0, "time")
+    return keep
+
+# drop the channels and fields not selected from a loader result (either
+# a FlightData object or a legacy dict of lists of record dicts)
+def project(data, channels=None, fields=None):
+    for name in list(data.keys()):
+        if not want(channels, name):
+            del data[name]
+            continue
+        keep = keep_fields(fields, name)
+        if keep is None:
+            continue
+        if isinstance(data[name], FlightChannel):
+            for key in data[name].keys():
+                if key not in keep:
+                    del data[name].columns[key]
+        else:
+            records = []
+            for record in data[name]:
+                if isinstance(record, dict):
+                    record = { key: record[key] for key in keep if key in record }
+                records.append(record)
+            data[name] = records
+    return data
@@ -1,114 +1,845 @@
 # build linear interpolaters for the 'standard' flight data fields.
 
+from bisect import bisect_right
 import math
 import numpy as np
+import pandas as pd
 from scipy import interpolate # strait up linear interpolation, nothing fancy
 
+from .flight_data import FlightChannel, FlightData, channel_from_records, from_records
+
 # helpful constants
 d2r = math.pi / 180.0
 
+# fields that hold discrete states (switches, modes, counts) and are
+# resampled with zero order hold rather than interpolated
+discrete_fields = [ 'sats', 'num_sats', 'auto_manual', 'throttle_safety',
+                    'gear', 'master_switch', 'pilot_pass_through',
+                    'current_task', 'task_attrib', 'route_size',
+                    'target_waypoint_idx', 'wpt_index', 'status' ]
+
+# fields that hold angles (field name -> units).  These are interpolated
+# the short way around the circle and the results are wrapped back to
+# the range the loaders use: [-pi, pi) for 'rad', [0, 360) for 'deg'
+angle_fields = { 'phi': 'rad', 'psi': 'rad', 'hdg': 'deg',
+                 'wind_dir': 'deg' }
+
+# groups of fields that hold a unit quaternion (scalar first), these are
+# interpolated with slerp
+quaternion_fields = [ ('q0', 'q1', 'q2', 'q3'), ('qw', 'qx', 'qy', 'qz') ]
+
+# (low, period) of the range an angle field is wrapped to
+def angle_range(units):
+    if units == 'deg':
+        return 0.0, 360.0
+    else:
+        return -math.pi, 2*math.pi
+
+def wrap_angle(values, low, period):
+    return np.mod(values - low, period) + low
+
+# shortest signed difference between two angles
+def angle_delta(diff, period):
+    return np.mod(diff + 0.5*period, period) - 0.5*period
+
+# make a series of angles continuous (no jumps larger than half a turn)
+def unwrap_angle(values, period):
+    if len(values) < 2:
+        return values
+    steps = angle_delta(np.diff(values), period)
+    return np.concatenate((values[:1], values[0] + np.cumsum(steps)))
+
+# spherical linear interpolation between unit quaternions q0 and q1
+# (arrays of shape (..., 4)) at fractions frac (shape (...)), takes the
+# short way around (q and -q are the same rotation)
+def slerp(q0, q1, frac):
+    dot = np.sum(q0 * q1, axis=-1)
+    q1 = np.where((dot < 0)[..., None], -q1, q1)
+    theta = np.arccos(np.clip(np.abs(dot), 0.0, 1.0))
+    sin_theta = np.sin(theta)
+    small = sin_theta < 1e-6
+    safe = np.where(small, 1.0, sin_theta)
+    w0 = np.where(small, 1.0 - frac, np.sin((1.0 - frac) * theta) / safe)
+    w1 = np.where(small, frac, np.sin(frac * theta) / safe)
+    return w0[..., None] * q0 + w1[..., None] * q1
+
+# slerp a quaternion series (values is time x 4) at an array of times,
+# exact record times return the record, 0.0 outside the time range
+def slerp_many(time, values, times):
+    lo = np.searchsorted(time, times, side='right') - 1
+    lo = np.clip(lo, 0, len(time) - 2)
+    hi = lo + 1
+    t0 = time[lo]
+    t1 = time[hi]
+    q = slerp(values[lo], values[hi], (times - t0) / (t1 - t0))
+    q = np.where((times == t0)[..., None], values[lo], q)
+    q = np.where((times == t1)[..., None], values[hi], q)
+    inside = (times >= time[0]) & (times <= time[-1])
+    return np.where(inside[..., None], q, 0.0)
+
+# the quaternion groups (tuples of 4 field names) that are all present
+# in keys
+def quaternion_groups(keys, quaternions):
+    groups = []
+    for group in quaternions:
+        if all(key in keys for key in group):
+            groups.append(tuple(group))
+    return groups
+
+# one linear interp1d per numeric field.  data is a FlightChannel (the
+# column arrays are shared, not copied) or a list of record dicts, the
+# interp1d for a field is built on the first query that asks for it.
+# angles (default angle_fields) and quaternions (default
+# quaternion_fields) are interpolated with their own modes, pass {} / []
+# to interpolate everything linearly
 class FlightInterpolate():
-    def __init__(self, data):
-        # df is a pd.DataFrame indexed by time (in seconds)
-        columns = {}
-        if not len(data):
-            return
-        for key in data[0]:
-            print(" ", key, type(data[0][key]))
-            if type(data[0][key]) is str or type(data[0][key]) is bytes:
-                pass
-            else:
-                #print("  field:", key, type(data[0][key]))
-                columns[key] = []
-        for record in data:
-            for key in columns:
-                columns[key].append(record[key])
-        for key in columns:
-            columns[key] = np.array(columns[key])
+    def __init__(self, data, angles=None, quaternions=None):
+        if angles is None:
+            angles = angle_fields
+        if quaternions is None:
+            quaternions = quaternion_fields
+        if isinstance(data, FlightChannel):
+            channel = data
+        else:
+            channel = channel_from_records(data)
+        self.columns = {}
         self.interp = {}
-        for key in columns:
-            print(key)
-            self.interp[key] = interpolate.interp1d(columns['time'],
-                                                    columns[key],
+        self.array = None
+        for key in channel.keys():
+            col = channel[key]
+            if col.ndim == 1 and col.dtype.kind in "biuf":
+                self.columns[key] = col
+        self.keys = list(self.columns.keys())
+        self.angles = {}
+        for key in self.keys:
+            if key in angles:
+                self.angles[key] = angles[key]
+        self.quats = quaternion_groups(self.keys, quaternions)
+        self.quat_values = {}
+        self.order = None
+        if 'time' in self.columns:
+            time = np.asarray(self.columns['time'], dtype=float)
+        else:
+            time = np.zeros(0)
+        if np.any(time[1:] < time[:-1]):
+            self.order = np.argsort(time, kind='stable')
+            time = time[self.order]
+        self.time = time
+
+    # field values in time order
+    def sorted_column(self, key):
+        if self.order is None:
+            return self.columns[key]
+        return self.columns[key][self.order]
+
+    # the interp1d for a field (built on first use)
+    def field(self, key):
+        if key not in self.interp:
+            values = self.sorted_column(key)
+            if key in self.angles:
+                (low, period) = angle_range(self.angles[key])
+                values = unwrap_angle(values.astype(float), period)
+            self.interp[key] = interpolate.interp1d(self.time, values,
                                                     bounds_error=False,
-                                                    fill_value=0.0)
+                                                    fill_value=0.0,
+                                                    copy=False,
+                                                    assume_sorted=True)
+        return self.interp[key]
 
-    def query(self, t):
-        result = {}
+    def query(self, t, fields=None):
+        result = self.query_many(t, fields)
         result['time'] = t
-        for key in self.interp:
-            result[key] = self.interp[key](t).item()
+        for key in result:
+            if key != 'time':
+                result[key] = result[key].item()
         return result
 
+    # evaluate the fields (default all) at an array of times in one call,
+    # returns a dict of field name -> array (same shape as times)
+    def query_many(self, times, fields=None):
+        times = np.asarray(times, dtype=float)
+        if fields is None:
+            keys = self.keys
+        else:
+            keys = [ key for key in self.keys if key in fields ]
+        result = {}
+        result['time'] = times
+        for key in keys:
+            result[key] = self.field(key)(times)
+        for key in self.angles:
+            if key in result:
+                (low, period) = angle_range(self.angles[key])
+                result[key] = wrap_angle(result[key], low, period)
+        for group in self.quats:
+            if not any(key in keys for key in group):
+                continue
+            if group not in self.quat_values:
+                values = [ self.sorted_column(key) for key in group ]
+                self.quat_values[group] = np.column_stack(values).astype(float)
+            q = slerp_many(self.time, self.quat_values[group], times)
+            for i, key in enumerate(group):
+                if key in keys:
+                    result[key] = q[..., i]
+        return result
+
+    # the same data as an ArrayInterpolate (built on first use)
+    def as_array(self):
+        if self.array is None:
+            self.array = ArrayInterpolate(FlightChannel(self.columns),
+                                          angles=self.angles,
+                                          quaternions=self.quats)
+        return self.array
+
+    # cursor for fast sequential queries (see InterpolateCursor)
+    def cursor(self):
+        return InterpolateCursor(self.as_array())
+
 class pdFlightInterpolate():
-    def __init__(self, df):
+    def __init__(self, df, angles=None):
         # df is a pd.DataFrame indexed by time (in seconds)
+        if angles is None:
+            angles = angle_fields
         self.interp = {}
+        self.angles = {}
         for column in df.columns:
-            self.interp[column] = interpolate.interp1d(df.index, df[column],
+            values = df[column].to_numpy()
+            if column in angles:
+                self.angles[column] = angles[column]
+                (low, period) = angle_range(angles[column])
+                values = unwrap_angle(values.astype(float), period)
+            self.interp[column] = interpolate.interp1d(df.index, values,
                                                        bounds_error=False,
                                                        fill_value=0.0)
 
     def query(self, t):
-        result = {}
+        result = self.query_many(t)
         result['time'] = t
         for key in self.interp:
-            result[key] = self.interp[key](t).item()
+            result[key] = result[key].item()
         return result
 
-class InterpolationGroup():
+    # evaluate all the fields at an array of times in one call, returns a
+    # dict of field name -> array (same shape as times)
+    def query_many(self, times):
+        times = np.asarray(times, dtype=float)
+        result = {}
+        result['time'] = times
+        for key in self.interp:
+            result[key] = self.interp[key](times)
+        for key in self.angles:
+            (low, period) = angle_range(self.angles[key])
+            result[key] = wrap_angle(result[key], low, period)
+        return result
+
+# all the numeric fields of a channel stored as one 2-D array (time x
+# fields), each query locates the bracketing records once and blends all
+# the fields together.  Same results as FlightInterpolate (linear, 0.0
+# outside the time range, angles and quaternions get their own modes.)
+class ArrayInterpolate():
+    def __init__(self, data, angles=None, quaternions=None):
+        # data is a FlightChannel or a list of record dicts
+        if angles is None:
+            angles = angle_fields
+        if quaternions is None:
+            quaternions = quaternion_fields
+        self.keys = []
+        if isinstance(data, FlightChannel):
+            columns = data.columns
+        else:
+            columns = channel_from_records(data).columns
+        for key in columns:
+            col = columns[key]
+            if col.ndim == 1 and col.dtype.kind in "biuf":
+                self.keys.append(key)
+        time = np.asarray(columns['time'], dtype=float)
+        values = np.column_stack([ columns[key] for key in self.keys ])
+        values = values.astype(float)
+        if np.any(time[1:] < time[:-1]):
+            order = np.argsort(time, kind='stable')
+            time = time[order]
+            values = values[order]
+        self.time = time
+        self.values = values
+        # column numbers and (low, period) of the angle fields
+        self.angles = [ i for i, key in enumerate(self.keys) if key in angles ]
+        ranges = [ angle_range(angles[self.keys[i]]) for i in self.angles ]
+        self.angle_low = np.array([ r[0] for r in ranges ])
+        self.angle_period = np.array([ r[1] for r in ranges ])
+        # column numbers of each quaternion
+        self.quats = [ [ self.keys.index(key) for key in group ]
+                       for group in quaternion_groups(self.keys, quaternions) ]
+
+    # bracketing records for each time
+    def locate(self, times):
+        lo = np.searchsorted(self.time, times, side='right') - 1
+        lo = np.clip(lo, 0, len(self.time) - 2)
+        hi = lo + 1
+        inside = (times >= self.time[0]) & (times <= self.time[-1])
+        return lo, hi, inside
+
+    # column numbers of the fields (default all) plus the rest of any
+    # quaternion they are part of (slerp needs all four components)
+    def columns(self, fields=None):
+        if fields is None:
+            return None
+        cols = set([ i for i, key in enumerate(self.keys) if key in fields ])
+        for group in self.quats:
+            if cols & set(group):
+                cols |= set(group)
+        return sorted(cols)
+
+    # the angle columns (and their low, period) and the quaternion
+    # columns numbered within cols (all the columns when None)
+    def layout(self, cols):
+        if cols is None:
+            return self.angles, self.angle_low, self.angle_period, self.quats
+        pos = {}
+        for j, i in enumerate(cols):
+            pos[i] = j
+        keep = [ k for k, i in enumerate(self.angles) if i in pos ]
+        angles = [ pos[self.angles[k]] for k in keep ]
+        quats = [ [ pos[i] for i in group ] for group in self.quats
+                  if group[0] in pos ]
+        return angles, self.angle_low[keep], self.angle_period[keep], quats
+
+    # blend the fields (the columns cols, default all) between the
+    # bracketing records (same arithmetic as interp1d/np.interp so the
+    # results match exactly, including exact record times)
+    def blend(self, times, lo, hi, cols=None):
+        t0 = self.time[lo]
+        t1 = self.time[hi]
+        if cols is None:
+            y0 = self.values[lo]
+            y1 = self.values[hi]
+        else:
+            y0 = self.values[np.asarray(lo)[..., None], cols]
+            y1 = self.values[np.asarray(hi)[..., None], cols]
+        (angles, angle_low, angle_period, quats) = self.layout(cols)
+        if len(angles):
+            # blend angles toward the nearest equivalent of y1
+            y1 = y1.copy()
+            diff = y1[..., angles] - y0[..., angles]
+            y1[..., angles] = y0[..., angles] + \
+                angle_delta(diff, angle_period)
+        slope = (y1 - y0) / (t1 - t0)[..., None]
+        rows = slope * (times - t0)[..., None] + y0
+        for group in quats:
+            rows[..., group] = slerp(y0[..., group], y1[..., group],
+                                     (times - t0) / (t1 - t0))
+        rows = np.where((times == t0)[..., None], y0, rows)
+        rows = np.where((times == t1)[..., None], y1, rows)
+        if len(angles):
+            rows[..., angles] = wrap_angle(rows[..., angles], angle_low,
+                                           angle_period)
+        return rows
+
+    def query(self, t, fields=None):
+        (lo, hi, inside) = self.locate(t)
+        if inside:
+            row = self.blend(np.asarray(t, dtype=float), lo, hi)
+        else:
+            row = np.zeros(len(self.keys))
+        result = {}
+        result['time'] = t
+        for i, key in enumerate(self.keys):
+            if fields is None or key in fields:
+                result[key] = float(row[i])
+        return result
+
+    # only the fields asked for (default all) are blended
+    def query_many(self, times, fields=None):
+        times = np.asarray(times, dtype=float)
+        flat = times.ravel()
+        (lo, hi, inside) = self.locate(flat)
+        cols = self.columns(fields)
+        rows = self.blend(flat, lo, hi, cols)
+        rows[~inside] = 0.0
+        if cols is None:
+            cols = range(len(self.keys))
+        result = {}
+        result['time'] = times
+        for j, i in enumerate(cols):
+            key = self.keys[i]
+            if fields is None or key in fields:
+                result[key] = rows[:, j].reshape(times.shape)
+        return result
+
+    # zero order hold: the value of the latest record at or before each
+    # time (0.0 before the first record), dict of field name -> array for
+    # the fields (default all)
+    def hold_many(self, times, fields=None):
+        times = np.asarray(times, dtype=float)
+        flat = times.ravel()
+        index = np.searchsorted(self.time, flat, side='right') - 1
+        cols = [ i for i, key in enumerate(self.keys)
+                 if fields is None or key in fields ]
+        rows = self.values[np.maximum(index, 0)[:, None], cols]
+        rows[index < 0] = 0.0
+        result = {}
+        result['time'] = times
+        for j, i in enumerate(cols):
+            result[self.keys[i]] = rows[:, j].reshape(times.shape)
+        return result
+
+    def as_array(self):
+        return self
+
+    # cursor for fast sequential queries (see InterpolateCursor)
+    def cursor(self):
+        return InterpolateCursor(self)
+
+# stateful query cursor for an ArrayInterpolate.  The cursor remembers
+# the last bracketing record and walks it forward, so queries that move
+# forward in time (replaying a flight at a fixed step) are amortized
+# O(1); a backward (or long forward) jump falls back to a binary search.
+# Results are the same as ArrayInterpolate.query().
+class InterpolateCursor():
+    max_steps = 8
+
+    def __init__(self, interp):
+        self.interp = interp
+        self.time = interp.time.tolist()
+        self.lo = 0
+
+    # index of the record that starts the bracket around t
+    def seek(self, t):
+        time = self.time
+        last = len(time) - 2
+        lo = self.lo
+        if t < time[lo]:
+            lo = bisect_right(time, t) - 1
+        else:
+            steps = 0
+            while lo < last and time[lo+1] <= t:
+                lo += 1
+                steps += 1
+                if steps >= self.max_steps:
+                    lo = bisect_right(time, t, lo) - 1
+                    break
+        self.lo = min(max(lo, 0), last)
+        return self.lo
+
+    def query(self, t):
+        lo = self.seek(t)
+        if t >= self.time[0] and t <= self.time[-1]:
+            row = self.interp.blend(np.float64(t), lo, lo + 1)
+        else:
+            row = np.zeros(len(self.interp.keys))
+        result = {}
+        result['time'] = t
+        for i, key in enumerate(self.interp.keys):
+            result[key] = float(row[i])
+        return result
+
+# time index of one channel for discrete data (events, sats, switches,
+# modes) where interpolation makes no sense.  before() and nearest()
+# return row numbers into the channel (-1 where there is no record), for
+# a scalar time or an array of times, so nothing is copied until the
+# caller asks for values.  hold_many() / nearest_many() gather every
+# field (strings and bytes included) at those rows.
+class TimeIndex():
     def __init__(self, data):
+        # data is a FlightChannel or a list of record dicts
+        if isinstance(data, FlightChannel):
+            self.channel = data
+        else:
+            self.channel = channel_from_records(data)
+        time = channel_times(self.channel)
+        self.order = None
+        if np.any(time[1:] < time[:-1]):
+            self.order = np.argsort(time, kind='stable')
+            time = time[self.order]
+        self.time = time
+
+    # map sorted positions back to channel rows (-1 stays -1)
+    def rows(self, pos):
+        if self.order is None:
+            return pos
+        return np.where(pos < 0, -1, self.order[np.maximum(pos, 0)])
+
+    # row of the latest record at or before t
+    def before(self, t):
+        pos = np.searchsorted(self.time, t, side='right') - 1
+        return self.rows(pos)
+
+    # row of the record closest in time to t (ties go to the earlier one)
+    def nearest(self, t):
+        if not len(self.time):
+            return self.rows(np.full(np.shape(t), -1))
+        pos = np.searchsorted(self.time, t, side='left')
+        lo = np.clip(pos - 1, 0, len(self.time) - 1)
+        hi = np.clip(pos, 0, len(self.time) - 1)
+        pick = np.where(np.abs(self.time[hi] - t) < np.abs(t - self.time[lo]),
+                        hi, lo)
+        return self.rows(pick)
+
+    # record dict at a row (None for -1)
+    def record(self, row):
+        if row < 0:
+            return None
+        return self.channel.record(int(row))
+
+    # zero order hold record at time t (None before the first record)
+    def hold(self, t):
+        return self.record(self.before(t))
+
+    def query_nearest(self, t):
+        return self.record(self.nearest(t))
+
+    # dict of field name -> array at each row, plus 'index' (the row, -1
+    # with no record, the other fields are then copied from row 0)
+    def gather(self, rows):
+        rows = np.asarray(rows)
+        result = {}
+        if len(self.channel):
+            for key in self.channel.keys():
+                result[key] = self.channel[key][np.maximum(rows, 0)]
+        result['index'] = rows
+        return result
+
+    def hold_many(self, times):
+        return self.gather(self.before(np.asarray(times, dtype=float)))
+
+    def nearest_many(self, times):
+        return self.gather(self.nearest(np.asarray(times, dtype=float)))
+
+# backend is "scipy" (one interp1d per field, FlightInterpolate) or
+# "array" (ArrayInterpolate).  angles and quaternions override the
+# default angle_fields / quaternion_fields, channel_angles (channel name
+# -> field name -> units) overrides the angle units of single channels
+# on top of that (e.g. a loader that keeps a heading in radians, see
+# flight_loader.channel_angles()).  The interpolator for a
+# channel is only built the first time that channel is queried (group
+# holds the ones built so far), channels lists the channels that can be
+# interpolated (more than one record.)
+class InterpolationGroup():
+    def __init__(self, data, backend="scipy", angles=None, quaternions=None,
+                 channel_angles=None):
+        if backend not in ("scipy", "array"):
+            raise ValueError("unknown interpolation backend: " + str(backend))
+        self.data = data
+        self.backend = backend
+        self.angles = angles
+        self.quaternions = quaternions
+        if channel_angles is None:
+            channel_angles = {}
+        self.channel_angles = channel_angles
         self.group = {}
-        for key in data:
-            if len(data[key]) > 1:
-                print("group:", key)
-                self.group[key] = FlightInterpolate(data[key])
+        self.indices = {}
+        self.channels = [ key for key in data if len(data[key]) > 1 ]
 
-    def query(self, t, key):
-        if key in self.group:
-            return self.group[key].query(t)
+    # the interpolator for a channel (None if the channel can't be
+    # interpolated)
+    def interpolator(self, key):
+        if key not in self.group:
+            if key not in self.channels:
+                return None
+            angles = self.channel_angle_fields(key)
+            if self.backend == "array":
+                self.group[key] = ArrayInterpolate(self.data[key], angles,
+                                                   self.quaternions)
+            else:
+                self.group[key] = FlightInterpolate(self.data[key], angles,
+                                                    self.quaternions)
+        return self.group[key]
+
+    # the angle fields (field name -> units) of a channel
+    def channel_angle_fields(self, key):
+        if key not in self.channel_angles:
+            return self.angles
+        if self.angles is None:
+            angles = dict(angle_fields)
         else:
+            angles = dict(self.angles)
+        angles.update(self.channel_angles[key])
+        return angles
+
+    # fields (default all) limits the result (and for the scipy backend
+    # the interpolators built) to those fields
+    def query(self, t, key, fields=None):
+        interp = self.interpolator(key)
+        if interp is None:
             return None
+        return interp.query(t, fields)
 
-# emulate realtime linear processing of a data set
+    def query_many(self, times, key, fields=None):
+        interp = self.interpolator(key)
+        if interp is None:
+            return None
+        return interp.query_many(times, fields)
+
+    # time index of a channel for zero order hold / nearest record
+    # lookups (built on first use, channels with a single record work too)
+    def index(self, key):
+        if key not in self.data:
+            return None
+        if key not in self.indices:
+            self.indices[key] = TimeIndex(self.data[key])
+        return self.indices[key]
+
+    # latest record of a channel at or before t (None if there is none)
+    def hold(self, t, key):
+        index = self.index(key)
+        if index is None:
+            return None
+        return index.hold(t)
+
+    def nearest(self, t, key):
+        index = self.index(key)
+        if index is None:
+            return None
+        return index.query_nearest(t)
+
+    # query cursors for all the channels, for frame by frame replay
+    def cursor(self):
+        return GroupCursor(self)
+
+    # resample channels onto a common time grid in one vectorized pass,
+    # returns a pd.DataFrame indexed by time with "channel.field" columns.
+    # rate is a rate in hz (covering the time span all the channels have
+    # data for, an empty table when none of them can be interpolated) or
+    # an array of times.  Fields named in hold (default discrete_fields)
+    # use zero order hold instead of linear interpolation.
+    def resample(self, rate, channels=None, hold=None):
+        if channels is None:
+            channels = self.channels
+        if hold is None:
+            hold = discrete_fields
+        arrays = {}
+        for key in channels:
+            interp = self.interpolator(key)
+            if interp is not None:
+                arrays[key] = interp.as_array()
+        if np.ndim(rate) == 0 and not len(arrays):
+            times = np.zeros(0)
+        elif np.ndim(rate) == 0:
+            start = max([ a.time[0] for a in arrays.values() ])
+            end = min([ a.time[-1] for a in arrays.values() ])
+            times = start + np.arange(int(np.floor((end - start) * rate)) + 1) / rate
+        else:
+            times = np.asarray(rate, dtype=float)
+        table = {}
+        for key in arrays:
+            fields = [ f for f in arrays[key].keys if f != 'time' ]
+            held = [ f for f in fields if f in hold ]
+            linear = [ f for f in fields if f not in hold ]
+            values = {}
+            if len(linear):
+                values.update(arrays[key].query_many(times, linear))
+            if len(held):
+                values.update(arrays[key].hold_many(times, held))
+            for field in fields:
+                table[key + '.' + field] = values[field]
+        return pd.DataFrame(table, index=pd.Index(times, name='time'))
+
+class GroupCursor():
+    def __init__(self, group):
+        self.group = group
+        self.cursors = {}
+
+    def query(self, t, key):
+        if key not in self.cursors:
+            interp = self.group.interpolator(key)
+            if interp is None:
+                return None
+            self.cursors[key] = interp.cursor()
+        return self.cursors[key].query(t)
+
+# emulate realtime linear processing of a data set.  Each next() call
+# returns the next record of the master channel (imu by default) along
+# with any records of the other channels that became current since the
+# previous master record (time <= master time, at most one record stamped
+# exactly at the master time.)
+#
+# The merge order is worked out up front with one searchsorted per
+# channel: schedule[key][i] is the number of records of that channel
+# consumed after master record i, so batch consumers can use the
+# schedule arrays directly (the latest record at or before master record
+# i is schedule[key][i] - 1, -1 if there is none yet.)
+#
+# With master=None the group runs in event mode instead: every record of
+# every channel is returned on its own, in time order (ties in channel
+# order), next() returns a dict with just that one channel.  The merge
+# order is in event_channel (index into event_keys) and event_index.
+#
+# times holds the time of each step (master record or event), seek(t)
+# jumps to the first step at or after t.
 class IterateGroup():
-    def __init__(self, data):
+    def __init__(self, data, master='imu'):
         self.data = data
+        self.master = master
         self.counter = {}
         for key in data:
             self.counter[key] = 0
+        self.schedule = {}
+        self.times = np.zeros(0)
+        self.columns = None         # columnar copy of data for blocks()
+        if master is None:
+            self.position = 0
+            self.event_keys = list(data.keys())
+            (self.event_channel, self.event_index, self.times) = merge_order(data)
+        elif master in data:
+            master_time = channel_times(data[master])
+            self.times = master_time
+            for key in data:
+                if key != master:
+                    self.schedule[key] = merge_schedule(master_time,
+                                                        channel_times(data[key]))
 
     def size(self):
-        if 'imu' in self.data:
-            return len(self.data['imu'])
+        if self.master is None:
+            return len(self.event_index)
+        elif self.master in self.data:
+            return len(self.data[self.master])
         else:
             return 0
-    
+
+    # time of the record the next call to next() returns (None at the end)
+    def next_time(self):
+        if self.master is None:
+            i = self.position
+        else:
+            i = self.counter.get(self.master, 0)
+        if i < len(self.times):
+            return float(self.times[i])
+        else:
+            return None
+
+    # position the replay so next() returns the first master record (or
+    # event) at or after time t
+    def seek(self, t):
+        i = int(np.searchsorted(self.times, t, side='left'))
+        if self.master is None:
+            self.position = i
+            counts = np.bincount(self.event_channel[:i],
+                                 minlength=len(self.event_keys))
+            for j, key in enumerate(self.event_keys):
+                self.counter[key] = int(counts[j])
+        elif self.master in self.data:
+            self.counter[self.master] = i
+            for key in self.schedule:
+                if i > 0:
+                    self.counter[key] = int(self.schedule[key][i-1])
+                else:
+                    self.counter[key] = 0
+
     def next(self):
+        if self.master is None:
+            return self.next_event()
+        result = {}
+        # next master record
+        i = self.counter[self.master]
+        if i < len(self.data[self.master]):
+            result[self.master] = self.data[self.master][i]
+            self.counter[self.master] += 1
+
+            # new records of other types
+            for key in self.schedule:
+                last = self.counter[key]
+                count = int(self.schedule[key][i])
+                if count > last:
+                    result[key] = self.data[key][count-1]
+                self.counter[key] = count
+        return result
+
+    def next_event(self):
         result = {}
-        # next imu record
-        i = self.counter['imu']
-        if i < len(self.data['imu']):
-            t = self.data['imu'][i]['time']
-            #print("t = ", t)
-            result['imu'] = self.data['imu'][i]
-            self.counter['imu'] += 1
-            
-            # look for new records of other types
-            for key in self.data:
-                if key != 'imu':
-                    #print(" ", key)
-                    i = self.counter[key]
-                    while i < len(self.data[key]):
-                        d = self.data[key][i]
-                        if d['time'] <= t:
-                            #print("  ", d['time'])
-                            result[key] = d
-                            self.counter[key] += 1
-                            i = self.counter[key]
-                            if d['time'] == t:
-                                break
-                        else:
-                            break
+        if self.position < len(self.event_index):
+            key = self.event_keys[self.event_channel[self.position]]
+            i = int(self.event_index[self.position])
+            result[key] = self.data[key][i]
+            self.counter[key] += 1
+            self.position += 1
         return result
-            
+
+    # vectorized replay: yield FlightData blocks of (up to) n master
+    # records, each other channel holds its latest record at or before
+    # each master record (same rules as next()) plus two extra columns:
+    # 'index' (the record index, -1 with no record yet, the other fields
+    # are then copied from record 0) and 'new' (True where next() would
+    # return that record.)  Replay starts at (and advances) the same
+    # position as next().
+    def blocks(self, n):
+        if self.master is None:
+            raise ValueError("blocks() needs a master channel")
+        if self.columns is None:
+            self.columns = from_records(self.data)
+        columns = self.columns
+        while self.counter[self.master] < self.size():
+            start = self.counter[self.master]
+            end = min(start + n, self.size())
+            block = FlightData()
+            block[self.master] = columns[self.master].take(slice(start, end))
+            for key in self.schedule:
+                count = self.schedule[key][start:end]
+                if start > 0:
+                    before = self.schedule[key][start-1]
+                else:
+                    before = 0
+                prev = np.concatenate(([before], count[:-1]))
+                index = count - 1
+                if len(columns[key]):
+                    channel = columns[key].take(np.maximum(index, 0))
+                else:
+                    channel = FlightChannel()
+                channel['index'] = index
+                channel['new'] = count > prev
+                block[key] = channel
+                self.counter[key] = int(count[-1])
+            self.counter[self.master] = end
+            yield block
+
+def channel_times(channel):
+    if isinstance(channel, FlightChannel):
+        if 'time' not in channel:
+            return np.zeros(0)
+        return np.asarray(channel['time'], dtype=float)
+    else:
+        return np.array([ record['time'] for record in channel ], dtype=float)
+
+# time order of all the records of all the channels (ties in channel
+# order, then record order), as arrays of channel number, record index
+# and time
+def merge_order(data):
+    times = []
+    channel = []
+    index = []
+    for i, key in enumerate(data):
+        time = channel_times(data[key])
+        times.append(time)
+        channel.append(np.full(len(time), i))
+        index.append(np.arange(len(time)))
+    if not len(times):
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+    times = np.concatenate(times)
+    order = np.argsort(times, kind='stable')
+    return np.concatenate(channel)[order], np.concatenate(index)[order], \
+        times[order]
+
+# number of records consumed after each master record by the record at a
+# time merge (see IterateGroup)
+def merge_schedule(master_time, time):
+    n_lt = np.searchsorted(time, master_time, side='left')
+    n_le = np.searchsorted(time, master_time, side='right')
+    if len(master_time) and np.all(master_time[1:] >= master_time[:-1]) \
+       and np.all(time[1:] >= time[:-1]):
+        # a run of equal master times consumes one more record stamped
+        # exactly at that time per master record
+        start = np.ones(len(master_time), dtype=bool)
+        start[1:] = master_time[1:] != master_time[:-1]
+        idx = np.arange(len(master_time))
+        run = idx - np.maximum.accumulate(np.where(start, idx, 0))
+        return np.minimum(n_lt + run + 1, n_le)
+    # out of order times, walk the records one by one
+    schedule = np.zeros(len(master_time), dtype=int)
+    count = 0
+    for i, t in enumerate(master_time):
+        while count < len(time):
+            if time[count] <= t:
+                count += 1
+                if time[count-1] == t:
+                    break
+            else:
+                break
+        schedule[i] = count
+    return schedule
@@ -2,6 +2,7 @@ import h5py
 import os
 import pandas as pd
 
+from .formats import ardupilot_bin
 from .formats import ardupilot_log
 from .formats import aura_csv
 from .formats import aura_hdf5
@@ -11,8 +12,52 @@ from .formats import px4_sdlog2
 from .formats import px4_csv
 from .formats import umn1_mat
 from .formats import umn3_hdf5
+from .flight_cache import FlightCache
+from .flight_data import FlightChannel, from_records
+from . import flight_stream
 
-def load(path):
+# columnar=True returns a FlightData object (each channel a set of numpy
+# arrays keyed by field) instead of the legacy dict of lists of dicts.
+#
+# channels (list of names) and fields (dict of channel name -> list of
+# field names) select what to load, they are passed down to the format
+# loaders so unused datasets, files and topics are never read.
+#
+# cache=True (or a FlightCache instance) keeps the converted flight in an
+# on disk cache, later loads of the same unchanged source reuse it.
+#
+# workers lets the columnar aura loaders read channel files concurrently
+# and the text log loaders (aura csv, ardupilot, px4 sdlog2) parse large
+# files in pieces on a process pool (None = sequential, <= 0 = one per
+# cpu.)
+def load(path, columnar=False, channels=None, fields=None, cache=None,
+         workers=None):
+    if cache:
+        if not isinstance(cache, FlightCache):
+            cache = FlightCache()
+        hit = cache.get(path, channels, fields, columnar)
+        if hit is not None:
+            (flight_data, flight_format) = hit
+            print("Loaded", flight_format, "flight from cache.")
+            if not columnar:
+                flight_data = flight_data.as_records()
+            return flight_data, flight_format
+
+    flight_data, flight_format = load_format(path, columnar, channels, fields,
+                                             workers)
+
+    if cache and flight_format is not None:
+        stored = cache.put(path, flight_data, flight_format, channels,
+                           fields, columnar)
+        if stored and not columnar:
+            # the same records a later cache hit returns (columns of the
+            # loader's records, missing values nan)
+            flight_data = from_records(flight_data).as_records()
+    return flight_data, flight_format
+
+# determine the data log format and call the corresponding loader
+def load_format(path, columnar=False, channels=None, fields=None,
+                workers=None):
     flight_data = {}
     flight_format = None
 
@@ -21,8 +66,6 @@ def load(path):
     aura_csv_path = os.path.join(path, "imu-0.csv")
     ulog_path = path + "_sensor_combined_0.csv"
 
-    # determine the data log format and call the corresponding loader code
-
     if ext == ".h5":
         # quick peek
         data = h5py.File(path, "r")
@@ -30,66 +73,142 @@ def load(path):
             md = data["/metadata"]
             if md.attrs.get("format", "") == "AuraUAS":
                 print("Detected AuraUAS hdf5 format.")
-                flight_data = aura_hdf5.load(path)
+                flight_data = aura_hdf5.load(path, columnar=columnar,
+                                             channels=channels, fields=fields,
+                                             workers=workers)
                 flight_format = "aura_hdf5"
         else:
             print("Detected UMN3 (hdf5) format.")
-            flight_data = umn3_hdf5.load(path)
+            flight_data = umn3_hdf5.load(path, columnar=columnar,
+                                         channels=channels, fields=fields)
             flight_format = "umn3"
     elif os.path.exists(aura_hdf5_path):
         # aura hdf5 format
         print("Detected AuraUAS hdf5 format.")
-        flight_data = aura_hdf5.load(aura_hdf5_path)
+        flight_data = aura_hdf5.load(aura_hdf5_path, columnar=columnar,
+                                     channels=channels, fields=fields,
+                                     workers=workers)
         flight_format = "aura_hdf5"
     elif os.path.exists(aura_csv_path):
         # aura csv format
         print("Detected aura csv format.")
-        flight_data = aura_csv.load(path)
+        flight_data = aura_csv.load(path, columnar=columnar,
+                                    channels=channels, fields=fields,
+                                    workers=workers)
         flight_format = "aura_csv"
     elif ext == ".mat":
         # umn1
         print("Detected umn1 format.")
         print("Notice: assuming umn1 .mat format")
-        flight_data = umn1_mat.load(path)
+        flight_data = umn1_mat.load(path, channels=channels, fields=fields)
         flight_format = "umn1"
     elif ext == ".ulg":
         # px4 binary ulog
-        flight_data = px4_ulog.load(path)
+        flight_data = px4_ulog.load(path, columnar=columnar,
+                                    channels=channels, fields=fields)
         flight_format = "px4_ulog"
     elif os.path.exists(ulog_path):
         # px4_ulog (csv export)
         print("Detected px4 ulog (csv family of files) format.")
         print("Support needs code updates")
         quit()
-        flight_data = px4_csv.load(path)
+        flight_data = px4_csv.load(path, channels=channels, fields=fields)
         flight_format = "px4_csv"
     elif ext == ".px4_csv":
         # px4 sdlog2
         print("Detected px4 ulog (single csv file) format.")
         print("Support needs code updates")
         quit()
-        flight_data = px4_sdlog2.load(path)
+        flight_data = px4_sdlog2.load(path, columnar=columnar,
+                                      channels=channels, fields=fields,
+                                      workers=workers)
         flight_format = "px4_sdlog2"
     elif ext == ".log":
         # ardupilot .log (text, reminds me of nmea style format)
         print("Detected ardupilot log format.")
-        flight_data = ardupilot_log.load(path)
+        flight_data = ardupilot_log.load(path, columnar=columnar,
+                                         channels=channels, fields=fields,
+                                         workers=workers)
         flight_format = "ardupilot_log"
+    elif ext == ".bin":
+        # ardupilot DataFlash binary log
+        print("Detected ardupilot DataFlash (bin) format.")
+        flight_data = ardupilot_bin.load(path, columnar=columnar,
+                                         channels=channels, fields=fields)
+        flight_format = "ardupilot_bin"
     elif ext == ".pkl":
         # cirrus in-house pkl log format
         print("Detected cirrus pkl format.")
-        flight_data = cirrus_pkl.load(path)
+        flight_data = cirrus_pkl.load(path, channels=channels, fields=fields)
         flight_format = "cirrus_pkl"
     else:
         print("Unable to determine data log format (or path not valid):", path)
 
+    if columnar:
+        flight_data = from_records(flight_data)
     return flight_data, flight_format
 
+# iterate over a flight in time order as FlightData chunks covering
+# chunk_seconds each, so logs larger than memory can be processed
+# incrementally.  The aura csv/hdf5 and ardupilot log readers read the
+# source block_rows records at a time and px4 ulog files are decoded a
+# chunk of the file at a time, other formats are loaded whole and then
+# split up.
+def stream(path, chunk_seconds=60.0, channels=None, fields=None,
+           block_rows=50000):
+    (root, ext) = os.path.splitext(path)
+    aura_hdf5_path = os.path.join(path, "flight.h5")
+    aura_csv_path = os.path.join(path, "imu-0.csv")
+
+    if ext == ".h5" and is_aura_hdf5(path):
+        print("Detected AuraUAS hdf5 format.")
+        sources = aura_hdf5.stream(path, channels, fields, block_rows)
+    elif os.path.exists(aura_hdf5_path):
+        print("Detected AuraUAS hdf5 format.")
+        sources = aura_hdf5.stream(aura_hdf5_path, channels, fields,
+                                   block_rows)
+    elif os.path.exists(aura_csv_path):
+        print("Detected aura csv format.")
+        sources = aura_csv.stream(path, channels, fields, block_rows)
+    elif ext == ".log":
+        print("Detected ardupilot log format.")
+        sources = ardupilot_log.stream(path, channels, fields, block_rows)
+    elif ext == ".ulg":
+        sources = px4_ulog.stream(path, channels, fields)
+    else:
+        flight_data, flight_format = load_format(path, True, channels, fields)
+        sources = flight_stream.loaded(flight_data, block_rows)
+    return flight_stream.windows(sources, chunk_seconds)
+
+# per channel angle units of a format that differ from the
+# flight_interp.angle_fields defaults, for InterpolationGroup's
+# channel_angles
+def channel_angles(flight_format):
+    if flight_format == "px4_ulog":
+        return px4_ulog.channel_angles
+    return {}
+
+def is_aura_hdf5(path):
+    with h5py.File(path, "r") as data:
+        if "metadata" in data:
+            md = data["/metadata"]
+            return md.attrs.get("format", "") == "AuraUAS"
+    return False
+
 def as_pandas(flight_data):
     result = {}
     # convert to pandas DataFrame's
     for key in flight_data:
-        result[key] = pd.DataFrame(flight_data[key])
+        if isinstance(flight_data[key], FlightChannel):
+            columns = {}
+            for field, col in flight_data[key].columns.items():
+                if col.ndim > 1:
+                    columns[field] = list(col)
+                else:
+                    columns[field] = col
+            result[key] = pd.DataFrame(columns)
+        else:
+            result[key] = pd.DataFrame(flight_data[key])
         result[key].set_index("time", inplace=True, drop=False)
     return result
 
@@ -0,0 +1,130 @@
+# replay a loaded flight in (scaled) wall clock time with asyncio, to
+# feed live ground station / hardware in the loop components or stress
+# test a telemetry pipeline with recorded flights.
+#
+#   replay = FlightReplay(data, speed=10.0)
+#   async for (t, records) in replay:
+#       ...
+#
+# Each step is an IterateGroup step (the next master record, imu by
+# default, plus the other channels' new records, or a single record in
+# event mode with master=None) and is emitted when its log time comes up: log time is
+# mapped to the event loop's monotonic clock, scaled by speed (None =
+# as fast as the consumer takes them.)  Steps pass through a bounded
+# queue, so a slow consumer holds the replay back; if the replay falls
+# more than max_lag (wall) seconds behind schedule the clock is re-based
+# instead of bursting to catch up.  pause(), resume() and seek(t) can be
+# called from any task while the replay runs.  Leaving the async for
+# loop early (break, an exception) cancels the replay task.
+
+import asyncio
+
+from .flight_interp import IterateGroup
+
+class FlightReplay():
+    def __init__(self, data, speed=1.0, master='imu', queue_size=100,
+                 max_lag=0.5, spin=0.001):
+        self.group = IterateGroup(data, master=master)
+        self.speed = speed
+        self.queue_size = queue_size
+        self.max_lag = max_lag
+        self.spin = spin            # busy wait this long for low jitter
+        self.queue = None
+        self.task = None
+        self.running = None
+        self.base = None            # (log time, loop time) of the clock
+        self.seek_time = None
+        self.generation = 0         # bumped by seek(), older steps are dropped
+
+    def __aiter__(self):
+        return self.steps()
+
+    # the steps as an async generator, closing it (which the event loop
+    # does when the consumer stops early) stops the producer
+    async def steps(self):
+        if self.task is None:
+            self.start()
+        try:
+            while True:
+                item = await self.queue.get()
+                if item is None:
+                    return
+                (generation, t, records) = item
+                if generation == self.generation:
+                    yield t, records
+        finally:
+            self.stop()
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.running = asyncio.Event()
+        self.running.set()
+        self.task = asyncio.ensure_future(self.produce())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def pause(self):
+        if self.running is not None:
+            self.running.clear()
+
+    def resume(self):
+        self.base = None
+        if self.running is not None:
+            self.running.set()
+
+    # jump to log time t, steps already queued are dropped
+    def seek(self, t):
+        self.seek_time = t
+        self.generation += 1
+        if self.queue is not None:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+
+    async def produce(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                if not self.running.is_set():
+                    await self.running.wait()
+                if self.seek_time is not None:
+                    self.group.seek(self.seek_time)
+                    self.seek_time = None
+                    self.base = None
+                t = self.group.next_time()
+                if t is None:
+                    break
+                if self.speed:
+                    if self.base is None:
+                        self.base = (t, loop.time())
+                    target = self.base[1] + (t - self.base[0]) / self.speed
+                    if not await self.wait_until(loop, target):
+                        continue
+                    if loop.time() - target > self.max_lag:
+                        self.base = (t, loop.time())
+                generation = self.generation
+                records = self.group.next()
+                await self.queue.put( (generation, t, records) )
+        except asyncio.CancelledError:
+            # stopped, end the consumer's loop without blocking on a full
+            # queue
+            if self.queue.full():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            raise
+        await self.queue.put(None)
+
+    # sleep until the loop clock reaches target, returns False when
+    # interrupted by a pause or seek
+    async def wait_until(self, loop, target):
+        while True:
+            if self.seek_time is not None or not self.running.is_set():
+                return False
+            delay = target - loop.time()
+            if delay <= 0:
+                return True
+            if delay > self.spin:
+                await asyncio.sleep(min(delay - self.spin, 0.1))
+            else:
+                await asyncio.sleep(0)
@@ -0,0 +1,115 @@
+# stream a flight in time ordered chunks while keeping memory bounded.
+#
+# A stream source is a dict of channel name -> iterator of (block,
+# horizon) pairs, where block is a FlightChannel of consecutive records
+# (in time order) and horizon is the latest time the source has reached
+# (for one file per channel formats simply the last time in the block,
+# for single pass logs the latest time seen on any channel.)  windows()
+# merges the sources into FlightData chunks that each cover chunk_seconds
+# of the flight.
+
+from collections import deque
+import math
+
+from .flight_data import FlightChannel, FlightData, concat
+
+def windows(sources, chunk_seconds):
+    buffers = {}
+    horizon = {}
+    done = {}
+    for name in sources:
+        buffers[name] = []
+        horizon[name] = -math.inf
+        done[name] = False
+
+    def pull(name):
+        try:
+            (block, h) = next(sources[name])
+        except StopIteration:
+            done[name] = True
+            return
+        if len(block):
+            buffers[name].append(block)
+        horizon[name] = max(horizon[name], h)
+
+    # earliest buffered time (reading ahead as needed), None when all
+    # the sources are exhausted
+    def first_time():
+        t = None
+        for name in sources:
+            while not len(buffers[name]) and not done[name]:
+                pull(name)
+            if len(buffers[name]):
+                t0 = buffers[name][0]["time"][0]
+                if t is None or t0 < t:
+                    t = t0
+        return t
+
+    start = first_time()
+    while start is not None:
+        end = start + chunk_seconds
+        chunk = FlightData()
+        for name in sources:
+            while not done[name] and horizon[name] < end:
+                pull(name)
+            channel = concat(buffers[name])
+            if len(channel):
+                i = int(channel["time"].searchsorted(end, side="left"))
+                chunk[name] = channel.take(slice(0, i))
+                if i < len(channel):
+                    buffers[name] = [ channel.take(slice(i, None)) ]
+                else:
+                    buffers[name] = []
+            else:
+                chunk[name] = channel
+        yield chunk
+        # skip ahead over gaps with no records
+        t = first_time()
+        if t is None:
+            break
+        elif t >= end + chunk_seconds:
+            start = end + math.floor((t - end) / chunk_seconds) * chunk_seconds
+        else:
+            start = end
+
+# streaming source for a flight that is already loaded (formats without
+# an incremental reader, memory use is not bounded for those)
+def loaded(flight_data, block_rows=50000):
+    sources = {}
+    for name in flight_data:
+        sources[name] = _slices(flight_data[name], block_rows)
+    return sources
+
+def _slices(channel, block_rows):
+    for i in range(0, len(channel), block_rows):
+        block = channel.take(slice(i, i + block_rows))
+        yield block, block["time"][-1]
+
+# split a single pass source (an iterator of (dict of channel name ->
+# FlightChannel, horizon) pairs) into one iterator per channel for
+# windows()
+class SplitSource():
+    def __init__(self, source, names):
+        self.source = source
+        self.queues = {}
+        for name in names:
+            self.queues[name] = deque()
+
+    def channels(self):
+        return { name: self.iterate(name) for name in self.queues }
+
+    def iterate(self, name):
+        queue = self.queues[name]
+        while True:
+            if len(queue):
+                yield queue.popleft()
+                continue
+            try:
+                (data, h) = next(self.source)
+            except StopIteration:
+                return
+            for key in self.queues:
+                block = data.get(key, None)
+                if block is None:
+                    block = FlightChannel()
+                self.queues[key].append( (block, h) )
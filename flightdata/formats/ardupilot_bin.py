@@ -0,0 +1,183 @@
+# load an ardupilot DataFlash .bin log directly (no conversion to text)
+#
+# A DataFlash log is a stream of messages: a 3 byte header (0xA3 0x95,
+# message type) followed by a fixed size payload per type.  The layout of
+# each type is given by FMT messages (type 128) in the log itself.  The
+# file is memory mapped, the FMT messages are decoded first, then the
+# message boundaries are found with one array search for the header bytes
+# plus a walk along the message lengths (chain.follow(), array passes
+# instead of a python step per message.)  Each message type we use is
+# unpacked in bulk into a numpy structured array (a dtype view over the
+# gathered message bytes) and only the message types needed by the
+# selected channels are decoded.
+#
+# The message fields are taken by position, the same as in the text log
+# (ardupilot_log.messages), and the channels are built by the same code,
+# so both loaders produce the same imu/gps/air/filter/pilot channels (and
+# the per instance imu0/gps0/baro0... channels.)
+
+import numpy as np
+
+from ..flight_data import FlightData, project, want
+from .chain import follow
+from .ardupilot_log import MessageTable, build_channels, channel_messages, \
+    channel_names, drop_missing, messages, new_state
+
+head1 = 0xA3
+head2 = 0x95
+fmt_type = 128
+fmt_length = 89
+
+# DataFlash format character -> (numpy type, scale)
+format_types = {
+    'a': ('(32,)<i2', None),
+    'b': ('i1', None),
+    'B': ('u1', None),
+    'h': ('<i2', None),
+    'H': ('<u2', None),
+    'i': ('<i4', None),
+    'I': ('<u4', None),
+    'f': ('<f4', None),
+    'd': ('<f8', None),
+    'n': ('S4', None),
+    'N': ('S16', None),
+    'Z': ('S64', None),
+    'c': ('<i2', 0.01),
+    'C': ('<u2', 0.01),
+    'e': ('<i4', 0.01),
+    'E': ('<u4', 0.01),
+    'L': ('<i4', 1e-7),
+    'M': ('u1', None),
+    'q': ('<i8', None),
+    'Q': ('<u8', None),
+}
+
+fmt_dtype = np.dtype([ ('type', 'u1'), ('length', 'u1'), ('name', 'S4'),
+                       ('format', 'S16'), ('labels', 'S64') ])
+
+class MessageFormat():
+    def __init__(self, type, length, name, format, labels):
+        self.type = type
+        self.length = length
+        self.name = name
+        self.format = format
+        self.labels = labels
+        names = []
+        for i, label in enumerate(labels):
+            if label == "" or label in names:
+                label = "f%d" % i
+            names.append(label)
+        self.dtype = np.dtype([ (names[i], format_types[c][0])
+                                for i, c in enumerate(format) ])
+        self.scale = [ format_types[c][1] for c in format ]
+
+# channels (list of names) and fields (dict of channel name -> list of
+# field names) select what to load, message types only needed by the
+# channels not selected are never decoded
+def load(filename, columnar=False, channels=None, fields=None):
+    buf = np.memmap(filename, dtype=np.uint8, mode='r')
+    formats = read_formats(buf)
+    (offsets, types) = message_index(buf, formats)
+    by_name = {}
+    for f in formats.values():
+        by_name[f.name] = f
+
+    tables = {}
+    for key in channel_names:
+        if not want(channels, key):
+            continue
+        for name in channel_messages[key]:
+            if name in tables:
+                continue
+            tables[name] = read_table(buf, by_name.get(name), offsets, types,
+                                      messages[name])
+    result = FlightData(build_channels(tables, channels, new_state()))
+    result = drop_missing(result)
+    result = project(result, channels, fields)
+    if columnar:
+        return result
+    else:
+        return result.as_records()
+
+# offsets of the header bytes (a3 95) in the file
+def find_headers(buf, block=1 << 24):
+    found = []
+    for start in range(0, max(len(buf) - 1, 0), block):
+        chunk = buf[start:start + block + 1]
+        hits = np.flatnonzero((chunk[:-1] == head1) & (chunk[1:] == head2))
+        found.append(hits + start)
+    if not len(found):
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(found).astype(np.int64)
+
+# rows of the messages at the given offsets as a structured array
+def unpack(buf, offsets, length, dtype):
+    count = max(len(buf) - length + 1, 0)
+    if not len(offsets) or not count:
+        return np.zeros(0, dtype=dtype)
+    # row k of this view is the length bytes starting at offset k
+    rows = np.lib.stride_tricks.as_strided(buf, shape=(count, length),
+                                           strides=(1, 1), writeable=False)
+    return np.ascontiguousarray(rows[offsets + 3]).view(dtype).reshape(-1)
+
+# message type -> MessageFormat, from all the FMT messages in the log
+def read_formats(buf):
+    headers = find_headers(buf)
+    headers = headers[headers + fmt_length <= len(buf)]
+    headers = headers[buf[headers + 2] == fmt_type]
+    formats = {}
+    for row in unpack(buf, headers, fmt_length - 3, fmt_dtype):
+        try:
+            name = row['name'].decode('ascii')
+            format = row['format'].decode('ascii')
+            labels = row['labels'].decode('ascii').split(',')
+            f = MessageFormat(int(row['type']), int(row['length']), name,
+                              format, labels)
+        except (UnicodeDecodeError, KeyError, TypeError, ValueError):
+            # a false header match inside some other message
+            continue
+        if f.dtype.itemsize != f.length - 3 or f.type in formats:
+            continue
+        formats[f.type] = f
+    return formats
+
+# offsets and types of all the messages, in log order.  Starting from
+# the first header each message is followed by the next one (the header
+# matches inside payloads are skipped); after an unknown type or
+# corrupt data the walk resyncs at the next header.
+def message_index(buf, formats):
+    headers = find_headers(buf)
+    lengths = np.zeros(256, dtype=np.int64)
+    for f in formats.values():
+        lengths[f.type] = f.length
+    lengths[fmt_type] = fmt_length
+    types = buf[headers + 2]
+    ends = headers + lengths[types]
+    nxt = np.searchsorted(headers, ends, side='left')
+    unknown = lengths[types] == 0
+    nxt[unknown] = np.arange(len(headers))[unknown] + 1
+    complete = (ends <= len(buf)) & ~unknown
+    walk = np.flatnonzero(follow(nxt, 0))
+    walk = walk[complete[walk]]
+    return headers[walk], types[walk]
+
+# decode one message type into a MessageTable with the fields listed in
+# fields ((name, text log column) pairs, column 0 is the message name so
+# column n is message field n - 1)
+def read_table(buf, f, offsets, types, fields):
+    names = [ name for (name, col) in fields ]
+    if f is None:
+        return MessageTable(names, np.zeros(0, dtype=np.int64),
+                            np.zeros((0, len(names))))
+    at = offsets[types == f.type]
+    rows = unpack(buf, at, f.length - 3, f.dtype)
+    values = np.full((len(rows), len(names)), np.nan)
+    for j, (name, col) in enumerate(fields):
+        i = col - 1
+        if i >= len(f.format) or f.dtype[i].kind not in "biuf":
+            continue
+        column = rows[f.dtype.names[i]].astype(float)
+        if f.scale[i] is not None:
+            column *= f.scale[i]
+        values[:, j] = column
+    return MessageTable(names, at, values)
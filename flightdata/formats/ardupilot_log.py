@@ -1,18 +1,39 @@
 # load a ardupilot log file
+#
+# The log is scanned once.  Each line is dispatched on its message type
+# through the messages table, and the fields we use are appended to a
+# growable float buffer for that message type (no per record dicts.)
+# The imu/gps/air/filter/pilot channels are then built from the message
+# tables with array operations: a record that merges fields from several
+# message types (e.g. filter = AHR2 + the latest NKF1 and NKF2) picks up
+# the latest row of the other types logged before it with searchsorted
+# on the log line numbers.
 
-import csv
-from copy import copy
+from array import array
 import math
+from operator import itemgetter
 import numpy as np
-import re
+
+from ..flight_data import FlightChannel, FlightData, concat, project, want
+from ..flight_stream import SplitSource
+from .parallel import line_ranges, read_range, run_tasks
 
 d2r = math.pi / 180.0
 r2d = 180.0/ math.pi
 mps2kt = 1.94384
 m2ft = 1.0 / 0.3048
 
-select_imu = "IMU2"
-select_mag = "MAG2"
+# message types of each sensor instance (the logs name the first
+# instance IMU, the second IMU2, ...)
+imu_instances = [ "IMU", "IMU2", "IMU3" ]
+mag_instances = [ "MAG", "MAG2", "MAG3" ]
+gps_instances = [ "GPS", "GPS2" ]
+baro_instances = [ "BARO", "BAR2", "BAR3" ]
+
+# the instances the imu and gps channels are built from
+select_imu = imu_instances[1]
+select_mag = mag_instances[1]
+select_gps = gps_instances[0]
 
 # convert value (string) to float, check for "" and return 0.0
 def my_float(value):
@@ -20,143 +41,386 @@ def my_float(value):
         return float(value)
     else:
         return 0.0
-    
-def load(csv_file):
-    result = {}
-    result["imu"] = []
-    result["gps"] = []
-    result["air"] = []
-    result["filter"] = []
-    result["pilot"] = []
-    #result["act"] = []
-    #result["ap"] = []
-
-    imu = {}
-    nav = {}
-    air = {}
-    
-    last_gps_time = -1.0
+
+# every sensor instance is also available as its own channel (imu0,
+# imu1, imu2, gps0, gps1, baro0, baro1, baro2)
+instance_channels = {
+    "imu": len(imu_instances),
+    "gps": len(gps_instances),
+    "baro": len(baro_instances),
+}
+
+channel_names = [ "imu", "gps", "air", "filter", "pilot" ]
+for key in instance_channels:
+    for i in range(instance_channels[key]):
+        channel_names.append("%s%d" % (key, i))
+
+# message type -> (field name, row column) of the fields we use
+messages = {
+    "ARSP": [ ("airspeed", 2), ("diff_press", 3) ],
+    "NKF1": [ ("vn", 5), ("ve", 6), ("vd", 7), ("p_bias", 12),
+              ("q_bias", 13), ("r_bias", 14) ],
+    "NKF2": [ ("az_bias", 3) ],
+    "AHR2": [ ("time", 1), ("phi", 2), ("the", 3), ("psi", 4), ("alt", 5),
+              ("lat", 6), ("lon", 7) ],
+    "AETR": [ ("time", 1), ("aileron", 2), ("elevator", 3), ("throttle", 4),
+              ("rudder", 5) ],
+}
+for name in imu_instances:
+    messages[name] = [ ("time", 1), ("p", 2), ("q", 3), ("r", 4), ("ax", 5),
+                       ("ay", 6), ("az", 7), ("temp", 10) ]
+for name in mag_instances:
+    messages[name] = [ ("hx", 2), ("hy", 3), ("hz", 4) ]
+for name in gps_instances:
+    messages[name] = [ ("time", 1), ("sats", 5), ("lat", 7), ("lon", 8),
+                       ("alt", 9), ("speed", 10), ("course", 11), ("vd", 12) ]
+for name in baro_instances:
+    messages[name] = [ ("time", 1), ("alt_press", 2), ("static_press", 3),
+                       ("temp", 4) ]
+
+# channel -> the message types it is built from
+channel_messages = {
+    "imu": [ select_imu, select_mag ],
+    "gps": [ select_gps ],
+    "air": [ "ARSP", "BARO" ],
+    "filter": [ "NKF1", "NKF2", "AHR2" ],
+    "pilot": [ "AETR" ],
+}
+for i in range(len(imu_instances)):
+    channel_messages["imu%d" % i] = [ imu_instances[i], mag_instances[i] ]
+for i in range(len(gps_instances)):
+    channel_messages["gps%d" % i] = [ gps_instances[i] ]
+for i in range(len(baro_instances)):
+    channel_messages["baro%d" % i] = [ baro_instances[i] ]
+
+# message types whose latest row is merged into the records of another
+# type (this state carries over from one block of lines to the next)
+state_messages = imu_instances + [ "ARSP", "NKF1", "NKF2" ]
+
+# growable buffer of the used fields of one message type, rows are
+# stored flat (row major) in a float array along with their line numbers
+# (any increasing position in the log works)
+class MessageBuffer():
+    def __init__(self, fields):
+        self.names = [ name for (name, col) in fields ]
+        cols = [ col for (name, col) in fields ]
+        if len(cols) == 1:
+            col = cols[0]
+            self.get = lambda parts: (parts[col],)
+        else:
+            self.get = itemgetter(*cols)
+        self.clear()
+
+    def clear(self):
+        self.values = array('d')
+        self.lines = array('q')
+
+    def add(self, line, parts):
+        self.values.extend(map(float, self.get(parts)))
+        self.lines.append(line)
+
+    # the buffered rows as a MessageTable, the buffer starts over empty
+    def table(self):
+        values = np.frombuffer(self.values, dtype=float).reshape(-1, len(self.names))
+        lines = np.frombuffer(self.lines, dtype=np.int64)
+        table = MessageTable(self.names, lines, values)
+        self.clear()
+        return table
+
+class MessageTable():
+    def __init__(self, names, lines, values):
+        self.names = names
+        self.lines = lines
+        self.values = values
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __getitem__(self, name):
+        return self.values[:, self.names.index(name)]
+
+    # the last row, stamped before any line of the next block
+    def last(self):
+        return MessageTable(self.names, np.array([-1], dtype=np.int64),
+                            self.values[-1:])
+
+    def prepend(self, other):
+        if other is None:
+            return self
+        return MessageTable(self.names,
+                            np.concatenate((other.lines, self.lines)),
+                            np.concatenate((other.values, self.values)))
+
+    # the fields of the latest row logged before each line (nan where
+    # there is none yet), dict of field name -> array
+    def latest(self, lines):
+        index = np.searchsorted(self.lines, lines, side='left') - 1
+        if len(self):
+            rows = self.values[np.maximum(index, 0)]
+        else:
+            rows = np.zeros((len(lines), len(self.names)))
+        rows = np.where((index < 0)[:, None], np.nan, rows)
+        return { name: rows[:, i] for i, name in enumerate(self.names) }
+
+# join tables of the same message type end to end
+def concat_tables(tables):
+    return MessageTable(tables[0].names,
+                        np.concatenate([ t.lines for t in tables ]),
+                        np.concatenate([ t.values for t in tables ]))
+
+# rows of message types only needed by unselected channels are skipped.
+# With workers the log is split into line aligned byte ranges that are
+# parsed on a process pool (<= 0 = one process per cpu.)
+def load(csv_file, columnar=False, channels=None, fields=None, workers=None):
+    if workers is not None and workers != 1:
+        result = FlightData(parse_parallel(csv_file, channels, workers))
+    else:
+        pieces = {}
+        for key in channel_names:
+            if want(channels, key):
+                pieces[key] = []
+        for (block, horizon) in parse(csv_file, channels):
+            for key in block:
+                pieces[key].append(block[key])
+        result = FlightData()
+        for key in pieces:
+            result[key] = concat(pieces[key])
+    result = drop_missing(result)
+    result = project(result, channels, fields)
+    if columnar:
+        return result
+    else:
+        return result.as_records()
+
+# streaming source for flight_stream.windows(): the log is read in a
+# single pass, block_rows lines at a time
+def stream(csv_file, channels=None, fields=None, block_rows=50000):
+    names = [ key for key in channel_names if want(channels, key) ]
+    return SplitSource(stream_blocks(csv_file, channels, fields, block_rows),
+                       names).channels()
+
+def stream_blocks(csv_file, channels, fields, block_rows):
+    for (block, horizon) in parse(csv_file, channels, block_rows):
+        yield project(block, channels, fields), horizon
+
+# parse the log, yielding (dict of channel name -> FlightChannel, latest
+# time seen) every block_rows lines (or once at the end when block_rows
+# is None)
+def parse(csv_file, channels=None, block_rows=None):
+    buffers = new_buffers(channels)
+    state = new_state()
+
+    lines = 0
     with open(csv_file, "r") as f:
-        reader = csv.reader(f)
-        for row in reader:
-            #print(row)
-            if row[0] == select_imu:
-                imu["time"] = float(row[1]) / 1e6
-                imu["p"] = float(row[2])
-                imu["q"] = float(row[3])
-                imu["r"] = float(row[4])
-                imu["ax"] = float(row[5])
-                imu["ay"] = float(row[6])
-                imu["az"] = float(row[7])
-                imu["temp"] = float(row[10])
-            if row[0] == select_mag:
-                imu["hx"] = float(row[2])
-                imu["hy"] = float(row[3])
-                imu["hz"] = float(row[4])
-                # hf = np.array( [hx, hy, hz] )
-                # norm = np.linalg.norm(hf)
-                # hf /= norm
-                # imu["hx"] = hf[0]
-                # imu["hy"] = hf[1]
-                # imu["hz"] = hf[2]
-                #print imu["hx, imu["hy, imu["hz
-                result["imu"].append( copy(imu) )
-            if row[0] == "GPS":
-                gps = {}
-                gps["time"] = float(row[1]) / 1e6
-                gps["unix_sec"] = gps["time"]
-                gps["lat"] = float(row[7])
-                gps["lon"] = float(row[8])
-                gps["alt"] = float(row[9])
-                speed_mps = float(row[10])
-                course_deg = float(row[11])
-                angle_rad = (90 - course_deg) * d2r
-                gps["vn"] = math.sin(angle_rad) * speed_mps
-                gps["ve"] = math.cos(angle_rad) * speed_mps
-                gps["vd"] = float(row[12])
-                gps["sats"] = int(row[5])
-                if gps["sats"] >= 5 and gps["unix_sec"] > last_gps_time:
-                    result["gps"].append(gps)
-                last_gps_time = gps["unix_sec"]
-
-            if row[0] == "ARSP":
-                air["airspeed"] = float(row[2]) * mps2kt
-                air["diff_press"] = float(row[3])
-            if row[0] == "BARO":
-                air["time"] = float(row[1]) / 1e6
-                air["static_press"] = float(row[3])
-                air["temp"] = float(row[4])
-                air["alt_press"] = float(row[2])
-                air["alt_true"] = 0.0
-                result["air"].append( copy(air) )
-
-            if row[0] == "NKF1":
-                nav["vn"] = float(row[5])
-                nav["ve"] = float(row[6])
-                nav["vd"] = float(row[7])
-                nav["p_bias"] = float(row[12])*d2r
-                nav["q_bias"] = float(row[13])*d2r
-                nav["r_bias"] = float(row[14])*d2r
-            if row[0] == "NKF2":
-                nav["az_bias"] = float(row[3])
-            if row[0] == "AHR2":
-                nav["time"] = float(row[1]) / 1e6
-                nav["lat"] = float(row[6])*d2r
-                nav["lon"] = float(row[7])*d2r
-                nav["alt"] = float(row[5])
-                nav["phi"] = float(row[2])*d2r
-                nav["the"] = float(row[3])*d2r
-                psi = float(row[4])
-                if psi > 180.0:
-                    psi = psi - 360.0
-                if psi < -180.0:
-                    psi = psi + 360.0
-                nav["psi"] = psi*d2r
-                nav["ax_bias"] = 0
-                nav["ay_bias"] = 0
-                result["filter"].append(copy(nav))
-
-            if row[0] == "AETR":
-                pilot = {
-                    "time": float(row[1]) / 1e6,
-                    "auto_manual": 0,
-                    "throttle_safety": 0,
-                    "aileron": float(row[2]) / 100.0,
-                    "elevator": float(row[3]) / 100.0,
-                    "throttle": float(row[4]) / 100.0,
-                    "rudder": float(row[5]) / 100.0,
-                    "flaps": 0,
-                    "aux1": 0,
-                    "geare": 0
-                }
-                result["pilot"].append(pilot)
-                
-            if row[0] == "AUTO":
-                ap = Record()
-                ap.time = imu.time
-                ap.hdg = my_float(row["ATSP_YawSP"]) * r2d
-                ap.roll = my_float(row["ATSP_RollSP"]) * r2d
-                ap.alt = my_float(row["GPSP_Alt"]) * m2ft
-                ap.pitch = my_float(row["ATSP_PitchSP"]) * r2d
-                ap.speed = my_float(row["TECS_AsSP"]) * mps2kt
-                result["ap"].append(ap)
-                
-            if row[0] == "EFF":
-                act = Record()
-                ch0 = (float(row["OUT0_Out0"]) - 1500) / 500
-                ch1 = (float(row["OUT0_Out1"]) - 1500) / 500 
-                ch2 = (float(row["OUT0_Out2"]) - 1000) / 1000
-                ch3 = (float(row["OUT0_Out3"]) - 1500) / 500
-                #print ch0, ch1, ch2, ch3
-                act.time = imu.time
-                act.aileron = (ch0 - ch1)
-                act.elevator = -(ch0 + ch1)
-                act.throttle = ch2
-                act.rudder = ch3
-                act.gear = 0.0
-                act.flaps = 0.0
-                act.aux1 = 0.0
-                act.auto_manual = 0.0
-                result["act"].append(act)
+        for line in f:
+            lines += 1
+            buffer = buffers.get(line[:line.find(",")])
+            if buffer is not None:
+                buffer.add(lines, line.split(","))
+            if block_rows is not None and lines % block_rows == 0:
+                yield build(buffers, channels, state), state["horizon"]
+    yield build(buffers, channels, state), state["horizon"]
+
+# message type -> MessageBuffer for the message types the selected
+# channels are built from
+def new_buffers(channels):
+    buffers = {}
+    for key in channel_names:
+        if want(channels, key):
+            for name in channel_messages[key]:
+                buffers[name] = MessageBuffer(messages[name])
+    return buffers
+
+# parse the byte ranges of the log on a process pool, the message tables
+# of each range are joined in order before the channels are built, so
+# the merges across message types and the gps time filter see the whole
+# log.  Rows are numbered (range number << 40) + line within the range.
+def parse_parallel(csv_file, channels, workers):
+    ranges = line_ranges(csv_file)
+    tasks = []
+    for (i, (start, end)) in enumerate(ranges):
+        tasks.append( (parse_range, (csv_file, start, end, channels, i << 40)) )
+    parts = run_tasks(tasks, workers, "process")
+    buffers = new_buffers(channels)
+    tables = {}
+    for name in buffers:
+        pieces = [ part[name] for part in parts ]
+        if len(pieces):
+            tables[name] = concat_tables(pieces)
+        else:
+            tables[name] = buffers[name].table()
+    return build_channels(tables, channels, new_state())
+
+def parse_range(csv_file, start, end, channels, first):
+    buffers = new_buffers(channels)
+    text = read_range(csv_file, start, end).decode()
+    for (i, line) in enumerate(text.splitlines(), first):
+        buffer = buffers.get(line[:line.find(",")])
+        if buffer is not None:
+            buffer.add(i, line.split(","))
+    tables = {}
+    for name in buffers:
+        tables[name] = buffers[name].table()
+    return tables
+
+# merge state carried from one block of the log to the next: the latest
+# state message rows, gps time (per gps message type) and horizon
+def new_state():
+    return { "carry": {}, "last_gps_time": {}, "horizon": -math.inf }
+
+# the instance channels of sensors that are not in the log are dropped
+# from a loaded result
+def drop_missing(result):
+    for key in list(result.keys()):
+        if key[:-1] in instance_channels and not len(result[key]):
+            del result[key]
+    return result
+
+# build the channels from the buffered message rows
+def build(buffers, channels, state):
+    tables = {}
+    for name in buffers:
+        tables[name] = buffers[name].table()
+    return build_channels(tables, channels, state)
+
+# build the channels from message tables (message type -> MessageTable,
+# with the fields named in messages), shared with the .bin loader
+def build_channels(tables, channels, state):
+    carry = state["carry"]
+    for name in state_messages:
+        if name in tables:
+            table = tables[name].prepend(carry.get(name))
+            if len(tables[name]):
+                carry[name] = tables[name].last()
+            tables[name] = table
 
+    result = {}
+    for key in channel_names:
+        if not want(channels, key):
+            continue
+        names = channel_messages[key]
+        if key.startswith("imu"):
+            result[key] = imu_channel(tables[names[0]], tables[names[1]])
+        elif key.startswith("gps"):
+            last_time = state["last_gps_time"].get(names[0], -1.0)
+            result[key] = gps_channel(tables[names[0]], last_time)
+        elif key.startswith("baro"):
+            result[key] = baro_channel(tables[names[0]])
+        elif key == "air":
+            result[key] = air_channel(tables["ARSP"], tables["BARO"])
+        elif key == "filter":
+            result[key] = filter_channel(tables["NKF1"], tables["NKF2"],
+                                         tables["AHR2"])
+        elif key == "pilot":
+            result[key] = pilot_channel(tables["AETR"])
+    for name in gps_instances:
+        if name in tables and len(tables[name]):
+            state["last_gps_time"][name] = tables[name]["time"][-1] / 1e6
+    for key in result:
+        if len(result[key]):
+            state["horizon"] = max(state["horizon"],
+                                   np.nanmax(result[key]["time"]))
     return result
+
+# one imu record per mag row, with the latest imu row before it
+def imu_channel(imu, mag):
+    latest = imu.latest(mag.lines)
+    return FlightChannel({
+        "time": latest["time"] / 1e6,
+        "p": latest["p"],
+        "q": latest["q"],
+        "r": latest["r"],
+        "ax": latest["ax"],
+        "ay": latest["ay"],
+        "az": latest["az"],
+        "temp": latest["temp"],
+        "hx": mag["hx"],
+        "hy": mag["hy"],
+        "hz": mag["hz"]
+    })
+
+# last_time is the time of the gps row before this block
+def gps_channel(gps, last_time=-1.0):
+    time = gps["time"] / 1e6
+    sats = gps["sats"].astype(int)
+    speed_mps = gps["speed"]
+    angle_rad = (90 - gps["course"]) * d2r
+    # keep rows with enough satellites whose time is past the previous
+    # row (kept or not)
+    prev = np.concatenate(([last_time], time[:-1]))
+    keep = (sats >= 5) & (time > prev)
+    channel = FlightChannel({
+        "time": time,
+        "unix_sec": time,
+        "lat": gps["lat"],
+        "lon": gps["lon"],
+        "alt": gps["alt"],
+        "vn": np.sin(angle_rad) * speed_mps,
+        "ve": np.cos(angle_rad) * speed_mps,
+        "vd": gps["vd"],
+        "sats": sats
+    })
+    return channel.take(keep)
+
+# one air record per baro row, with the latest airspeed row before it
+def air_channel(arsp, baro):
+    latest = arsp.latest(baro.lines)
+    return FlightChannel({
+        "time": baro["time"] / 1e6,
+        "airspeed": latest["airspeed"] * mps2kt,
+        "diff_press": latest["diff_press"],
+        "static_press": baro["static_press"],
+        "temp": baro["temp"],
+        "alt_press": baro["alt_press"],
+        "alt_true": np.zeros(len(baro))
+    })
+
+def baro_channel(baro):
+    return FlightChannel({
+        "time": baro["time"] / 1e6,
+        "static_press": baro["static_press"],
+        "temp": baro["temp"],
+        "alt_press": baro["alt_press"]
+    })
+
+# one filter record per AHR2 row, with the latest NKF1/NKF2 rows before it
+def filter_channel(nkf1, nkf2, ahr2):
+    ekf = nkf1.latest(ahr2.lines)
+    az_bias = nkf2.latest(ahr2.lines)["az_bias"]
+    psi = ahr2["psi"]
+    psi = np.where(psi > 180.0, psi - 360.0, psi)
+    psi = np.where(psi < -180.0, psi + 360.0, psi)
+    n = len(ahr2)
+    return FlightChannel({
+        "time": ahr2["time"] / 1e6,
+        "lat": ahr2["lat"]*d2r,
+        "lon": ahr2["lon"]*d2r,
+        "alt": ahr2["alt"],
+        "vn": ekf["vn"],
+        "ve": ekf["ve"],
+        "vd": ekf["vd"],
+        "phi": ahr2["phi"]*d2r,
+        "the": ahr2["the"]*d2r,
+        "psi": psi*d2r,
+        "p_bias": ekf["p_bias"]*d2r,
+        "q_bias": ekf["q_bias"]*d2r,
+        "r_bias": ekf["r_bias"]*d2r,
+        "ax_bias": np.zeros(n),
+        "ay_bias": np.zeros(n),
+        "az_bias": az_bias
+    })
+
+def pilot_channel(aetr):
+    n = len(aetr)
+    return FlightChannel({
+        "time": aetr["time"] / 1e6,
+        "auto_manual": np.zeros(n, dtype=int),
+        "throttle_safety": np.zeros(n, dtype=int),
+        "aileron": aetr["aileron"] / 100.0,
+        "elevator": aetr["elevator"] / 100.0,
+        "throttle": aetr["throttle"] / 100.0,
+        "rudder": aetr["rudder"] / 100.0,
+        "flaps": np.zeros(n, dtype=int),
+        "aux1": np.zeros(n, dtype=int),
+        "geare": np.zeros(n, dtype=int)
+    })
@@ -3,16 +3,29 @@
 import csv
 import os
 import math
+import numpy as np
+import pandas as pd
 import re
 
  # from . import imucal
+from ..flight_data import FlightChannel, FlightData, project, want
+from .parallel import line_ranges, read_csv_range, run_tasks
 
 d2r = math.pi / 180.0
 
 # empty class we'll fill in with data members
 # class Record: pass (deprecated)
 
-def load(flight_dir):
+# only the csv files of the selected channels are opened.
+# columnar=True parses each file in bulk (pandas C parser) and returns a
+# FlightData object built with array operations.  With workers the
+# columnar loader parses the channel files concurrently on a thread (or
+# process) pool.
+def load(flight_dir, columnar=False, channels=None, fields=None,
+         workers=None, pool='thread'):
+    if columnar:
+        return load_columns(flight_dir, channels, fields, workers, pool)
+
     result = {}
 
     # load imu/gps data files
@@ -30,127 +43,132 @@ def load(flight_dir):
     imu_bias_file = os.path.join(flight_dir, "imubias.csv")
 
     pilot_mapping = 'Aura3'       # APM2 or Aura3
-    result['event'] = []
-    with open(event_file, 'r') as fevent:
-        reader = csv.DictReader(fevent)
-        for row in reader:
-            msg = row['message']
-            if type(msg) == bytes:
-                msg = msg.decode()
-            event = {
-                'time': float(row['timestamp']),
-                'message': msg
-            }
-            if 'Aura3' in event['message']:
-                pilot_mapping = 'Aura3'
-            elif 'APM2' in event['message']:
-                pilot_mapping = 'APM2'
-            result['event'].append( event )
-
-    result['imu'] = []
-    with open(imu_file, 'r') as fimu:
-        reader = csv.DictReader(fimu)
-        for row in reader:
-            imu = {
-                'time': float(row['timestamp']),
-                'p': float(row['p_rad_sec']),
-                'q': float(row['q_rad_sec']),
-                'r': float(row['r_rad_sec']),
-                'ax': float(row['ax_mps_sec']),
-                'ay': float(row['ay_mps_sec']),
-                'az': float(row['az_mps_sec']),
-                'hx': float(row['hx']),
-                'hy': float(row['hy']),
-                'hz': float(row['hz']),
-                'temp': float(row['temp_C'])
-            }
-            result['imu'].append( imu )
-
-    result['gps'] = []
-    last_time = -1.0
-    with open(gps_file, 'r') as fgps:
-        reader = csv.DictReader(fgps)
-        for row in reader:
-            # Note: aurauas logs unix time of the gps record, not tow,
-            # but for the purposes of the insgns algorithm, it's only
-            # important to have a properly incrementing clock, it doesn't
-            # really matter what the zero reference point of time is here.
-            time = float(row['timestamp'])
-            sats = int(row['satellites'])
-            if sats >= 5 and time > last_time:
-                gps = {
-                    'time': time,
-                    'unix_sec': float(row['unix_time_sec']),
-                    'lat': float(row['latitude_deg']),
-                    'lon': float(row['longitude_deg']),
-                    'alt': float(row['altitude_m']),
-                    'vn': float(row['vn_ms']),
-                    've': float(row['ve_ms']),
-                    'vd': float(row['vd_ms']),
-                    'sats': sats
+    if want(channels, 'event') or want(channels, 'pilot'):
+        result['event'] = []
+        with open(event_file, 'r') as fevent:
+            reader = csv.DictReader(fevent)
+            for row in reader:
+                msg = row['message']
+                if type(msg) == bytes:
+                    msg = msg.decode()
+                event = {
+                    'time': float(row['timestamp']),
+                    'message': msg
                 }
-                result['gps'].append(gps)
-            last_time = time
-
-    result['air'] = []
-    with open(air_file, 'r') as fair:
-        reader = csv.DictReader(fair)
-        for row in reader:
-            air = {
-                'time': float(row['timestamp']),
-                'static_press': float(row['pressure_mbar']),
-                'diff_press': 0.0, # not directly available in aura flight log
-                'temp': float(row['temp_C']),
-                'airspeed': float(row['airspeed_smoothed_kt']),
-                'alt_press': float(row['altitude_smoothed_m']),
-                'alt_true': float(row['altitude_true_m']),
-                'wind_dir': float(row['wind_dir_deg']),
-                'wind_speed': float(row['wind_speed_kt']),
-                'pitot_scale': float(row['pitot_scale_factor'])
-            }
-            result['air'].append( air )
+                if 'Aura3' in event['message']:
+                    pilot_mapping = 'Aura3'
+                elif 'APM2' in event['message']:
+                    pilot_mapping = 'APM2'
+                result['event'].append( event )
 
-    # load filter records if they exist (for comparison purposes)
-    result['filter'] = []
-    with open(filter_file, 'r') as ffilter:
-        reader = csv.DictReader(ffilter)
-        for row in reader:
-            lat = float(row['latitude_deg'])
-            lon = float(row['longitude_deg'])
-            psi_deg = float(row['heading_deg'])
-            psi = psi_deg*d2r
-            if psi > math.pi:
-                psi -= 2*math.pi
-            if psi < -math.pi:
-                psi += 2*math.pi
-            psix = math.cos(psi)
-            psiy = math.sin(psi)
-            if abs(lat) > 0.0001 and abs(lon) > 0.0001:
-                nav = {
+    if want(channels, 'imu'):
+        result['imu'] = []
+        with open(imu_file, 'r') as fimu:
+            reader = csv.DictReader(fimu)
+            for row in reader:
+                imu = {
                     'time': float(row['timestamp']),
-                    'lat': lat*d2r,
-                    'lon': lon*d2r,
-                    'alt': float(row['altitude_m']),
-                    'vn': float(row['vn_ms']),
-                    've': float(row['ve_ms']),
-                    'vd': float(row['vd_ms']),
-                    'phi': float(row['roll_deg'])*d2r,
-                    'the': float(row['pitch_deg'])*d2r,
-                    'psi': psi,
-                    'psix': psix,
-                    'psiy': psiy,
-                    'p_bias': float(row['p_bias']),
-                    'q_bias': float(row['q_bias']),
-                    'r_bias': float(row['r_bias']),
-                    'ax_bias': float(row['ax_bias']),
-                    'ay_bias': float(row['ay_bias']),
-                    'az_bias': float(row['az_bias'])
+                    'p': float(row['p_rad_sec']),
+                    'q': float(row['q_rad_sec']),
+                    'r': float(row['r_rad_sec']),
+                    'ax': float(row['ax_mps_sec']),
+                    'ay': float(row['ay_mps_sec']),
+                    'az': float(row['az_mps_sec']),
+                    'hx': float(row['hx']),
+                    'hy': float(row['hy']),
+                    'hz': float(row['hz']),
+                    'temp': float(row['temp_C'])
                 }
-                result['filter'].append(nav)
+                result['imu'].append( imu )
+
+    if want(channels, 'gps'):
+        result['gps'] = []
+        last_time = -1.0
+        with open(gps_file, 'r') as fgps:
+            reader = csv.DictReader(fgps)
+            for row in reader:
+                # Note: aurauas logs unix time of the gps record, not tow,
+                # but for the purposes of the insgns algorithm, it's only
+                # important to have a properly incrementing clock, it doesn't
+                # really matter what the zero reference point of time is here.
+                time = float(row['timestamp'])
+                sats = int(row['satellites'])
+                if sats >= 5 and time > last_time:
+                    gps = {
+                        'time': time,
+                        'unix_sec': float(row['unix_time_sec']),
+                        'lat': float(row['latitude_deg']),
+                        'lon': float(row['longitude_deg']),
+                        'alt': float(row['altitude_m']),
+                        'vn': float(row['vn_ms']),
+                        've': float(row['ve_ms']),
+                        'vd': float(row['vd_ms']),
+                        'sats': sats
+                    }
+                    result['gps'].append(gps)
+                last_time = time
+
+    if want(channels, 'air'):
+        result['air'] = []
+        with open(air_file, 'r') as fair:
+            reader = csv.DictReader(fair)
+            for row in reader:
+                air = {
+                    'time': float(row['timestamp']),
+                    'static_press': float(row['pressure_mbar']),
+                    'diff_press': 0.0, # not directly available in aura flight log
+                    'temp': float(row['temp_C']),
+                    'airspeed': float(row['airspeed_smoothed_kt']),
+                    'alt_press': float(row['altitude_smoothed_m']),
+                    'alt_true': float(row['altitude_true_m']),
+                    'wind_dir': float(row['wind_dir_deg']),
+                    'wind_speed': float(row['wind_speed_kt']),
+                    'pitot_scale': float(row['pitot_scale_factor'])
+                }
+                result['air'].append( air )
+
+    # load filter records if they exist (for comparison purposes)
+    if want(channels, 'filter'):
+        result['filter'] = []
+        with open(filter_file, 'r') as ffilter:
+            reader = csv.DictReader(ffilter)
+            for row in reader:
+                lat = float(row['latitude_deg'])
+                lon = float(row['longitude_deg'])
+                psi_deg = float(row['heading_deg'])
+                psi = psi_deg*d2r
+                if psi > math.pi:
+                    psi -= 2*math.pi
+                if psi < -math.pi:
+                    psi += 2*math.pi
+                psix = math.cos(psi)
+                psiy = math.sin(psi)
+                if abs(lat) > 0.0001 and abs(lon) > 0.0001:
+                    nav = {
+                        'time': float(row['timestamp']),
+                        'lat': lat*d2r,
+                        'lon': lon*d2r,
+                        'alt': float(row['altitude_m']),
+                        'vn': float(row['vn_ms']),
+                        've': float(row['ve_ms']),
+                        'vd': float(row['vd_ms']),
+                        'phi': float(row['roll_deg'])*d2r,
+                        'the': float(row['pitch_deg'])*d2r,
+                        'psi': psi,
+                        'psix': psix,
+                        'psiy': psiy,
+                        'p_bias': float(row['p_bias']),
+                        'q_bias': float(row['q_bias']),
+                        'r_bias': float(row['r_bias']),
+                        'ax_bias': float(row['ax_bias']),
+                        'ay_bias': float(row['ay_bias']),
+                        'az_bias': float(row['az_bias'])
+                    }
+                    result['filter'].append(nav)
 
     # load filter (post process) records if they exist (for comparison
     # purposes)
-    if os.path.exists(filter_post):
+    if want(channels, 'filter_post') and os.path.exists(filter_post):
         result['filter_post'] = []
         with open(filter_post, 'r') as ffilter:
             reader = csv.DictReader(ffilter)
@@ -188,7 +206,7 @@ def load(flight_dir):
                     }
                     result['filter_post'].append(nav)
 
-    if os.path.exists(pilot_file):
+    if want(channels, 'pilot') and os.path.exists(pilot_file):
         print('Pilot input mapping:', pilot_mapping)
         result['pilot'] = []
         with open(pilot_file, 'r') as fpilot:
@@ -222,7 +240,7 @@ def load(flight_dir):
                     }
                 result['pilot'].append(pilot)
 
-    if os.path.exists(act_file):
+    if want(channels, 'act') and os.path.exists(act_file):
         result['act'] = []
         with open(act_file, 'r') as fact:
             reader = csv.DictReader(fact)
@@ -240,7 +258,7 @@ def load(flight_dir):
                 }
                 result['act'].append(act)
 
-    if os.path.exists(ap_file):
+    if want(channels, 'ap') and os.path.exists(ap_file):
         result['ap'] = []
         with open(ap_file, 'r') as fap:
             reader = csv.DictReader(fap)
@@ -263,7 +281,7 @@ def load(flight_dir):
                 }
                 result['ap'].append(ap)
 
-    if os.path.exists(health_file):
+    if want(channels, 'health') and os.path.exists(health_file):
         result['health'] = []
         with open(health_file, 'r') as fhealth:
             reader = csv.DictReader(fhealth)
@@ -313,7 +331,309 @@ def load(flight_dir):
     #     rcal.load(recalibrate)
     #     result['imu'] = rcal.correct(result['imu'])
 
-    return result
+    return project(result, channels, fields)
+
+def load_columns(flight_dir, channels=None, fields=None, workers=None,
+                 pool='thread'):
+    result = FlightData()
+
+    # the event file is read first because it decides the pilot mapping
+    pilot_mapping = 'Aura3'       # APM2 or Aura3
+    if want(channels, 'event') or want(channels, 'pilot'):
+        event_file = os.path.join(flight_dir, "event-0.csv")
+        result['event'], pilot_mapping = read_event(event_file)
+
+    # channel, file name, columns, required (otherwise loaded if it exists)
+    files = [
+        ('imu', "imu-0.csv", imu_columns, True),
+        ('gps', "gps-0.csv", gps_columns, True),
+        ('air', "air-0.csv", air_columns, True),
+        ('filter', "filter-0.csv", filter_columns, True),
+        ('filter_post', "filter-post.csv", filter_columns, False),
+        ('pilot', "pilot-0.csv", pilot_columns, False),
+        ('act', "act-0.csv", act_columns, False),
+        ('ap', "ap-0.csv", ap_columns, False),
+        ('health', "health-0.csv", health_columns, False),
+    ]
+    # with workers each file is split into line aligned byte ranges
+    # parsed as separate tasks, the pieces are joined in order before
+    # the channel is built (so the gps time filter sees the whole file)
+    loads = []
+    tasks = []
+    for (key, name, columns, required) in files:
+        filename = os.path.join(flight_dir, name)
+        if not want(channels, key):
+            continue
+        if not required and not os.path.exists(filename):
+            continue
+        if workers is None or workers == 1:
+            pieces = [ (read_csv, (filename,)) ]
+        else:
+            pieces = csv_range_tasks(filename)
+        loads.append( (key, columns, len(pieces)) )
+        tasks += pieces
+    frames = run_tasks(tasks, workers, pool)
+    i = 0
+    for (key, columns, count) in loads:
+        if count == 1:
+            df = frames[i]
+        else:
+            df = pd.concat(frames[i:i+count], ignore_index=True)
+        i += count
+        if key == 'pilot':
+            print('Pilot input mapping:', pilot_mapping)
+            result[key] = pilot_columns(df, pilot_mapping)
+        else:
+            result[key] = columns(df)
+    return project(result, channels, fields)
+
+# streaming source for flight_stream.windows(): channel name -> iterator
+# of (FlightChannel block, horizon) with at most block_rows csv rows per
+# block, so only a few blocks of each file are in memory at a time
+def stream(flight_dir, channels=None, fields=None, block_rows=50000):
+    sources = {}
+    pilot_mapping = 'Aura3'       # APM2 or Aura3
+    if want(channels, 'event') or want(channels, 'pilot'):
+        event_file = os.path.join(flight_dir, "event-0.csv")
+        event, pilot_mapping = read_event(event_file)
+        if want(channels, 'event'):
+            sources['event'] = stream_blocks([event], 'event', fields)
+    files = [
+        ('imu', "imu-0.csv", imu_columns, True),
+        ('gps', "gps-0.csv", gps_columns, True),
+        ('air', "air-0.csv", air_columns, True),
+        ('filter', "filter-0.csv", filter_columns, True),
+        ('filter_post', "filter-post.csv", filter_columns, False),
+        ('pilot', "pilot-0.csv", pilot_columns, False),
+        ('act', "act-0.csv", act_columns, False),
+        ('ap', "ap-0.csv", ap_columns, False),
+        ('health', "health-0.csv", health_columns, False),
+    ]
+    for (key, name, columns, required) in files:
+        filename = os.path.join(flight_dir, name)
+        if not want(channels, key):
+            continue
+        if not required and not os.path.exists(filename):
+            continue
+        blocks = stream_csv(filename, columns, block_rows, pilot_mapping)
+        sources[key] = stream_blocks(blocks, key, fields)
+    return sources
+
+def stream_csv(filename, columns, block_rows, pilot_mapping):
+    last_time = -1.0
+    with pd.read_csv(filename, engine='c', chunksize=block_rows) as reader:
+        for df in reader:
+            if columns == gps_columns:
+                # the gps time check needs the row before each block
+                block = gps_columns(df, last_time)
+                last_time = column(df, 'timestamp')[-1]
+            elif columns == pilot_columns:
+                block = pilot_columns(df, pilot_mapping)
+            else:
+                block = columns(df)
+            yield block
+
+def stream_blocks(blocks, key, fields):
+    for block in blocks:
+        block = project({key: block}, None, fields)[key]
+        if len(block):
+            yield block, block['time'][-1]
+
+def read_csv(filename):
+    return pd.read_csv(filename, engine='c')
+
+# tasks that parse a csv file in line aligned pieces (one task for a
+# small or empty file)
+def csv_range_tasks(filename):
+    with open(filename, 'rb') as f:
+        start = len(f.readline())
+    ranges = line_ranges(filename, start)
+    if len(ranges) <= 1:
+        return [ (read_csv, (filename,)) ]
+    names = list(pd.read_csv(filename, engine='c', nrows=0).columns)
+    return [ (read_csv_range, (filename, names, a, b)) for (a, b) in ranges ]
+
+def column(df, name, dtype=float):
+    return df[name].to_numpy(dtype=dtype)
+
+def read_event(filename):
+    df = pd.read_csv(filename, engine='c', dtype={'message': str},
+                     keep_default_na=False)
+    message = np.array([ m.decode() if type(m) == bytes else str(m)
+                         for m in df['message'] ], dtype=object)
+    pilot_mapping = 'Aura3'       # APM2 or Aura3
+    for msg in message:
+        if 'Aura3' in msg:
+            pilot_mapping = 'Aura3'
+        elif 'APM2' in msg:
+            pilot_mapping = 'APM2'
+    event = FlightChannel({
+        'time': column(df, 'timestamp'),
+        'message': message
+    })
+    return event, pilot_mapping
+
+def imu_columns(df):
+    imu = FlightChannel({
+        'time': column(df, 'timestamp'),
+        'p': column(df, 'p_rad_sec'),
+        'q': column(df, 'q_rad_sec'),
+        'r': column(df, 'r_rad_sec'),
+        'ax': column(df, 'ax_mps_sec'),
+        'ay': column(df, 'ay_mps_sec'),
+        'az': column(df, 'az_mps_sec'),
+        'hx': column(df, 'hx'),
+        'hy': column(df, 'hy'),
+        'hz': column(df, 'hz'),
+        'temp': column(df, 'temp_C')
+    })
+    return imu
+
+# last_time is the time of the record before this block of rows
+def gps_columns(df, last_time=-1.0):
+    time = column(df, 'timestamp')
+    sats = column(df, 'satellites', int)
+    # keep records with enough satellites whose time is past the
+    # previous record (same rule as the record loader)
+    last_time = np.concatenate(([last_time], time[:-1]))
+    keep = (sats >= 5) & (time > last_time)
+    gps = FlightChannel({
+        'time': time,
+        'unix_sec': column(df, 'unix_time_sec'),
+        'lat': column(df, 'latitude_deg'),
+        'lon': column(df, 'longitude_deg'),
+        'alt': column(df, 'altitude_m'),
+        'vn': column(df, 'vn_ms'),
+        've': column(df, 've_ms'),
+        'vd': column(df, 'vd_ms'),
+        'sats': sats
+    })
+    return gps.take(keep)
+
+def air_columns(df):
+    air = FlightChannel({
+        'time': column(df, 'timestamp'),
+        'static_press': column(df, 'pressure_mbar'),
+        'diff_press': np.zeros(len(df)), # not directly available in aura flight log
+        'temp': column(df, 'temp_C'),
+        'airspeed': column(df, 'airspeed_smoothed_kt'),
+        'alt_press': column(df, 'altitude_smoothed_m'),
+        'alt_true': column(df, 'altitude_true_m'),
+        'wind_dir': column(df, 'wind_dir_deg'),
+        'wind_speed': column(df, 'wind_speed_kt'),
+        'pitot_scale': column(df, 'pitot_scale_factor')
+    })
+    return air
+
+def filter_columns(df):
+    lat = column(df, 'latitude_deg')
+    lon = column(df, 'longitude_deg')
+    psi = column(df, 'heading_deg')*d2r
+    psi = np.where(psi > math.pi, psi - 2*math.pi, psi)
+    psi = np.where(psi < -math.pi, psi + 2*math.pi, psi)
+    nav = FlightChannel({
+        'time': column(df, 'timestamp'),
+        'lat': lat*d2r,
+        'lon': lon*d2r,
+        'alt': column(df, 'altitude_m'),
+        'vn': column(df, 'vn_ms'),
+        've': column(df, 've_ms'),
+        'vd': column(df, 'vd_ms'),
+        'phi': column(df, 'roll_deg')*d2r,
+        'the': column(df, 'pitch_deg')*d2r,
+        'psi': psi,
+        'p_bias': column(df, 'p_bias'),
+        'q_bias': column(df, 'q_bias'),
+        'r_bias': column(df, 'r_bias'),
+        'ax_bias': column(df, 'ax_bias'),
+        'ay_bias': column(df, 'ay_bias'),
+        'az_bias': column(df, 'az_bias')
+    })
+    keep = (np.abs(lat) > 0.0001) & (np.abs(lon) > 0.0001)
+    return nav.take(keep)
+
+def pilot_columns(df, pilot_mapping):
+    ch = []
+    for j in range(8):
+        ch.append( column(df, 'channel[%d]' % j) )
+    if pilot_mapping == 'Aura3':
+        pilot = FlightChannel({
+            'time': column(df, 'timestamp'),
+            'auto_manual': ch[0],
+            'throttle_safety': ch[1],
+            'throttle': ch[2],
+            'aileron': ch[3],
+            'elevator': ch[4],
+            'rudder': ch[5],
+            'flaps': ch[6],
+            'aux1': ch[7],
+            'gear': np.zeros(len(df), dtype=int)
+        })
+    elif pilot_mapping == 'APM2':
+        pilot = FlightChannel({
+            'time': column(df, 'timestamp'),
+            'aileron': ch[0],
+            'elevator': -ch[1],
+            'throttle': ch[2],
+            'rudder': ch[3],
+            'gear': ch[4],
+            'flaps': ch[5],
+            'aux1': ch[6],
+            'auto_manual': ch[7],
+            'throttle_safety': np.zeros(len(df))
+        })
+    return pilot
+
+def act_columns(df):
+    act = FlightChannel({
+        'time': column(df, 'timestamp'),
+        'aileron': column(df, 'aileron_norm'),
+        'elevator': column(df, 'elevator_norm'),
+        'throttle': column(df, 'throttle_norm'),
+        'rudder': column(df, 'rudder_norm'),
+        'gear': column(df, 'channel5_norm'),
+        'flaps': column(df, 'flaps_norm'),
+        'aux1': column(df, 'channel7_norm'),
+        'auto_manual': column(df, 'channel8_norm')
+    })
+    return act
+
+def ap_columns(df):
+    hdg = column(df, 'groundtrack_deg')
+    ap = FlightChannel({
+        'time': column(df, 'timestamp'),
+        'master_switch': column(df, 'master_switch', int),
+        'pilot_pass_through': column(df, 'pilot_pass_through', int),
+        'hdg': hdg,
+        'roll': column(df, 'roll_deg'),
+        'alt': column(df, 'altitude_msl_ft'),
+        'pitch': column(df, 'pitch_deg'),
+        'speed': column(df, 'airspeed_kt'),
+        'ground': column(df, 'altitude_ground_m')
+    })
+    return ap
+
+# health field name -> csv column names (newer name first, then the
+# older log name)
+health_aliases = {
+    'avionics_vcc': ['avionics_vcc', 'board_vcc'],
+    'main_vcc': ['main_vcc', 'extern_volts'],
+    'cell_vcc': ['cell_vcc', 'extern_cell_volts'],
+    'main_amps': ['main_amps', 'extern_amps'],
+    'main_mah': ['total_mah', 'extern_current_mah'],
+}
+
+def health_columns(df):
+    health = FlightChannel({
+        'time': column(df, 'timestamp'),
+        'load_avg': column(df, 'system_load_avg')
+    })
+    for key in health_aliases:
+        for name in health_aliases[key]:
+            if name in df.columns:
+                health[key] = column(df, name)
+                break
+    return health
 
 def save_filter_result(filename, nav):
     keys = ['timestamp', 'latitude_deg', 'longitude_deg', 'altitude_m',
@@ -2,116 +2,132 @@ import csv
 import h5py
 import os
 import math
+import numpy as np
 import re
 
+from ..flight_data import FlightChannel, FlightData, project, want
+from .parallel import run_tasks
+
 d2r = math.pi / 180.0
 
 # empty class we'll fill in with data members
 # class Record: pass (deprecated)
 
-def load(h5_filename):
-    filepath = h5_filename
-    flight_dir = os.path.dirname(filepath)
+# columnar=True keeps the hdf5 arrays as they are and returns a
+# FlightData object built with array operations (no per sample loops).
+# Datasets of channels not selected in channels are never read.  With
+# workers the columnar loader reads the channels concurrently, by default
+# on a process pool (h5py serializes access from threads.)
+def load(h5_filename, columnar=False, channels=None, fields=None,
+         workers=None, pool='process'):
+    if columnar:
+        return load_columns(h5_filename, channels, fields, workers, pool)
 
     # open the hdf5 file
-    data = h5py.File(filepath, 'r')
+    with h5py.File(h5_filename, 'r') as data:
+        return load_records(data, channels, fields)
 
+# the legacy dict of lists of records from an open hdf5 file
+def load_records(data, channels=None, fields=None):
     result = {}
-    timestamp = data['/events/timestamp'][()]
-    message = data['/events/message'][()]
-    result['event'] = []
-    pilot_mapping = 'Aura3'       # APM2 or Aura3
-    for i in range(len(timestamp)):
-        event = {
-            'time': timestamp[i],
-            'message': str(message[i])
-        }
-        if 'Aura3' in event['message']:
-            pilot_mapping = 'Aura3'
-        elif 'APM2' in event['message']:
-            pilot_mapping = 'APM2'
-        result['event'].append(event)
+    if want(channels, 'event') or want(channels, 'pilot'):
+        timestamp = data['/events/timestamp'][()]
+        message = data['/events/message'][()]
+        result['event'] = []
+        pilot_mapping = 'Aura3'       # APM2 or Aura3
+        for i in range(len(timestamp)):
+            event = {
+                'time': timestamp[i],
+                'message': str(message[i])
+            }
+            if 'Aura3' in event['message']:
+                pilot_mapping = 'Aura3'
+            elif 'APM2' in event['message']:
+                pilot_mapping = 'APM2'
+            result['event'].append(event)
         
-    timestamp = data['/sensors/imu/timestamp'][()]
-    gx = data['/sensors/imu/p_rad_sec'][()]
-    gy = data['/sensors/imu/q_rad_sec'][()]
-    gz = data['/sensors/imu/r_rad_sec'][()]
-    ax = data['/sensors/imu/ax_mps_sec'][()]
-    ay = data['/sensors/imu/ay_mps_sec'][()]
-    az = data['/sensors/imu/az_mps_sec'][()]
-    if '/sensors/imu/ax_raw' in data:
-        ax_raw = data['/sensors/imu/ax_raw'][()]
-        ay_raw = data['/sensors/imu/ay_raw'][()]
-        az_raw = data['/sensors/imu/az_raw'][()]
-    hx = data['/sensors/imu/hx'][()]
-    hy = data['/sensors/imu/hy'][()]
-    hz = data['/sensors/imu/hz'][()]
-    if '/sensors/imu/hx_raw' in data:
-        hx_raw = data['/sensors/imu/hx_raw'][()]
-        hy_raw = data['/sensors/imu/hy_raw'][()]
-        hz_raw = data['/sensors/imu/hz_raw'][()]
-    temp = data['/sensors/imu/temp_C'][()]
-    result['imu'] = []
-    for i in range(len(timestamp)):
-        imu = {
-            'time': timestamp[i],
-            'p': gx[i],
-            'q': gy[i],
-            'r': gz[i],
-            'ax': ax[i],
-            'ay': ay[i],
-            'az': az[i],
-            'hx': hx[i],
-            'hy': hy[i],
-            'hz': hz[i],
-            'temp': temp[i]
-        }
+    if want(channels, 'imu'):
+        timestamp = data['/sensors/imu/timestamp'][()]
+        gx = data['/sensors/imu/p_rad_sec'][()]
+        gy = data['/sensors/imu/q_rad_sec'][()]
+        gz = data['/sensors/imu/r_rad_sec'][()]
+        ax = data['/sensors/imu/ax_mps_sec'][()]
+        ay = data['/sensors/imu/ay_mps_sec'][()]
+        az = data['/sensors/imu/az_mps_sec'][()]
         if '/sensors/imu/ax_raw' in data:
-            imu['ax_raw'] = ax_raw[i]
-            imu['ay_raw'] = ay_raw[i]
-            imu['az_raw'] = az_raw[i]
+            ax_raw = data['/sensors/imu/ax_raw'][()]
+            ay_raw = data['/sensors/imu/ay_raw'][()]
+            az_raw = data['/sensors/imu/az_raw'][()]
+        hx = data['/sensors/imu/hx'][()]
+        hy = data['/sensors/imu/hy'][()]
+        hz = data['/sensors/imu/hz'][()]
         if '/sensors/imu/hx_raw' in data:
-            imu['hx_raw'] = hx_raw[i]
-            imu['hy_raw'] = hy_raw[i]
-            imu['hz_raw'] = hz_raw[i]
-        result['imu'].append(imu)
-
-    timestamp = data['/sensors/gps/timestamp'][()]
-    last_time = timestamp[0]
-    unix_sec = data['/sensors/gps/unix_time_sec'][()]
-    lat_deg = data['/sensors/gps/latitude_deg'][()]
-    lon_deg = data['/sensors/gps/longitude_deg'][()]
-    alt = data['/sensors/gps/altitude_m'][()]
-    last_alt = alt[0]
-    vn = data['/sensors/gps/vn_ms'][()]
-    ve = data['/sensors/gps/ve_ms'][()]
-    vd = data['/sensors/gps/vd_ms'][()]
-    sats = data['/sensors/gps/satellites'][()]
-    result['gps'] = []
-    for i in range(len(timestamp)):
-        dt = timestamp[i] - last_time
-        if dt > 0.001:
-            da = -(alt[i] - last_alt) / dt
-        else:
-            da = 0.0
-        last_time = timestamp[i]
-        last_alt = alt[i]
-        if sats[i] > 5:
-            gps = {
+            hx_raw = data['/sensors/imu/hx_raw'][()]
+            hy_raw = data['/sensors/imu/hy_raw'][()]
+            hz_raw = data['/sensors/imu/hz_raw'][()]
+        temp = data['/sensors/imu/temp_C'][()]
+        result['imu'] = []
+        for i in range(len(timestamp)):
+            imu = {
                 'time': timestamp[i],
-                'unix_sec': unix_sec[i],
-                'lat': lat_deg[i],
-                'lon': lon_deg[i],
-                'alt': alt[i],
-                'vn': vn[i],
-                've': ve[i],
-                'vd': vd[i],
-                'vd_est': da,
-                'sats': sats[i]
+                'p': gx[i],
+                'q': gy[i],
+                'r': gz[i],
+                'ax': ax[i],
+                'ay': ay[i],
+                'az': az[i],
+                'hx': hx[i],
+                'hy': hy[i],
+                'hz': hz[i],
+                'temp': temp[i]
             }
-            result['gps'].append(gps)
+            if '/sensors/imu/ax_raw' in data:
+                imu['ax_raw'] = ax_raw[i]
+                imu['ay_raw'] = ay_raw[i]
+                imu['az_raw'] = az_raw[i]
+            if '/sensors/imu/hx_raw' in data:
+                imu['hx_raw'] = hx_raw[i]
+                imu['hy_raw'] = hy_raw[i]
+                imu['hz_raw'] = hz_raw[i]
+            result['imu'].append(imu)
+
+    if want(channels, 'gps'):
+        timestamp = data['/sensors/gps/timestamp'][()]
+        last_time = timestamp[0]
+        unix_sec = data['/sensors/gps/unix_time_sec'][()]
+        lat_deg = data['/sensors/gps/latitude_deg'][()]
+        lon_deg = data['/sensors/gps/longitude_deg'][()]
+        alt = data['/sensors/gps/altitude_m'][()]
+        last_alt = alt[0]
+        vn = data['/sensors/gps/vn_ms'][()]
+        ve = data['/sensors/gps/ve_ms'][()]
+        vd = data['/sensors/gps/vd_ms'][()]
+        sats = data['/sensors/gps/satellites'][()]
+        result['gps'] = []
+        for i in range(len(timestamp)):
+            dt = timestamp[i] - last_time
+            if dt > 0.001:
+                da = -(alt[i] - last_alt) / dt
+            else:
+                da = 0.0
+            last_time = timestamp[i]
+            last_alt = alt[i]
+            if sats[i] > 5:
+                gps = {
+                    'time': timestamp[i],
+                    'unix_sec': unix_sec[i],
+                    'lat': lat_deg[i],
+                    'lon': lon_deg[i],
+                    'alt': alt[i],
+                    'vn': vn[i],
+                    've': ve[i],
+                    'vd': vd[i],
+                    'vd_est': da,
+                    'sats': sats[i]
+                }
+                result['gps'].append(gps)
 
-    if 'sensors/gpsraw' in data:
+    if want(channels, 'gpsraw') and 'sensors/gpsraw' in data:
         timestamp = data['/sensors/gpsraw/timestamp'][()]
         receiver_tow = data['/sensors/gpsraw/receiver_tow'][()]
         num_sats = data['/sensors/gpsraw/num_sats'][()]
@@ -139,90 +155,92 @@ def load(h5_filename):
             # print(gpsraw)
             result['gpsraw'].append(gpsraw)
 
-    timestamp = data['/sensors/air/timestamp'][()]
-    static_press = data['/sensors/air/pressure_mbar'][()]
-    temp = data['/sensors/air/temp_C'][()]
-    airspeed = data['/sensors/air/airspeed_smoothed_kt'][()]
-    alt_press = data['/sensors/air/altitude_smoothed_m'][()]
-    alt_true = data['/sensors/air/altitude_true_m'][()]
-    tecs_error_total = data['/sensors/air/tecs_error_total'][()]
-    tecs_error_diff = data['/sensors/air/tecs_error_diff'][()]
-    wind_dir = data['/sensors/air/wind_dir_deg'][()]
-    wind_speed = data['/sensors/air/wind_speed_kt'][()]
-    pitot_scale = data['/sensors/air/pitot_scale_factor'][()]
-    result['air'] = []
-    for i in range(len(timestamp)):
-        air = {
-            'time': timestamp[i],
-            'static_press': static_press[i],
-            'diff_press': 0.0, # not directly available in aura flight log
-            'temp': temp[i],
-            'airspeed': airspeed[i],
-            'alt_press': alt_press[i],
-            'alt_true': alt_true[i],
-            'tecs_error_total': tecs_error_total[i],
-            'tecs_error_diff': tecs_error_diff[i],
-            'wind_dir': wind_dir[i],
-            'wind_speed': wind_speed[i],
-            'pitot_scale': pitot_scale[i]
-        }
-        result['air'].append( air )
-
-    timestamp = data['/navigation/filter/timestamp'][()]
-    lat = data['/navigation/filter/latitude_deg'][()]*d2r
-    lon = data['/navigation/filter/longitude_deg'][()]*d2r
-    alt = data['/navigation/filter/altitude_m'][()]
-    vn = data['/navigation/filter/vn_ms'][()]
-    ve = data['/navigation/filter/ve_ms'][()]
-    vd = data['/navigation/filter/vd_ms'][()]
-    roll = data['/navigation/filter/roll_deg'][()]
-    pitch = data['/navigation/filter/pitch_deg'][()]
-    yaw = data['/navigation/filter/heading_deg'][()]
-    gbx = data['/navigation/filter/p_bias'][()]
-    gby = data['/navigation/filter/q_bias'][()]
-    gbz = data['/navigation/filter/r_bias'][()]
-    abx = data['/navigation/filter/ax_bias'][()]
-    aby = data['/navigation/filter/ay_bias'][()]
-    abz = data['/navigation/filter/az_bias'][()]
-    if '/navigation/filter/max_pos_cov' in data:
-        max_pos_cov = data['/navigation/filter/max_pos_cov'][()]
-        max_vel_cov = data['/navigation/filter/max_vel_cov'][()]
-        max_att_cov = data['/navigation/filter/max_att_cov'][()]
-    result['filter'] = []
-    for i in range(len(timestamp)):
-        psi = yaw[i]*d2r
-        if psi > math.pi:
-            psi -= 2*math.pi
-        if psi < -math.pi:
-            psi += 2*math.pi
-        psix = math.cos(psi)
-        psiy = math.sin(psi)
-        if abs(lat[i]) > 0.0001 and abs(lon[i]) > 0.0001:
-            filter = {
+    if want(channels, 'air'):
+        timestamp = data['/sensors/air/timestamp'][()]
+        static_press = data['/sensors/air/pressure_mbar'][()]
+        temp = data['/sensors/air/temp_C'][()]
+        airspeed = data['/sensors/air/airspeed_smoothed_kt'][()]
+        alt_press = data['/sensors/air/altitude_smoothed_m'][()]
+        alt_true = data['/sensors/air/altitude_true_m'][()]
+        tecs_error_total = data['/sensors/air/tecs_error_total'][()]
+        tecs_error_diff = data['/sensors/air/tecs_error_diff'][()]
+        wind_dir = data['/sensors/air/wind_dir_deg'][()]
+        wind_speed = data['/sensors/air/wind_speed_kt'][()]
+        pitot_scale = data['/sensors/air/pitot_scale_factor'][()]
+        result['air'] = []
+        for i in range(len(timestamp)):
+            air = {
                 'time': timestamp[i],
-                'lat': lat[i],
-                'lon': lon[i],
-                'alt': alt[i],
-                'vn': vn[i],
-                've': ve[i],
-                'vd': vd[i],
-                'phi': roll[i]*d2r,
-                'the': pitch[i]*d2r,
-                'psi': psi,
-                'psix': psix,
-                'psiy': psiy,
-                'p_bias': gbx[i],
-                'q_bias': gby[i],
-                'r_bias': gbz[i],
-                'ax_bias': abx[i],
-                'ay_bias': aby[i],
-                'az_bias': abz[i]
+                'static_press': static_press[i],
+                'diff_press': 0.0, # not directly available in aura flight log
+                'temp': temp[i],
+                'airspeed': airspeed[i],
+                'alt_press': alt_press[i],
+                'alt_true': alt_true[i],
+                'tecs_error_total': tecs_error_total[i],
+                'tecs_error_diff': tecs_error_diff[i],
+                'wind_dir': wind_dir[i],
+                'wind_speed': wind_speed[i],
+                'pitot_scale': pitot_scale[i]
             }
-            if '/navigation/filter/max_pos_cov' in data:
-                filter['max_pos_cov'] = max_pos_cov[i]
-                filter['max_vel_cov'] = max_vel_cov[i]
-                filter['max_att_cov'] = max_att_cov[i]
-            result['filter'].append(filter)
+            result['air'].append( air )
+
+    if want(channels, 'filter'):
+        timestamp = data['/navigation/filter/timestamp'][()]
+        lat = data['/navigation/filter/latitude_deg'][()]*d2r
+        lon = data['/navigation/filter/longitude_deg'][()]*d2r
+        alt = data['/navigation/filter/altitude_m'][()]
+        vn = data['/navigation/filter/vn_ms'][()]
+        ve = data['/navigation/filter/ve_ms'][()]
+        vd = data['/navigation/filter/vd_ms'][()]
+        roll = data['/navigation/filter/roll_deg'][()]
+        pitch = data['/navigation/filter/pitch_deg'][()]
+        yaw = data['/navigation/filter/heading_deg'][()]
+        gbx = data['/navigation/filter/p_bias'][()]
+        gby = data['/navigation/filter/q_bias'][()]
+        gbz = data['/navigation/filter/r_bias'][()]
+        abx = data['/navigation/filter/ax_bias'][()]
+        aby = data['/navigation/filter/ay_bias'][()]
+        abz = data['/navigation/filter/az_bias'][()]
+        if '/navigation/filter/max_pos_cov' in data:
+            max_pos_cov = data['/navigation/filter/max_pos_cov'][()]
+            max_vel_cov = data['/navigation/filter/max_vel_cov'][()]
+            max_att_cov = data['/navigation/filter/max_att_cov'][()]
+        result['filter'] = []
+        for i in range(len(timestamp)):
+            psi = yaw[i]*d2r
+            if psi > math.pi:
+                psi -= 2*math.pi
+            if psi < -math.pi:
+                psi += 2*math.pi
+            psix = math.cos(psi)
+            psiy = math.sin(psi)
+            if abs(lat[i]) > 0.0001 and abs(lon[i]) > 0.0001:
+                filter = {
+                    'time': timestamp[i],
+                    'lat': lat[i],
+                    'lon': lon[i],
+                    'alt': alt[i],
+                    'vn': vn[i],
+                    've': ve[i],
+                    'vd': vd[i],
+                    'phi': roll[i]*d2r,
+                    'the': pitch[i]*d2r,
+                    'psi': psi,
+                    'psix': psix,
+                    'psiy': psiy,
+                    'p_bias': gbx[i],
+                    'q_bias': gby[i],
+                    'r_bias': gbz[i],
+                    'ax_bias': abx[i],
+                    'ay_bias': aby[i],
+                    'az_bias': abz[i]
+                }
+                if '/navigation/filter/max_pos_cov' in data:
+                    filter['max_pos_cov'] = max_pos_cov[i]
+                    filter['max_vel_cov'] = max_vel_cov[i]
+                    filter['max_att_cov'] = max_att_cov[i]
+                result['filter'].append(filter)
 
     # load filter (post process) records if they exist (for comparison
     # purposes)
@@ -264,152 +282,505 @@ def load(h5_filename):
     #                 }
     #                 result['filter_post'].append(nav)
 
-    print('Pilot input mapping:', pilot_mapping)
-    timestamp = data['/sensors/pilot/timestamp'][()]
-    ch0 = data['/sensors/pilot/channel[0]'][()]
-    ch1 = data['/sensors/pilot/channel[1]'][()]
-    ch2 = data['/sensors/pilot/channel[2]'][()]
-    ch3 = data['/sensors/pilot/channel[3]'][()]
-    ch4 = data['/sensors/pilot/channel[4]'][()]
-    ch5 = data['/sensors/pilot/channel[5]'][()]
-    ch6 = data['/sensors/pilot/channel[6]'][()]
-    ch7 = data['/sensors/pilot/channel[7]'][()]
-    result['pilot'] = []
-    for i in range(len(timestamp)):
-        if pilot_mapping == 'Aura3':
-            pilot = {
+    if want(channels, 'pilot'):
+        print('Pilot input mapping:', pilot_mapping)
+        timestamp = data['/sensors/pilot/timestamp'][()]
+        ch0 = data['/sensors/pilot/channel[0]'][()]
+        ch1 = data['/sensors/pilot/channel[1]'][()]
+        ch2 = data['/sensors/pilot/channel[2]'][()]
+        ch3 = data['/sensors/pilot/channel[3]'][()]
+        ch4 = data['/sensors/pilot/channel[4]'][()]
+        ch5 = data['/sensors/pilot/channel[5]'][()]
+        ch6 = data['/sensors/pilot/channel[6]'][()]
+        ch7 = data['/sensors/pilot/channel[7]'][()]
+        result['pilot'] = []
+        for i in range(len(timestamp)):
+            if pilot_mapping == 'Aura3':
+                pilot = {
+                    'time': timestamp[i],
+                    'auto_manual': ch0[i],
+                    'throttle_safety': ch1[i],
+                    'throttle': ch2[i],
+                    'aileron': ch3[i],
+                    'elevator': ch4[i],
+                    'rudder': ch5[i],
+                    'flaps': ch6[i],
+                    'aux1': ch7[i],
+                    'gear': 0
+                }
+            elif pilot_mapping == 'APM2':
+                pilot = {
+                    'time': timestamp[i],
+                    'aileron': ch0[i],
+                    'elevator': -ch1[i],
+                    'throttle': ch2[i],
+                    'rudder': ch3[i],
+                    'gear': ch4[i],
+                    'flaps': ch5[i],
+                    'aux1': ch6[i],
+                    'auto_manual': ch7[i],
+                    'throttle_safety': 0.0
+                }
+            else:
+                pilot = {}
+            result['pilot'].append(pilot)
+
+    if want(channels, 'act'):
+        timestamp = data['/actuators/act/timestamp'][()]
+        ail = data['/actuators/act/aileron_norm'][()]
+        elev = data['/actuators/act/elevator_norm'][()]
+        thr = data['/actuators/act/throttle_norm'][()]
+        rud = data['/actuators/act/rudder_norm'][()]
+        gear = data['/actuators/act/channel5_norm'][()]
+        flaps = data['/actuators/act/flaps_norm'][()]
+        aux1 = data['/actuators/act/channel7_norm'][()]
+        auto_manual = data['/actuators/act/channel8_norm'][()]
+        result['act'] = []
+        for i in range(len(timestamp)):
+            act = {
                 'time': timestamp[i],
-                'auto_manual': ch0[i],
-                'throttle_safety': ch1[i],
-                'throttle': ch2[i],
-                'aileron': ch3[i],
-                'elevator': ch4[i],
-                'rudder': ch5[i],
-                'flaps': ch6[i],
-                'aux1': ch7[i],
-                'gear': 0
+                'aileron': ail[i],
+                'elevator': elev[i],
+                'throttle': thr[i],
+                'rudder': rud[i],
+                'gear': gear[i],
+                'flaps': flaps[i],
+                'aux1': aux1[i],
+                'auto_manual': auto_manual[i]
             }
-        elif pilot_mapping == 'APM2':
-            pilot = {
+            result['act'].append(act)
+
+
+    if want(channels, 'ap'):
+        timestamp = data['/autopilot/timestamp'][()]
+        master = data['/autopilot/master_switch'][()]
+        pass_through = data['/autopilot/pilot_pass_through'][()]
+        hdg = data['/autopilot/groundtrack_deg'][()]
+        roll = data['/autopilot/roll_deg'][()]
+        alt = data['/autopilot/altitude_msl_ft'][()]
+        pitch = data['/autopilot/pitch_deg'][()]
+        speed = data['/autopilot/airspeed_kt'][()]
+        ground = data['/autopilot/altitude_ground_m'][()]
+        tecs_tot = data['/autopilot/tecs_target_tot'][()]
+        if '/autopilot/current_task' in data:
+            current_task = data['/autopilot/current_task'][()]
+        else:
+            current_task = None
+        if '/autopilot/task_attribute' in data:
+            task_attrib = data['/autopilot/task_attribute'][()]
+        else:
+            task_attrib = None
+        route_size = data['/autopilot/route_size'][()]
+        target_waypoint_idx = data['/autopilot/target_waypoint_idx'][()]
+        wpt_index = data['/autopilot/wpt_index'][()]
+        wpt_latitude_deg = data['/autopilot/wpt_latitude_deg'][()]
+        wpt_longitude_deg = data['/autopilot/wpt_longitude_deg'][()]
+        result['ap'] = []
+        for i in range(len(timestamp)):
+            hdgx = math.cos(hdg[i]*d2r)
+            hdgy = math.sin(hdg[i]*d2r)
+            if not current_task is None:
+                cur_task = current_task[i]
+            else:
+                cur_task = 0
+            if not task_attrib is None:
+                attrib = task_attrib[i]
+            else:
+                attrib = 0
+            ap = {
                 'time': timestamp[i],
-                'aileron': ch0[i],
-                'elevator': -ch1[i],
-                'throttle': ch2[i],
-                'rudder': ch3[i],
-                'gear': ch4[i],
-                'flaps': ch5[i],
-                'aux1': ch6[i],
-                'auto_manual': ch7[i],
-                'throttle_safety': 0.0
+                'master_switch': master[i],
+                'pilot_pass_through': pass_through[i],
+                'hdg': hdg[i],
+                'hdgx': hdgx,
+                'hdgy': hdgy,
+                'roll': roll[i],
+                'alt': alt[i],
+                'pitch': pitch[i],
+                'speed': speed[i],
+                'ground': ground[i],
+                'tecs_target_tot': tecs_tot[i],
+                'current_task': cur_task,
+                'task_attrib': attrib,
+                'route_size': route_size[i],
+                'target_waypoint_idx': target_waypoint_idx[i],
+                'wpt_index': wpt_index[i],
+                'wpt_latitude_deg': wpt_latitude_deg[i],
+                'wpt_longitude_deg': wpt_longitude_deg[i]
             }
+            result['ap'].append(ap)
+
+    if want(channels, 'health'):
+        timestamp = data['/sensors/health/timestamp'][()]
+        load_avg = data['/sensors/health/system_load_avg'][()]
+        avionics_vcc = data['/sensors/health/avionics_vcc'][()]
+        main_vcc = data['/sensors/health/main_vcc'][()]
+        cell_vcc = data['/sensors/health/cell_vcc'][()]
+        main_amps = data['/sensors/health/main_amps'][()]
+        total_mah = data['/sensors/health/total_mah'][()]
+        result['health'] = []
+        for i in range(len(timestamp)):
+            health = {
+                'time': timestamp[i],
+                'load_avg': load_avg[i],
+                'avionics_vcc': avionics_vcc[i],
+                'main_vcc': main_vcc[i],
+                'cell_vcc': cell_vcc[i],
+                'main_amps': main_amps[i],
+                'total_mah': total_mah[i]
+            }
+            result['health'].append(health)
+
+    return project(result, channels, fields)
+
+def load_columns(h5_filename, channels=None, fields=None, workers=None,
+                 pool='process'):
+    with h5py.File(h5_filename, 'r') as data:
+        result = FlightData()
+
+        # the events are read first because they decide the pilot mapping
+        pilot_mapping = 'Aura3'       # APM2 or Aura3
+        if want(channels, 'event') or want(channels, 'pilot'):
+            result['event'], pilot_mapping = read_event(data)
+
+        keys = []
+        for key in [ 'imu', 'gps', 'gpsraw', 'air', 'filter', 'pilot', 'act',
+                     'ap', 'health' ]:
+            if not want(channels, key):
+                continue
+            if key == 'gpsraw' and not 'sensors/gpsraw' in data:
+                continue
+            keys.append(key)
+        if 'pilot' in keys:
+            print('Pilot input mapping:', pilot_mapping)
+
+        # worker processes open the file themselves
+        if workers is not None and workers != 1 and pool == 'process':
+            source = h5_filename
         else:
-            pilot = {}
-        result['pilot'].append(pilot)
-
-    timestamp = data['/actuators/act/timestamp'][()]
-    ail = data['/actuators/act/aileron_norm'][()]
-    elev = data['/actuators/act/elevator_norm'][()]
-    thr = data['/actuators/act/throttle_norm'][()]
-    rud = data['/actuators/act/rudder_norm'][()]
-    gear = data['/actuators/act/channel5_norm'][()]
-    flaps = data['/actuators/act/flaps_norm'][()]
-    aux1 = data['/actuators/act/channel7_norm'][()]
-    auto_manual = data['/actuators/act/channel8_norm'][()]
-    result['act'] = []
-    for i in range(len(timestamp)):
-        act = {
-            'time': timestamp[i],
-            'aileron': ail[i],
-            'elevator': elev[i],
-            'throttle': thr[i],
-            'rudder': rud[i],
-            'gear': gear[i],
-            'flaps': flaps[i],
-            'aux1': aux1[i],
-            'auto_manual': auto_manual[i]
-        }
-        result['act'].append(act)
-
-
-    timestamp = data['/autopilot/timestamp'][()]
-    master = data['/autopilot/master_switch'][()]
-    pass_through = data['/autopilot/pilot_pass_through'][()]
-    hdg = data['/autopilot/groundtrack_deg'][()]
-    roll = data['/autopilot/roll_deg'][()]
-    alt = data['/autopilot/altitude_msl_ft'][()]
-    pitch = data['/autopilot/pitch_deg'][()]
-    speed = data['/autopilot/airspeed_kt'][()]
-    ground = data['/autopilot/altitude_ground_m'][()]
-    tecs_tot = data['/autopilot/tecs_target_tot'][()]
+            source = data
+        tasks = [ (read_channel, (source, key, pilot_mapping))
+                  for key in keys ]
+        for key, channel in zip(keys, run_tasks(tasks, workers, pool)):
+            result[key] = channel
+    return project(result, channels, fields)
+
+# read one channel, source is an open h5py file or a file name
+def read_channel(source, key, pilot_mapping='Aura3', rows=slice(None)):
+    if isinstance(source, str):
+        with h5py.File(source, 'r') as data:
+            return read_channel(data, key, pilot_mapping, rows)
+    data = source
+    if key == 'event':
+        return read_event(data)[0]
+    elif key == 'imu':
+        return read_imu(data, rows)
+    elif key == 'gps':
+        return read_gps(data, rows)
+    elif key == 'gpsraw':
+        return read_gpsraw(data, rows)
+    elif key == 'air':
+        return read_air(data, rows)
+    elif key == 'filter':
+        return read_filter(data, rows)
+    elif key == 'pilot':
+        return read_pilot(data, pilot_mapping, rows)
+    elif key == 'act':
+        return read_act(data, rows)
+    elif key == 'ap':
+        return read_ap(data, rows)
+    elif key == 'health':
+        return read_health(data, rows)
+    else:
+        return None
+
+# streaming source for flight_stream.windows(): channel name -> iterator
+# of (FlightChannel block, horizon) reading at most block_rows records
+# of a channel at a time.  Each channel's iterator opens the file for
+# itself and closes it when it is exhausted or closed.
+def stream(h5_filename, channels=None, fields=None, block_rows=50000):
+    with h5py.File(h5_filename, 'r') as data:
+        has_gpsraw = 'sensors/gpsraw' in data
+        pilot_mapping = 'Aura3'       # APM2 or Aura3
+        if want(channels, 'event') or want(channels, 'pilot'):
+            event, pilot_mapping = read_event(data)
+    sources = {}
+    if want(channels, 'event'):
+        sources['event'] = stream_blocks([event], 'event', fields)
+    paths = {
+        'imu': '/sensors/imu/timestamp',
+        'gps': '/sensors/gps/timestamp',
+        'gpsraw': '/sensors/gpsraw/timestamp',
+        'air': '/sensors/air/timestamp',
+        'filter': '/navigation/filter/timestamp',
+        'pilot': '/sensors/pilot/timestamp',
+        'act': '/actuators/act/timestamp',
+        'ap': '/autopilot/timestamp',
+        'health': '/sensors/health/timestamp'
+    }
+    for key in paths:
+        if not want(channels, key):
+            continue
+        if key == 'gpsraw' and not has_gpsraw:
+            continue
+        blocks = read_blocks(h5_filename, paths[key], key, pilot_mapping,
+                             block_rows)
+        sources[key] = stream_blocks(blocks, key, fields)
+    return sources
+
+# the channel block_rows records at a time (path is its timestamp
+# dataset)
+def read_blocks(h5_filename, path, key, pilot_mapping, block_rows):
+    data = h5py.File(h5_filename, 'r')
+    try:
+        size = len(data[path])
+        for i in range(0, size, block_rows):
+            rows = slice(i, min(i + block_rows, size))
+            yield read_channel(data, key, pilot_mapping, rows)
+    finally:
+        data.close()
+
+def stream_blocks(blocks, key, fields):
+    for block in blocks:
+        block = project({key: block}, None, fields)[key]
+        if len(block):
+            yield block, block['time'][-1]
+
+# the pilot input mapping is decided by the last event message that
+# names the hardware (APM2 or Aura3)
+def read_event(data):
+    timestamp = data['/events/timestamp'][()]
+    message = data['/events/message'][()]
+    message = np.array([ m.decode() if isinstance(m, bytes) else str(m)
+                         for m in message ], dtype=object)
+    pilot_mapping = 'Aura3'       # APM2 or Aura3
+    for msg in message:
+        if 'Aura3' in msg:
+            pilot_mapping = 'Aura3'
+        elif 'APM2' in msg:
+            pilot_mapping = 'APM2'
+    event = FlightChannel({
+        'time': timestamp,
+        'message': message
+    })
+    return event, pilot_mapping
+
+def read_imu(data, rows=slice(None)):
+    imu = FlightChannel({
+        'time': data['/sensors/imu/timestamp'][rows],
+        'p': data['/sensors/imu/p_rad_sec'][rows],
+        'q': data['/sensors/imu/q_rad_sec'][rows],
+        'r': data['/sensors/imu/r_rad_sec'][rows],
+        'ax': data['/sensors/imu/ax_mps_sec'][rows],
+        'ay': data['/sensors/imu/ay_mps_sec'][rows],
+        'az': data['/sensors/imu/az_mps_sec'][rows],
+        'hx': data['/sensors/imu/hx'][rows],
+        'hy': data['/sensors/imu/hy'][rows],
+        'hz': data['/sensors/imu/hz'][rows],
+        'temp': data['/sensors/imu/temp_C'][rows]
+    })
+    if '/sensors/imu/ax_raw' in data:
+        imu['ax_raw'] = data['/sensors/imu/ax_raw'][rows]
+        imu['ay_raw'] = data['/sensors/imu/ay_raw'][rows]
+        imu['az_raw'] = data['/sensors/imu/az_raw'][rows]
+    if '/sensors/imu/hx_raw' in data:
+        imu['hx_raw'] = data['/sensors/imu/hx_raw'][rows]
+        imu['hy_raw'] = data['/sensors/imu/hy_raw'][rows]
+        imu['hz_raw'] = data['/sensors/imu/hz_raw'][rows]
+    return imu
+
+def read_gps(data, rows=slice(None)):
+    # a block that starts part way through also reads the record before
+    # it (for vd_est) and drops it again below
+    start = rows.start or 0
+    if start > 0:
+        rows = slice(start - 1, rows.stop)
+    timestamp = data['/sensors/gps/timestamp'][rows]
+    alt = data['/sensors/gps/altitude_m'][rows]
+    sats = data['/sensors/gps/satellites'][rows]
+    # vertical speed estimated from the altitude difference to the
+    # previous record (including records dropped below)
+    dt = np.diff(timestamp, prepend=timestamp[:1])
+    da = np.diff(alt, prepend=alt[:1])
+    ok = dt > 0.001
+    vd_est = np.zeros(len(timestamp))
+    vd_est[ok] = -da[ok] / dt[ok]
+    keep = sats > 5
+    if start > 0:
+        keep[0] = False
+    gps = FlightChannel({
+        'time': timestamp,
+        'unix_sec': data['/sensors/gps/unix_time_sec'][rows],
+        'lat': data['/sensors/gps/latitude_deg'][rows],
+        'lon': data['/sensors/gps/longitude_deg'][rows],
+        'alt': alt,
+        'vn': data['/sensors/gps/vn_ms'][rows],
+        've': data['/sensors/gps/ve_ms'][rows],
+        'vd': data['/sensors/gps/vd_ms'][rows],
+        'vd_est': vd_est,
+        'sats': sats
+    })
+    return gps.take(keep)
+
+def read_gpsraw(data, rows=slice(None)):
+    doppler = []
+    pseudorange = []
+    svid = []
+    for j in range(12):
+        doppler.append( data['/sensors/gpsraw/doppler[%d]' % j][rows] )
+        pseudorange.append( data['/sensors/gpsraw/pseudorange[%d]' % j][rows] )
+        svid.append( data['/sensors/gpsraw/svid[%d]' % j][rows] )
+    gpsraw = FlightChannel({
+        'time': data['/sensors/gpsraw/timestamp'][rows],
+        'receiver_tow': data['/sensors/gpsraw/receiver_tow'][rows],
+        'num_sats': data['/sensors/gpsraw/num_sats'][rows],
+        'doppler': np.column_stack(doppler),
+        'pseudorange': np.column_stack(pseudorange),
+        'svid': np.column_stack(svid)
+    })
+    return gpsraw
+
+def read_air(data, rows=slice(None)):
+    timestamp = data['/sensors/air/timestamp'][rows]
+    air = FlightChannel({
+        'time': timestamp,
+        'static_press': data['/sensors/air/pressure_mbar'][rows],
+        'diff_press': np.zeros(len(timestamp)), # not directly available in aura flight log
+        'temp': data['/sensors/air/temp_C'][rows],
+        'airspeed': data['/sensors/air/airspeed_smoothed_kt'][rows],
+        'alt_press': data['/sensors/air/altitude_smoothed_m'][rows],
+        'alt_true': data['/sensors/air/altitude_true_m'][rows],
+        'tecs_error_total': data['/sensors/air/tecs_error_total'][rows],
+        'tecs_error_diff': data['/sensors/air/tecs_error_diff'][rows],
+        'wind_dir': data['/sensors/air/wind_dir_deg'][rows],
+        'wind_speed': data['/sensors/air/wind_speed_kt'][rows],
+        'pitot_scale': data['/sensors/air/pitot_scale_factor'][rows]
+    })
+    return air
+
+def read_filter(data, rows=slice(None)):
+    lat = data['/navigation/filter/latitude_deg'][rows]*d2r
+    lon = data['/navigation/filter/longitude_deg'][rows]*d2r
+    psi = data['/navigation/filter/heading_deg'][rows]*d2r
+    psi = np.where(psi > math.pi, psi - 2*math.pi, psi)
+    psi = np.where(psi < -math.pi, psi + 2*math.pi, psi)
+    filter = FlightChannel({
+        'time': data['/navigation/filter/timestamp'][rows],
+        'lat': lat,
+        'lon': lon,
+        'alt': data['/navigation/filter/altitude_m'][rows],
+        'vn': data['/navigation/filter/vn_ms'][rows],
+        've': data['/navigation/filter/ve_ms'][rows],
+        'vd': data['/navigation/filter/vd_ms'][rows],
+        'phi': data['/navigation/filter/roll_deg'][rows]*d2r,
+        'the': data['/navigation/filter/pitch_deg'][rows]*d2r,
+        'psi': psi,
+        'p_bias': data['/navigation/filter/p_bias'][rows],
+        'q_bias': data['/navigation/filter/q_bias'][rows],
+        'r_bias': data['/navigation/filter/r_bias'][rows],
+        'ax_bias': data['/navigation/filter/ax_bias'][rows],
+        'ay_bias': data['/navigation/filter/ay_bias'][rows],
+        'az_bias': data['/navigation/filter/az_bias'][rows]
+    })
+    if '/navigation/filter/max_pos_cov' in data:
+        filter['max_pos_cov'] = data['/navigation/filter/max_pos_cov'][rows]
+        filter['max_vel_cov'] = data['/navigation/filter/max_vel_cov'][rows]
+        filter['max_att_cov'] = data['/navigation/filter/max_att_cov'][rows]
+    keep = (np.abs(lat) > 0.0001) & (np.abs(lon) > 0.0001)
+    return filter.take(keep)
+
+def read_pilot(data, pilot_mapping, rows=slice(None)):
+    timestamp = data['/sensors/pilot/timestamp'][rows]
+    ch = []
+    for j in range(8):
+        ch.append( data['/sensors/pilot/channel[%d]' % j][rows] )
+    if pilot_mapping == 'Aura3':
+        pilot = FlightChannel({
+            'time': timestamp,
+            'auto_manual': ch[0],
+            'throttle_safety': ch[1],
+            'throttle': ch[2],
+            'aileron': ch[3],
+            'elevator': ch[4],
+            'rudder': ch[5],
+            'flaps': ch[6],
+            'aux1': ch[7],
+            'gear': np.zeros(len(timestamp))
+        })
+    elif pilot_mapping == 'APM2':
+        pilot = FlightChannel({
+            'time': timestamp,
+            'aileron': ch[0],
+            'elevator': -ch[1],
+            'throttle': ch[2],
+            'rudder': ch[3],
+            'gear': ch[4],
+            'flaps': ch[5],
+            'aux1': ch[6],
+            'auto_manual': ch[7],
+            'throttle_safety': np.zeros(len(timestamp))
+        })
+    else:
+        pilot = FlightChannel({ 'time': timestamp })
+    return pilot
+
+def read_act(data, rows=slice(None)):
+    act = FlightChannel({
+        'time': data['/actuators/act/timestamp'][rows],
+        'aileron': data['/actuators/act/aileron_norm'][rows],
+        'elevator': data['/actuators/act/elevator_norm'][rows],
+        'throttle': data['/actuators/act/throttle_norm'][rows],
+        'rudder': data['/actuators/act/rudder_norm'][rows],
+        'gear': data['/actuators/act/channel5_norm'][rows],
+        'flaps': data['/actuators/act/flaps_norm'][rows],
+        'aux1': data['/actuators/act/channel7_norm'][rows],
+        'auto_manual': data['/actuators/act/channel8_norm'][rows]
+    })
+    return act
+
+def read_ap(data, rows=slice(None)):
+    timestamp = data['/autopilot/timestamp'][rows]
+    hdg = data['/autopilot/groundtrack_deg'][rows]
     if '/autopilot/current_task' in data:
-        current_task = data['/autopilot/current_task'][()]
+        current_task = data['/autopilot/current_task'][rows]
     else:
-        current_task = None
+        current_task = np.zeros(len(timestamp), dtype=int)
     if '/autopilot/task_attribute' in data:
-        task_attrib = data['/autopilot/task_attribute'][()]
+        task_attrib = data['/autopilot/task_attribute'][rows]
     else:
-        task_attrib = None
-    route_size = data['/autopilot/route_size'][()]
-    target_waypoint_idx = data['/autopilot/target_waypoint_idx'][()]
-    wpt_index = data['/autopilot/wpt_index'][()]
-    wpt_latitude_deg = data['/autopilot/wpt_latitude_deg'][()]
-    wpt_longitude_deg = data['/autopilot/wpt_longitude_deg'][()]
-    result['ap'] = []
-    for i in range(len(timestamp)):
-        hdgx = math.cos(hdg[i]*d2r)
-        hdgy = math.sin(hdg[i]*d2r)
-        if not current_task is None:
-            cur_task = current_task[i]
-        else:
-            cur_task = 0
-        if not task_attrib is None:
-            attrib = task_attrib[i]
-        else:
-            attrib = 0
-        ap = {
-            'time': timestamp[i],
-            'master_switch': master[i],
-            'pilot_pass_through': pass_through[i],
-            'hdg': hdg[i],
-            'hdgx': hdgx,
-            'hdgy': hdgy,
-            'roll': roll[i],
-            'alt': alt[i],
-            'pitch': pitch[i],
-            'speed': speed[i],
-            'ground': ground[i],
-            'tecs_target_tot': tecs_tot[i],
-            'current_task': cur_task,
-            'task_attrib': attrib,
-            'route_size': route_size[i],
-            'target_waypoint_idx': target_waypoint_idx[i],
-            'wpt_index': wpt_index[i],
-            'wpt_latitude_deg': wpt_latitude_deg[i],
-            'wpt_longitude_deg': wpt_longitude_deg[i]
-        }
-        result['ap'].append(ap)
-
-    timestamp = data['/sensors/health/timestamp'][()]
-    load_avg = data['/sensors/health/system_load_avg'][()]
-    avionics_vcc = data['/sensors/health/avionics_vcc'][()]
-    main_vcc = data['/sensors/health/main_vcc'][()]
-    cell_vcc = data['/sensors/health/cell_vcc'][()]
-    main_amps = data['/sensors/health/main_amps'][()]
-    total_mah = data['/sensors/health/total_mah'][()]
-    result['health'] = []
-    for i in range(len(timestamp)):
-        health = {
-            'time': timestamp[i],
-            'load_avg': load_avg[i],
-            'avionics_vcc': avionics_vcc[i],
-            'main_vcc': main_vcc[i],
-            'cell_vcc': cell_vcc[i],
-            'main_amps': main_amps[i],
-            'total_mah': total_mah[i]
-        }
-        result['health'].append(health)
-
-    return result
+        task_attrib = np.zeros(len(timestamp), dtype=int)
+    ap = FlightChannel({
+        'time': timestamp,
+        'master_switch': data['/autopilot/master_switch'][rows],
+        'pilot_pass_through': data['/autopilot/pilot_pass_through'][rows],
+        'hdg': hdg,
+        'roll': data['/autopilot/roll_deg'][rows],
+        'alt': data['/autopilot/altitude_msl_ft'][rows],
+        'pitch': data['/autopilot/pitch_deg'][rows],
+        'speed': data['/autopilot/airspeed_kt'][rows],
+        'ground': data['/autopilot/altitude_ground_m'][rows],
+        'tecs_target_tot': data['/autopilot/tecs_target_tot'][rows],
+        'current_task': current_task,
+        'task_attrib': task_attrib,
+        'route_size': data['/autopilot/route_size'][rows],
+        'target_waypoint_idx': data['/autopilot/target_waypoint_idx'][rows],
+        'wpt_index': data['/autopilot/wpt_index'][rows],
+        'wpt_latitude_deg': data['/autopilot/wpt_latitude_deg'][rows],
+        'wpt_longitude_deg': data['/autopilot/wpt_longitude_deg'][rows]
+    })
+    return ap
+
+def read_health(data, rows=slice(None)):
+    health = FlightChannel({
+        'time': data['/sensors/health/timestamp'][rows],
+        'load_avg': data['/sensors/health/system_load_avg'][rows],
+        'avionics_vcc': data['/sensors/health/avionics_vcc'][rows],
+        'main_vcc': data['/sensors/health/main_vcc'][rows],
+        'cell_vcc': data['/sensors/health/cell_vcc'][rows],
+        'main_amps': data['/sensors/health/main_amps'][rows],
+        'total_mah': data['/sensors/health/total_mah'][rows]
+    })
+    return health
 
 def save_filter_result(filename, nav):
     keys = ['timestamp', 'latitude_deg', 'longitude_deg', 'altitude_m',
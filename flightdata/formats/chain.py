@@ -0,0 +1,55 @@
+# pick out a chain of messages from candidate message boundaries
+#
+# In a binary log each message is found from the length of the one
+# before it, which is inherently sequential.  The loaders find all the
+# candidate boundaries with array operations and point each candidate at
+# the candidate its length leads to (nxt[i] > i, len(nxt) when there is
+# none.)  The chain from the first message is then marked by pointer
+# doubling: each round marks the candidates up to twice as far along the
+# chain, so the walk costs log2(messages) array passes instead of a
+# python step per message.
+
+import numpy as np
+
+# boolean mask of the candidates on the chain that starts at start
+def follow(nxt, start):
+    m = len(nxt)
+    on = np.zeros(m + 1, dtype=bool)
+    if start >= m:
+        return on[:m]
+    (keep, nxt, start) = prune(np.asarray(nxt), start)
+    k = len(keep)
+    # jump[i] is the candidate 2^k steps after i (k past the end)
+    jump = np.append(nxt, k)
+    mark = np.zeros(k + 1, dtype=bool)
+    mark[start] = True
+    while True:
+        # the candidates 2^k .. 2^(k+1) - 1 steps along the chain
+        step = jump[np.flatnonzero(mark)]
+        if mark[step].all():
+            break
+        mark[step] = True
+        jump = jump[jump]
+    on[keep[mark[:k]]] = True
+    return on[:m]
+
+# drop the candidates nothing points at (but start): they can't be on the
+# chain, and most false candidates point at a non-candidate so each round
+# drops most of the ones left.  Returns the candidates kept and the chain
+# renumbered over them.
+def prune(nxt, start):
+    m = len(nxt)
+    keep = np.arange(m)
+    while True:
+        hit = np.zeros(m + 1, dtype=bool)
+        hit[nxt[keep]] = True
+        hit[start] = True
+        kept = keep[hit[keep]]
+        if len(kept) > 0.9 * len(keep):
+            break
+        keep = kept
+    keep = kept
+    # a kept candidate points at a kept one (or past the end)
+    index = np.full(m + 1, len(keep), dtype=np.int64)
+    index[keep] = np.arange(len(keep))
+    return keep, index[nxt[keep]], index[start]
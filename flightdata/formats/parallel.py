@@ -0,0 +1,69 @@
+# helpers to run independent loader tasks on a thread or process pool.
+# Tasks are (function, args) tuples, results come back in task order.
+# With workers of None or 1 the tasks simply run one after another, so
+# loaders can use the same code path for the sequential case; workers <= 0
+# means one worker per cpu.
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import io
+import os
+import pandas as pd
+
+def make_pool(workers, kind="thread"):
+    if workers is None or workers == 1:
+        return None
+    if workers <= 0:
+        workers = os.cpu_count()
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers)
+    elif kind == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    else:
+        raise ValueError("unknown pool kind: " + str(kind))
+
+# note: with kind="process" the task functions (and their arguments) must
+# be picklable, i.e. module level functions
+def run_tasks(tasks, workers=None, kind="thread"):
+    pool = make_pool(workers, kind)
+    if pool is None:
+        return [ func(*args) for (func, args) in tasks ]
+    with pool:
+        futures = [ pool.submit(func, *args) for (func, args) in tasks ]
+        return [ f.result() for f in futures ]
+
+# chunked text ingest: a large text file is split into byte ranges that
+# start and end on line boundaries, each range is parsed as its own task
+# and the per-range results are joined back in order by the caller.
+# Anything that depends on earlier lines (merging the latest record of
+# another message, time order filters) is done after the join.
+
+chunk_bytes = 1 << 23
+
+# (start, end) byte ranges of about chunk_bytes each covering the file
+# from offset start (e.g. just past a header line) to the end
+def line_ranges(filename, start=0, chunk_bytes=chunk_bytes):
+    size = os.path.getsize(filename)
+    ranges = []
+    with open(filename, 'rb') as f:
+        while start < size:
+            end = start + chunk_bytes
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            else:
+                end = size
+            ranges.append( (start, end) )
+            start = end
+    return ranges
+
+def read_range(filename, start, end):
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start)
+
+# a csv byte range (without the header line) parsed with pandas, names
+# are the column names from the header
+def read_csv_range(filename, names, start, end):
+    data = io.BytesIO(read_range(filename, start, end))
+    return pd.read_csv(data, engine='c', header=None, names=names)
@@ -8,6 +8,8 @@ import os
 from scipy import interpolate # strait up linear interpolation, nothing fancy
 import re
 
+from ..flight_data import project, want
+
 # empty class we'll fill in with data members
 class Record: pass
 
@@ -57,7 +59,7 @@ def px4_quat2euler(q):
                      1.0 - 2.0 * (q[2] * q[2] + q[3] * q[3]))
     return (roll, pitch, yaw)
 
-def load(csv_base):
+def load(csv_base, channels=None, fields=None):
     result = {}
 
     comb_path = csv_base + '_sensor_combined_0.csv'
@@ -69,107 +71,111 @@ def load(csv_base):
     act_path = csv_base + '_actuator_outputs_0.csv'
     filter_post = csv_base + '_filter_post.txt'
 
-    result['imu'] = []
-    with open(comb_path, 'rb') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            imu = Record()
-            imu.time = float(row['timestamp']) / 1000000.0
-            imu.p = float(row['gyro_rad[0]'])
-            imu.q = float(row['gyro_rad[1]'])
-            imu.r = float(row['gyro_rad[2]'])
-            imu.ax = float(row['accelerometer_m_s2[0]'])
-            imu.ay = float(row['accelerometer_m_s2[1]'])
-            imu.az = float(row['accelerometer_m_s2[2]'])
-            hx = float(row['magnetometer_ga[0]'])
-            hy = float(row['magnetometer_ga[0]'])
-            hz = float(row['magnetometer_ga[0]'])
-            hf = np.array( [hx, hy, hz] )
-            norm = np.linalg.norm(hf)
-            hf /= norm
-            imu.hx = hf[0]
-            imu.hy = hf[1]
-            imu.hz = hf[2]
-            #print imu.hx, imu.hy, imu.hz
-            imu.temp = 15.0
-            result['imu'].append( imu )
+    if want(channels, 'imu'):
+        result['imu'] = []
+        with open(comb_path, 'rb') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                imu = Record()
+                imu.time = float(row['timestamp']) / 1000000.0
+                imu.p = float(row['gyro_rad[0]'])
+                imu.q = float(row['gyro_rad[1]'])
+                imu.r = float(row['gyro_rad[2]'])
+                imu.ax = float(row['accelerometer_m_s2[0]'])
+                imu.ay = float(row['accelerometer_m_s2[1]'])
+                imu.az = float(row['accelerometer_m_s2[2]'])
+                hx = float(row['magnetometer_ga[0]'])
+                hy = float(row['magnetometer_ga[0]'])
+                hz = float(row['magnetometer_ga[0]'])
+                hf = np.array( [hx, hy, hz] )
+                norm = np.linalg.norm(hf)
+                hf /= norm
+                imu.hx = hf[0]
+                imu.hy = hf[1]
+                imu.hz = hf[2]
+                #print imu.hx, imu.hy, imu.hz
+                imu.temp = 15.0
+                result['imu'].append( imu )
+
+    if want(channels, 'gps') or want(channels, 'air'):
+        result['gps'] = []
+        with open(gps_path, 'rb') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                gps = Record()
+                gps.time = float(row['timestamp']) / 1000000.0
+                gps.unix_sec = float(row['time_utc_usec']) / 1000000.0
+                gps.lat = float(row['lat']) / 1e7
+                gps.lon = float(row['lon']) / 1e7
+                gps.alt = float(row['alt']) / 1e3
+                # print gps.lat, gps.lon, gps.alt
+                gps.vn = float(row['vel_n_m_s'])
+                gps.ve = float(row['vel_e_m_s'])
+                gps.vd = float(row['vel_d_m_s'])
+                gps.sats = int(row['satellites_used'])
+                if gps.sats >= 5:
+                    result['gps'].append(gps)
+
+    if want(channels, 'air'):
+        result['air'] = []
+        with open(air_path, 'rb') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                air = Record()
+                air.time = float(row['timestamp']) / 1000000.0
+                #air.static_press = float(row['SENS_BaroPres'])
+                air.diff_press = float(row['differential_pressure_filtered_pa'])
+                air.temp = float(row['air_temperature_celsius'])
+                air.airspeed = float(row['indicated_airspeed_m_s']) * mps2kt
+                #air.alt_press = float(row['SENS_BaroAlt'])
+                air.alt_true = gps.alt
+                result['air'].append( air )
 
-    result['gps'] = []
-    with open(gps_path, 'rb') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            gps = Record()
-            gps.time = float(row['timestamp']) / 1000000.0
-            gps.unix_sec = float(row['time_utc_usec']) / 1000000.0
-            gps.lat = float(row['lat']) / 1e7
-            gps.lon = float(row['lon']) / 1e7
-            gps.alt = float(row['alt']) / 1e3
-            # print gps.lat, gps.lon, gps.alt
-            gps.vn = float(row['vel_n_m_s'])
-            gps.ve = float(row['vel_e_m_s'])
-            gps.vd = float(row['vel_d_m_s'])
-            gps.sats = int(row['satellites_used'])
-            if gps.sats >= 5:
-                result['gps'].append(gps)
+    if want(channels, 'filter'):
+        att = []
+        with open(att_path, 'rb') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                time = float(row['timestamp']) / 1000000.0
+                q = [ float(row['q[0]']),
+                      float(row['q[1]']),
+                      float(row['q[2]']),
+                      float(row['q[3]']) ]
+                # either of these will work ...
+                (roll, pitch, yaw) = px4_quat2euler(q)
+                att.append( [time, yaw, pitch, roll] )
 
-    result['air'] = []
-    with open(air_path, 'rb') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            air = Record()
-            air.time = float(row['timestamp']) / 1000000.0
-            #air.static_press = float(row['SENS_BaroPres'])
-            air.diff_press = float(row['differential_pressure_filtered_pa'])
-            air.temp = float(row['air_temperature_celsius'])
-            air.airspeed = float(row['indicated_airspeed_m_s']) * mps2kt
-            #air.alt_press = float(row['SENS_BaroAlt'])
-            air.alt_true = gps.alt
-            result['air'].append( air )
+        pos = []
+        with open(pos_path, 'rb') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                time = float(row['timestamp']) / 1000000.0
+                lat = float(row['lat'])*d2r
+                lon = float(row['lon'])*d2r
+                alt = float(row['alt'])
+                vn = float(row['vel_n'])
+                ve = float(row['vel_e'])
+                vd = float(row['vel_d'])
+                pos.append( [time, lat, lon, alt, vn, ve, vd] )
+        pos_array = np.array(pos)
 
-    att = []
-    with open(att_path, 'rb') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            time = float(row['timestamp']) / 1000000.0
-            q = [ float(row['q[0]']),
-                  float(row['q[1]']),
-                  float(row['q[2]']),
-                  float(row['q[3]']) ]
-            # either of these will work ...
-            (roll, pitch, yaw) = px4_quat2euler(q)
-            att.append( [time, yaw, pitch, roll] )
-        
-    pos = []
-    with open(pos_path, 'rb') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            time = float(row['timestamp']) / 1000000.0
-            lat = float(row['lat'])*d2r
-            lon = float(row['lon'])*d2r
-            alt = float(row['alt'])
-            vn = float(row['vel_n'])
-            ve = float(row['vel_e'])
-            vd = float(row['vel_d'])
-            pos.append( [time, lat, lon, alt, vn, ve, vd] )
-    pos_array = np.array(pos)
-    
-    lat_interp = interpolate.interp1d(pos_array[:,0], pos_array[:,1],
-                                      bounds_error=False,
-                                      fill_value='extrapolate')
-    lon_interp = interpolate.interp1d(pos_array[:,0], pos_array[:,2],
-                                      bounds_error=False,
-                                      fill_value='extrapolate')
-    alt_interp = interpolate.interp1d(pos_array[:,0], pos_array[:,3],
-                                      bounds_error=False,
-                                      fill_value='extrapolate')
-    vn_interp = interpolate.interp1d(pos_array[:,0], pos_array[:,4],
-                                     bounds_error=False, fill_value=0.0)
-    ve_interp = interpolate.interp1d(pos_array[:,0], pos_array[:,5],
-                                     bounds_error=False, fill_value=0.0)
-    vd_interp = interpolate.interp1d(pos_array[:,0], pos_array[:,6],
-                                     bounds_error=False, fill_value=0.0)
+        lat_interp = interpolate.interp1d(pos_array[:,0], pos_array[:,1],
+                                          bounds_error=False,
+                                          fill_value='extrapolate')
+        lon_interp = interpolate.interp1d(pos_array[:,0], pos_array[:,2],
+                                          bounds_error=False,
+                                          fill_value='extrapolate')
+        alt_interp = interpolate.interp1d(pos_array[:,0], pos_array[:,3],
+                                          bounds_error=False,
+                                          fill_value='extrapolate')
+        vn_interp = interpolate.interp1d(pos_array[:,0], pos_array[:,4],
+                                         bounds_error=False, fill_value=0.0)
+        ve_interp = interpolate.interp1d(pos_array[:,0], pos_array[:,5],
+                                         bounds_error=False, fill_value=0.0)
+        vd_interp = interpolate.interp1d(pos_array[:,0], pos_array[:,6],
+                                         bounds_error=False, fill_value=0.0)
 
-    if os.path.exists(ap_path):
+    if want(channels, 'ap') and os.path.exists(ap_path):
         result['ap'] = []
         with open(ap_path, 'rb') as f:
             reader = csv.DictReader(f)
@@ -185,20 +191,21 @@ def load(csv_base):
                 #ap.speed = float(row['TECS_AsSP']) * mps2kt
                 result['ap'].append(ap)
  
-    result['filter'] = []
-    for a in att:
-        nav = Record()
-        nav.time = a[0]
-        nav.lat = float(lat_interp(nav.time))
-        nav.lon = float(lon_interp(nav.time))
-        nav.alt = float(alt_interp(nav.time))
-        nav.vn = float(vn_interp(nav.time))
-        nav.ve = float(ve_interp(nav.time))
-        nav.vd = float(vd_interp(nav.time))
-        nav.phi = a[3]
-        nav.the = a[2]
-        nav.psi = a[1]
-        result['filter'].append(nav)
+    if want(channels, 'filter'):
+        result['filter'] = []
+        for a in att:
+            nav = Record()
+            nav.time = a[0]
+            nav.lat = float(lat_interp(nav.time))
+            nav.lon = float(lon_interp(nav.time))
+            nav.alt = float(alt_interp(nav.time))
+            nav.vn = float(vn_interp(nav.time))
+            nav.ve = float(ve_interp(nav.time))
+            nav.vd = float(vd_interp(nav.time))
+            nav.phi = a[3]
+            nav.the = a[2]
+            nav.psi = a[1]
+            result['filter'].append(nav)
 
     #result['pilot'] = []
     #result['act'] = []
@@ -206,7 +213,7 @@ def load(csv_base):
 
     # load filter (post process) records if they exist (for comparison
     # purposes)
-    if os.path.exists(filter_post):
+    if want(channels, 'filter_post') and os.path.exists(filter_post):
         print("found filter_post.txt file")
         result['filter_post'] = []
         ffilter = fileinput.input(filter_post)
@@ -232,7 +239,7 @@ def load(csv_base):
                     psi = psi + 360.0
                 nav.psi = psi*d2r
                 result['filter_post'].append(nav)
-    if os.path.exists(act_path):      
+    if want(channels, 'act') and os.path.exists(act_path):      
         result['act'] = []
         with open(act_path, 'rb') as f:
             reader = csv.DictReader(f)
@@ -253,4 +260,4 @@ def load(csv_base):
                 act.auto_manual = 0
                 result['act'].append(act)
                 
-    return result
+    return project(result, channels, fields)
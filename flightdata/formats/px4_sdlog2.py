@@ -1,150 +1,178 @@
 # load a px4_sdlog2 csv file
+#
+# The csv is parsed in bulk with pandas (with workers, in line aligned
+# byte ranges on a process pool) and each channel is built from the rows
+# where its message columns are filled in.
 
-import csv
 import math
 import numpy as np
-import re
+import pandas as pd
 
-# empty class we'll fill in with data members
-class Record: pass
+from ..flight_data import FlightChannel, FlightData, project, want
+from .parallel import line_ranges, read_csv_range, run_tasks
 
 d2r = math.pi / 180.0
 r2d = 180.0/ math.pi
 mps2kt = 1.94384
 m2ft = 1.0 / 0.3048
 
-# convert value (string) to float, check for '' and return 0.0
-def my_float(value):
-    if value != '':
-        return float(value)
+# with workers the csv is split into byte ranges parsed on a process pool
+# (<= 0 = one process per cpu), columnar=True returns a FlightData object
+def load(csv_file, columnar=False, channels=None, fields=None, workers=None):
+    df = read_log(csv_file, workers)
+    df = df[df['TIME_StartTime'].notna()]
+    time = df['TIME_StartTime'].to_numpy(dtype=float) / 1000000.0
+
+    result = FlightData()
+    if want(channels, 'imu'):
+        result['imu'] = imu_columns(df, time)
+    if want(channels, 'gps'):
+        result['gps'] = gps_columns(df, time)
+    if want(channels, 'air'):
+        result['air'] = air_columns(df, time)
+    if want(channels, 'filter'):
+        result['filter'] = filter_columns(df, time)
+    if want(channels, 'act'):
+        result['act'] = act_columns(df, time)
+    if want(channels, 'ap'):
+        result['ap'] = ap_columns(df, time)
+    result = project(result, channels, fields)
+    if columnar:
+        return result
     else:
-        return 0.0
-    
-def load(csv_file):
-    result = {}
-    result['imu'] = []
-    result['gps'] = []
-    result['air'] = []
-    result['filter'] = []
-    #result['pilot'] = []
-    result['act'] = []
-    result['ap'] = []
+        return result.as_records()
 
-    last_gps_time = -1.0
+def read_log(csv_file, workers=None):
+    if workers is None or workers == 1:
+        return pd.read_csv(csv_file, engine='c')
     with open(csv_file, 'rb') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row['TIME_StartTime'] == '':
-                # empty time
-                continue
+        start = len(f.readline())
+    names = list(pd.read_csv(csv_file, engine='c', nrows=0).columns)
+    tasks = [ (read_csv_range, (csv_file, names, a, b))
+              for (a, b) in line_ranges(csv_file, start) ]
+    if not len(tasks):
+        return pd.DataFrame(columns=names)
+    return pd.concat(run_tasks(tasks, workers, 'process'), ignore_index=True)
+
+def column(df, name, dtype=float):
+    return df[name].to_numpy(dtype=dtype)
+
+# an optional column with missing values (or a missing column) as 0.0
+def column_or_zero(df, name):
+    if name in df:
+        return df[name].fillna(0.0).to_numpy(dtype=float)
+    else:
+        return np.zeros(len(df))
+
+# rows where a message column is filled in
+def present(df, name):
+    return df[name].notna().to_numpy()
 
-            imu = Record()
-            imu.time = float(row['TIME_StartTime']) / 1000000.0
-            imu.p = float(row['IMU_GyroX'])
-            imu.q = float(row['IMU_GyroY'])
-            imu.r = float(row['IMU_GyroZ'])
-            imu.ax = float(row['IMU_AccX'])
-            imu.ay = float(row['IMU_AccY'])
-            imu.az = float(row['IMU_AccZ'])
-            hx = float(row['IMU_MagX'])
-            hy = float(row['IMU_MagY'])
-            hz = float(row['IMU_MagZ'])
-            hf = np.array( [hx, hy, hz] )
-            norm = np.linalg.norm(hf)
-            hf /= norm
-            imu.hx = hf[0]
-            imu.hy = hf[1]
-            imu.hz = hf[2]
-            #print imu.hx, imu.hy, imu.hz
-            imu.temp = 15.0
-            result['imu'].append( imu )
+def imu_columns(df, time):
+    mag = np.column_stack( (column(df, 'IMU_MagX'), column(df, 'IMU_MagY'),
+                            column(df, 'IMU_MagZ')) )
+    mag /= np.linalg.norm(mag, axis=1)[:, None]
+    imu = FlightChannel({
+        'time': time,
+        'p': column(df, 'IMU_GyroX'),
+        'q': column(df, 'IMU_GyroY'),
+        'r': column(df, 'IMU_GyroZ'),
+        'ax': column(df, 'IMU_AccX'),
+        'ay': column(df, 'IMU_AccY'),
+        'az': column(df, 'IMU_AccZ'),
+        'hx': mag[:,0],
+        'hy': mag[:,1],
+        'hz': mag[:,2],
+        'temp': np.full(len(df), 15.0)
+    })
+    return imu
 
-            if row['GPS_GPSTime'] != '':
-                gps = Record()
-                gps.time = imu.time
-                gps.unix_sec = float(row['GPS_GPSTime']) / 1000000.0
-                gps.lat = float(row['GPS_Lat'])
-                gps.lon = float(row['GPS_Lon'])
-                gps.alt = float(row['GPS_Alt'])
-                gps.vn = float(row['GPS_VelN'])
-                gps.ve = float(row['GPS_VelE'])
-                gps.vd = float(row['GPS_VelD'])
-                gps.sats = int(row['GPS_nSat'])
-                if gps.sats >= 5 and gps.unix_sec > last_gps_time:
-                    result['gps'].append(gps)
-                last_gps_time = gps.unix_sec
+def gps_columns(df, time):
+    rows = present(df, 'GPS_GPSTime')
+    df = df[rows]
+    unix_sec = column(df, 'GPS_GPSTime') / 1000000.0
+    sats = column(df, 'GPS_nSat', int)
+    # keep records with enough satellites whose time is past the
+    # previous gps record
+    last_time = np.concatenate(([-1.0], unix_sec[:-1]))
+    keep = (sats >= 5) & (unix_sec > last_time)
+    gps = FlightChannel({
+        'time': time[rows],
+        'unix_sec': unix_sec,
+        'lat': column(df, 'GPS_Lat'),
+        'lon': column(df, 'GPS_Lon'),
+        'alt': column(df, 'GPS_Alt'),
+        'vn': column(df, 'GPS_VelN'),
+        've': column(df, 'GPS_VelE'),
+        'vd': column(df, 'GPS_VelD'),
+        'sats': sats
+    })
+    return gps.take(keep)
 
-            if row['SENS_BaroPres'] != '':
-                air = Record()
-                air.time = imu.time
-                air.static_press = float(row['SENS_BaroPres'])
-                if 'AIR1_DiffPres' in row and row['AIR1_DiffPres'] != '':
-                    air.diff_press = float(row['AIR1_DiffPres'])
-                else:
-                    air.diff_press = 0.0
-                if 'AIRS_Temp' in row and row['AIRS_Temp'] != '':
-                    air.temp = float(row['AIRS_Temp'])
-                else:
-                    air.temp = 0.0
-                if 'AIRS_IAS' in row and row['AIRS_IAS'] != '':
-                    air.airspeed = float(row['AIRS_IAS']) * mps2kt
-                else:
-                    air.airspeed = 0.0
-                if 'AIR1_BaroAlt' in row and row['AIR1_BaroAlt'] != '':
-                    air.alt_press = float(row['AIR1_BaroAlt'])
-                else:
-                    air.alt_press = 0.0
-                if 'GPS_Alt' in row and row['GPS_Alt'] != '':
-                    air.alt_true = float(row['GPS_Alt'])
-                else:
-                    air.alt_true = 0.0
-                result['air'].append( air )
+def air_columns(df, time):
+    rows = present(df, 'SENS_BaroPres')
+    df = df[rows]
+    air = FlightChannel({
+        'time': time[rows],
+        'static_press': column(df, 'SENS_BaroPres'),
+        'diff_press': column_or_zero(df, 'AIR1_DiffPres'),
+        'temp': column_or_zero(df, 'AIRS_Temp'),
+        'airspeed': column_or_zero(df, 'AIRS_IAS') * mps2kt,
+        'alt_press': column_or_zero(df, 'AIR1_BaroAlt'),
+        'alt_true': column_or_zero(df, 'GPS_Alt')
+    })
+    return air
 
-            if row['GPOS_Lat'] != '':
-                nav = Record()
-                nav.time = imu.time
-                nav.lat = float(row['GPOS_Lat'])*d2r
-                nav.lon = float(row['GPOS_Lon'])*d2r
-                nav.alt = float(row['GPOS_Alt'])
-                nav.vn = float(row['GPOS_VelN'])
-                nav.ve = float(row['GPOS_VelE'])
-                nav.vd = float(row['GPOS_VelD'])
-                nav.phi = float(row['ATT_Roll'])
-                nav.the = float(row['ATT_Pitch'])
-                psi = float(row['ATT_Yaw'])
-                if psi > 180.0:
-                    psi = psi - 360.0
-                if psi < -180.0:
-                    psi = psi + 360.0
-                nav.psi = psi
-                result['filter'].append(nav)
+def filter_columns(df, time):
+    rows = present(df, 'GPOS_Lat')
+    df = df[rows]
+    psi = column(df, 'ATT_Yaw')
+    psi = np.where(psi > 180.0, psi - 360.0, psi)
+    psi = np.where(psi < -180.0, psi + 360.0, psi)
+    nav = FlightChannel({
+        'time': time[rows],
+        'lat': column(df, 'GPOS_Lat')*d2r,
+        'lon': column(df, 'GPOS_Lon')*d2r,
+        'alt': column(df, 'GPOS_Alt'),
+        'vn': column(df, 'GPOS_VelN'),
+        've': column(df, 'GPOS_VelE'),
+        'vd': column(df, 'GPOS_VelD'),
+        'phi': column(df, 'ATT_Roll'),
+        'the': column(df, 'ATT_Pitch'),
+        'psi': psi
+    })
+    return nav
 
-            if row['GPSP_Alt'] != '':
-                ap = Record()
-                ap.time = imu.time
-                ap.hdg = my_float(row['ATSP_YawSP']) * r2d
-                ap.roll = my_float(row['ATSP_RollSP']) * r2d
-                ap.alt = my_float(row['GPSP_Alt']) * m2ft
-                ap.pitch = my_float(row['ATSP_PitchSP']) * r2d
-                ap.speed = my_float(row['TECS_AsSP']) * mps2kt
-                result['ap'].append(ap)
-                
-            if row['OUT0_Out0'] != '':
-                act = Record()
-                ch0 = (float(row['OUT0_Out0']) - 1500) / 500
-                ch1 = (float(row['OUT0_Out1']) - 1500) / 500 
-                ch2 = (float(row['OUT0_Out2']) - 1000) / 1000
-                ch3 = (float(row['OUT0_Out3']) - 1500) / 500
-                #print ch0, ch1, ch2, ch3
-                act.time = imu.time
-                act.aileron = (ch0 - ch1)
-                act.elevator = -(ch0 + ch1)
-                act.throttle = ch2
-                act.rudder = ch3
-                act.gear = 0.0
-                act.flaps = 0.0
-                act.aux1 = 0.0
-                act.auto_manual = 0.0
-                result['act'].append(act)
+def ap_columns(df, time):
+    rows = present(df, 'GPSP_Alt')
+    df = df[rows]
+    ap = FlightChannel({
+        'time': time[rows],
+        'hdg': column_or_zero(df, 'ATSP_YawSP') * r2d,
+        'roll': column_or_zero(df, 'ATSP_RollSP') * r2d,
+        'alt': column_or_zero(df, 'GPSP_Alt') * m2ft,
+        'pitch': column_or_zero(df, 'ATSP_PitchSP') * r2d,
+        'speed': column_or_zero(df, 'TECS_AsSP') * mps2kt
+    })
+    return ap
 
-    return result
+def act_columns(df, time):
+    rows = present(df, 'OUT0_Out0')
+    df = df[rows]
+    ch0 = (column(df, 'OUT0_Out0') - 1500) / 500
+    ch1 = (column(df, 'OUT0_Out1') - 1500) / 500
+    ch2 = (column(df, 'OUT0_Out2') - 1000) / 1000
+    ch3 = (column(df, 'OUT0_Out3') - 1500) / 500
+    zeros = np.zeros(len(df))
+    act = FlightChannel({
+        'time': time[rows],
+        'aileron': ch0 - ch1,
+        'elevator': -(ch0 + ch1),
+        'throttle': ch2,
+        'rudder': ch3,
+        'gear': zeros,
+        'flaps': zeros,
+        'aux1': zeros,
+        'auto_manual': zeros
+    })
+    return act
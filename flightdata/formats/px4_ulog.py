@@ -1,11 +1,12 @@
 # load px4 ulog file
 
-from copy import copy
+import itertools
 import math
 import numpy as np
-from scipy import interpolate
 
-from pyulog.core import ULog    # pip install pyulog
+from ..flight_data import FlightChannel, FlightData, project, want
+from ..flight_stream import SplitSource
+from .ulog_reader import Topic, ULogReader
 
 d2r = math.pi / 180.0
 r2d = 180.0/ math.pi
@@ -30,325 +31,452 @@ def px4_quat2euler(q):
                      1.0 - 2.0 * (q[2] * q[2] + q[3] * q[3]))
     return (phi, the, psi)
 
-def get_section(data, name, id):
-    print("section:", name, id)
+# vectorized px4_quat2euler() for arrays of quaternion components
+def px4_quat2euler_array(q0, q1, q2, q3):
+    norm = np.sqrt(q0*q0 + q1*q1 + q2*q2 + q3*q3)
+    norm = np.where(norm > 0.000001, norm, 1.0)
+    q0 = q0 / norm
+    q1 = q1 / norm
+    q2 = q2 / norm
+    q3 = q3 / norm
+    phi = np.arctan2(2.0 * (q0 * q1 + q2 * q3),
+                     1.0 - 2.0 * (q1 * q1 + q2 * q2))
+    the = np.arcsin(np.clip(2.0 * (q0 * q2 - q3 * q1), -1.0, 1.0))
+    psi = np.arctan2(2.0 * (q0 * q3 + q1 * q2),
+                     1.0 - 2.0 * (q2 * q2 + q3 * q3))
+    return (phi, the, psi)
+
+# linear interpolation of (xp, fp) at the times t, extrapolated from the
+# first/last two points outside xp (like interp1d with
+# fill_value='extrapolate')
+def interp_extrapolate(t, xp, fp):
+    t = np.asarray(t, dtype=float)
+    xp = np.asarray(xp, dtype=float)
+    fp = np.asarray(fp, dtype=float)
+    result = np.interp(t, xp, fp)
+    if len(xp) > 1:
+        before = t < xp[0]
+        slope = (fp[1] - fp[0]) / (xp[1] - xp[0])
+        result[before] = fp[0] + slope * (t[before] - xp[0])
+        after = t > xp[-1]
+        slope = (fp[-1] - fp[-2]) / (xp[-1] - xp[-2])
+        result[after] = fp[-1] + slope * (t[after] - xp[-1])
+    return result
+
+# (topic name, multi_id) -> topic
+def index_topics(data):
+    index = {}
     for d in data:
-        if d.name == name and d.multi_id == id:
-            for f in d.field_data:
-                print(" ", f.field_name)
-            return d
-    return None
+        index[(d.name, d.multi_id)] = d
+    return index
 
-def load(ulog_file):
-    result = {}
-    result["imu"] = []
-    result["gps"] = []
-    result["air"] = []
-    result["filter"] = []
-    #result["pilot"] = []
-    result["act"] = []
-    result["ap"] = []
-
-    nav = {}
-
-    messages = ["actuator_outputs",
-                "airspeed",
-                "sensor_accel",
-                "sensor_combined",
-                "vehicle_air_data",
-                "vehicle_attitude",
-                "vehicle_attitude_setpoint",
-                "vehicle_local_position",
-                "vehicle_global_position",
-                "vehicle_gps_position",
-                "vehicle_magnetometer",
-                "wind_estimate"]
-    
-    ulog = ULog(ulog_file, messages)
-    data = ulog.data_list
-    temp_interp = None
-
-    d = get_section(data, "sensor_accel", 0)
-    if d is not None:
-        imu_temps = []
-        for i in range(len(d.data["timestamp"])):
-            temp = [
-                d.data["timestamp"][i],
-                d.data["temperature"][i]
-            ]
-            imu_temps.append(temp)
-        imu_temps = np.array(imu_temps)
-        temp_interp = interpolate.interp1d(imu_temps[:,0], imu_temps[:,1],
-                                           bounds_error=False,
-                                           fill_value='extrapolate')
-
-    hx_interp = None
-    hy_interp = None
-    hz_interp = None
-    d = get_section(data, "vehicle_magnetometer", 0)
-    if d is not None:
-        mags = []
-        for i in range(len(d.data["timestamp"])):
-            mag = [
-                d.data["timestamp"][i],
-                d.data["magnetometer_ga[0]"][i],
-                d.data["magnetometer_ga[1]"][i],
-                d.data["magnetometer_ga[2]"][i]
-            ]
-            mags.append(mag)
-        mags = np.array(mags)
-        hx_interp = interpolate.interp1d(mags[:,0], mags[:,1],
-                                         bounds_error=False,
-                                         fill_value='extrapolate')
-        hy_interp = interpolate.interp1d(mags[:,0], mags[:,2],
-                                         bounds_error=False,
-                                         fill_value='extrapolate')
-        hz_interp = interpolate.interp1d(mags[:,0], mags[:,3],
-                                         bounds_error=False,
-                                         fill_value='extrapolate')
-
-    d = get_section(data, "sensor_combined", 0)
-    if d is not None:
-        for i in range(len(d.data["timestamp"])):
-            t = d.data["timestamp"][i]
-            if temp_interp is None:
-                temp = 15
-            else:
-                temp = float(temp_interp(t))
-            imu = {
-                "time": t / 1e6,
-                "p": d.data["gyro_rad[0]"][i],
-                "q": d.data["gyro_rad[1]"][i],
-                "r": d.data["gyro_rad[2]"][i],
-                "ax": d.data["accelerometer_m_s2[0]"][i],
-                "ay": d.data["accelerometer_m_s2[1]"][i],
-                "az": d.data["accelerometer_m_s2[2]"][i],
-                "temp": temp
-            }
-            if hx_interp is not None:
-                imu["hx"] = float(hx_interp(t))
-                imu["hy"] = float(hy_interp(t))
-                imu["hz"] = float(hz_interp(t))
-            else:
-                imu["hx"] = d.data["magnetometer_ga[0]"][i]
-                imu["hy"] = d.data["magnetometer_ga[1]"][i]
-                imu["hz"] = d.data["magnetometer_ga[2]"][i]
-                
-            result["imu"].append(imu)
-
-    d = get_section(data, "vehicle_gps_position", 0)
-    if d is not None:
-        for i in range(len(d.data["timestamp"])):
-            gps = {
-                "time": d.data["timestamp"][i] / 1e6,
-                "unix_sec": d.data["time_utc_usec"][i] / 1e6,
-                "lat": d.data["lat"][i] / 1e7,
-                "lon": d.data["lon"][i] / 1e7,
-                "alt": d.data["alt"][i] / 1e3,
-                "vn": d.data["vel_n_m_s"][i],
-                "ve": d.data["vel_e_m_s"][i],
-                "vd": d.data["vel_d_m_s"][i],
-                "sats": d.data["satellites_used"][i]
-            }
-            if gps["sats"] >= 5:
-                result["gps"].append(gps)
-
-    d = get_section(data, "airspeed", 0)
+def get_section(index, name, id):
+    print("section:", name, id)
+    d = index.get((name, id))
     if d is not None:
-        airspeed = []
-        for i in range(len(d.data["timestamp"])):
-            air = [
-                d.data["timestamp"][i],
-                d.data["indicated_airspeed_m_s"][i] * mps2kt
-            ]
-            airspeed.append(air)
-        airspeed = np.array(airspeed)
-        asi_interp = interpolate.interp1d(airspeed[:,0], airspeed[:,1],
-                                          bounds_error=False,
-                                          fill_value='extrapolate')
+        for field in d.data:
+            print(" ", field)
+    return d
+
+# the multi_ids logged for a topic
+def instances(index, name):
+    return sorted([ id for (topic, id) in index if topic == name ])
+
+# ulog topics needed to build each channel
+topics = {
+    "imu": ["sensor_accel", "sensor_combined", "vehicle_magnetometer"],
+    "gps": ["vehicle_gps_position"],
+    "air": ["airspeed", "vehicle_air_data", "wind_estimate"],
+    "filter": ["vehicle_attitude", "vehicle_global_position",
+               "vehicle_local_position"],
+    "ap": ["vehicle_attitude_setpoint"],
+    "act": ["actuator_outputs"],
+}
+
+# angle fields whose units differ from flight_interp.angle_fields
+# (channel name -> field name -> units): the ap setpoints are kept in
+# radians as logged
+channel_angles = {
+    "ap": { "hdg": "rad" },
+}
+
+# every sensor instance is also available as its own channel (imu0,
+# imu1, ..., gps0, gps1, baro0, ...), one per multi_id of the first topic
+instance_topics = {
+    "imu": ["sensor_gyro", "sensor_accel", "sensor_mag"],
+    "gps": ["vehicle_gps_position"],
+    "baro": ["sensor_baro"],
+}
+
+# is any instance channel of key (key + number) selected
+def want_instances(channels, key):
+    if channels is None:
+        return True
+    for name in channels:
+        if name.startswith(key) and name[len(key):].isdigit():
+            return True
+    return False
+
+# only the topics of the selected channels are decoded (all in one pass
+# over the file, every instance of each topic.)
+# Each channel is built in array form: the auxiliary topics (temperature,
+# magnetometer, airspeed, wind, global position) are interpolated onto
+# the sensor_combined / vehicle_attitude timestamps in one np.interp call
+# per field.  columnar=True returns a FlightData object.
+def load(ulog_file, columnar=False, channels=None, fields=None):
+    with ULogReader(ulog_file, topic_names(channels)) as reader:
+        index = index_topics(reader.read())
+    result = project(build(index, channels), channels, fields)
+    if columnar:
+        return result
     else:
-        asi_interp = None
-    d = get_section(data, "wind_estimate", 0)
-    if d is not None and np.sum(d.data["windspeed_north"]) > 0.1 and np.sum(d.data["windspeed_east"]) > 0.1:
-        wind = []
-        for i in range(len(d.data["timestamp"])):
-            wn = d.data["windspeed_north"][i]
-            we = d.data["windspeed_east"][i]
-            wind_deg = 90 - math.atan2(-wn, -we) * r2d
-            wind_kt = math.sqrt( we*we + wn*wn ) * mps2kt
-            w = [
-                d.data["timestamp"][i],
-                wind_deg,
-                wind_kt
-            ]
-            wind.append(w)
-        wind = np.array(wind)
-        print("sum wind:", np.sum(wind[:,1]), np.sum(wind[:,2]))
-        wind_deg_interp = interpolate.interp1d(wind[:,0], wind[:,1],
-                                               bounds_error=False,
-                                               fill_value='extrapolate')
-        wind_kt_interp = interpolate.interp1d(wind[:,0], wind[:,2],
-                                              bounds_error=False,
-                                              fill_value='extrapolate')
+        # the legacy filter records also carry the heading as a unit
+        # vector
+        if "filter" in result and "psi" in result["filter"]:
+            psi = result["filter"]["psi"].astype(float)
+            result["filter"]["psix"] = np.cos(psi)
+            result["filter"]["psiy"] = np.sin(psi)
+        return result.as_records()
+
+# the ulog topics the selected channels are built from
+def topic_names(channels):
+    messages = []
+    for key in topics:
+        if want(channels, key):
+            messages += topics[key]
+    for key in instance_topics:
+        if want_instances(channels, key):
+            messages += instance_topics[key]
+    return sorted(set(messages))
+
+# build the selected channels from the decoded topics
+def build(index, channels):
+    result = FlightData()
+    if want(channels, "imu"):
+        result["imu"] = imu_channel(index)
+    if want(channels, "gps"):
+        result["gps"] = gps_channel(index)
+    if want(channels, "air"):
+        result["air"] = air_channel(index)
+    if want(channels, "filter"):
+        result["filter"] = filter_channel(index)
+    if want(channels, "ap"):
+        result["ap"] = ap_channel(index)
+    if want(channels, "act"):
+        result["act"] = act_channel(index)
+    for key in instance_topics:
+        for id in instances(index, instance_topics[key][0]):
+            name = "%s%d" % (key, id)
+            if not want(channels, name):
+                continue
+            if key == "imu":
+                result[name] = imu_instance(index, id)
+            elif key == "gps":
+                result[name] = gps_channel(index, id)
+            elif key == "baro":
+                result[name] = baro_instance(index, id)
+    return result
+
+# streaming source for flight_stream.windows(): the log is decoded
+# chunk_bytes at a time (ULogReader.chunks()).  The channels of a chunk
+# are built with the tail of the previous chunk's topics carried over,
+# and only the records up to the latest time every topic of the chunk
+# has reached are passed on, so the interpolated fields match load().
+# Auxiliary topics that start late or go quiet for a whole chunk are
+# extrapolated from what has been read so far.  The instance channels
+# are the ones subscribed in the first chunk.
+def stream(ulog_file, channels=None, fields=None, chunk_bytes=1 << 26):
+    reader = ULogReader(ulog_file, topic_names(channels))
+    blocks = stream_blocks(reader, channels, fields, chunk_bytes)
+    # the subscriptions come before the data, so the instances are
+    # known once the first chunk is read
+    first = list(itertools.islice(blocks, 1))
+    names = [ key for key in topics if want(channels, key) ]
+    for key in instance_topics:
+        ids = [ sub.multi_id for sub in reader.subscriptions
+                if sub.name == instance_topics[key][0] ]
+        for id in sorted(set(ids)):
+            if want(channels, "%s%d" % (key, id)):
+                names.append("%s%d" % (key, id))
+    return SplitSource(itertools.chain(first, blocks), names).channels()
+
+def stream_blocks(reader, channels, fields, chunk_bytes):
+    carry = {}
+    done = -math.inf
+    with reader:
+        for data in reader.chunks(chunk_bytes):
+            if not len(data):
+                continue
+            cutoff = min([ d.data["timestamp"][-1] for d in data ])
+            index = join_topics(carry, index_topics(data))
+            block = build(index, channels)
+            yield project(between(block, done, cutoff), channels, fields), \
+                cutoff / 1e6
+            carry = tail_topics(index, cutoff)
+            done = max(done, cutoff)
+    if len(carry):
+        last = max([ d.data["timestamp"][-1] for d in carry.values() ])
+        block = build(carry, channels)
+        yield project(between(block, done, math.inf), channels, fields), \
+            last / 1e6
+
+# the topics of index with the rows of more appended
+def join_topics(index, more):
+    result = dict(index)
+    for key in more:
+        if key in result:
+            d = result[key]
+            data = {}
+            for field in d.data:
+                data[field] = np.concatenate([d.data[field],
+                                              more[key].data[field]])
+            result[key] = Topic(d.name, d.multi_id, d.msg_id, data)
+        else:
+            result[key] = more[key]
+    return result
+
+# the rows of each topic after cutoff and the two before (enough for
+# interp_extrapolate() on the next chunk)
+def tail_topics(index, cutoff):
+    result = {}
+    for key in index:
+        d = index[key]
+        first = max(int(np.searchsorted(d.data["timestamp"], cutoff,
+                                        side="right")) - 2, 0)
+        data = {}
+        for field in d.data:
+            data[field] = d.data[field][first:]
+        result[key] = Topic(d.name, d.multi_id, d.msg_id, data)
+    return result
+
+# the records of each channel with start < time <= end (in timestamp
+# units)
+def between(flight_data, start, end):
+    result = FlightData()
+    for key in flight_data:
+        channel = flight_data[key]
+        if "time" in channel:
+            t = channel["time"]
+            channel = channel.take((t > start / 1e6) & (t <= end / 1e6))
+        result[key] = channel
+    return result
+
+def imu_channel(index):
+    d = get_section(index, "sensor_combined", 0)
+    if d is None:
+        return FlightChannel()
+    t = d.data["timestamp"]
+    accel = get_section(index, "sensor_accel", 0)
+    if accel is not None:
+        temp = interp_extrapolate(t, accel.data["timestamp"],
+                                  accel.data["temperature"])
+    else:
+        temp = np.full(len(t), 15.0)
+    mag = get_section(index, "vehicle_magnetometer", 0)
+    if mag is not None:
+        hx = interp_extrapolate(t, mag.data["timestamp"],
+                                mag.data["magnetometer_ga[0]"])
+        hy = interp_extrapolate(t, mag.data["timestamp"],
+                                mag.data["magnetometer_ga[1]"])
+        hz = interp_extrapolate(t, mag.data["timestamp"],
+                                mag.data["magnetometer_ga[2]"])
     else:
-        wind_deg_interp = None
-        wind_kt_interp = None
+        hx = d.data["magnetometer_ga[0]"]
+        hy = d.data["magnetometer_ga[1]"]
+        hz = d.data["magnetometer_ga[2]"]
+    return FlightChannel({
+        "time": t / 1e6,
+        "p": d.data["gyro_rad[0]"],
+        "q": d.data["gyro_rad[1]"],
+        "r": d.data["gyro_rad[2]"],
+        "ax": d.data["accelerometer_m_s2[0]"],
+        "ay": d.data["accelerometer_m_s2[1]"],
+        "az": d.data["accelerometer_m_s2[2]"],
+        "temp": temp,
+        "hx": hx,
+        "hy": hy,
+        "hz": hz
+    })
+
+def gps_channel(index, id=0):
+    d = get_section(index, "vehicle_gps_position", id)
+    if d is None:
+        return FlightChannel()
+    gps = FlightChannel({
+        "time": d.data["timestamp"] / 1e6,
+        "unix_sec": d.data["time_utc_usec"] / 1e6,
+        "lat": d.data["lat"] / 1e7,
+        "lon": d.data["lon"] / 1e7,
+        "alt": d.data["alt"] / 1e3,
+        "vn": d.data["vel_n_m_s"],
+        "ve": d.data["vel_e_m_s"],
+        "vd": d.data["vel_d_m_s"],
+        "sats": d.data["satellites_used"]
+    })
+    return gps.take(gps["sats"] >= 5)
+
+# one imu record per sensor_gyro row of this instance, with the
+# sensor_accel and sensor_mag rows of the same instance interpolated onto
+# it (nan without them)
+def imu_instance(index, id):
+    gyro = get_section(index, "sensor_gyro", id)
+    t = gyro.data["timestamp"]
+    accel = get_section(index, "sensor_accel", id)
+    mag = get_section(index, "sensor_mag", id)
+    return FlightChannel({
+        "time": t / 1e6,
+        "p": gyro.data["x"],
+        "q": gyro.data["y"],
+        "r": gyro.data["z"],
+        "ax": interp_field(t, accel, "x"),
+        "ay": interp_field(t, accel, "y"),
+        "az": interp_field(t, accel, "z"),
+        "temp": interp_field(t, accel, "temperature"),
+        "hx": interp_field(t, mag, "x"),
+        "hy": interp_field(t, mag, "y"),
+        "hz": interp_field(t, mag, "z")
+    })
 
-    d = get_section(data, "vehicle_air_data", 0)
+# a field of topic d at the times t, nan when the topic or field is missing
+def interp_field(t, d, field):
+    if d is None or field not in d.data or not len(d.data[field]):
+        return np.full(len(t), np.nan)
+    return interp_extrapolate(t, d.data["timestamp"], d.data[field])
+
+def baro_instance(index, id):
+    d = get_section(index, "sensor_baro", id)
+    return FlightChannel({
+        "time": d.data["timestamp"] / 1e6,
+        "static_press": d.data["pressure"],
+        "temp": d.data["temperature"]
+    })
+
+# (timestamp, wind_deg, wind_kt) arrays, None without a usable estimate
+def wind_estimate(index):
+    d = get_section(index, "wind_estimate", 0)
+    if d is None:
+        return None
+    wn = d.data["windspeed_north"]
+    we = d.data["windspeed_east"]
+    if not (np.sum(wn) > 0.1 and np.sum(we) > 0.1):
+        return None
+    wind_deg = 90 - np.arctan2(-wn, -we) * r2d
+    wind_kt = np.sqrt( we*we + wn*wn ) * mps2kt
+    print("sum wind:", np.sum(wind_deg), np.sum(wind_kt))
+    return d.data["timestamp"], wind_deg, wind_kt
+
+def air_channel(index):
+    airspeed = get_section(index, "airspeed", 0)
+    wind = wind_estimate(index)
+    d = get_section(index, "vehicle_air_data", 0)
     if d is not None:
-        for i in range(len(d.data["timestamp"])):
-            t = d.data["timestamp"][i]
-            if asi_interp is not None:
-                asi = float(asi_interp(t))
-            else:
-                asi = 0
-            if wind_deg_interp is not None:
-                wind_deg = float(wind_deg_interp(t))
-            else:
-                wind_deg = 0
-            if wind_kt_interp is not None:
-                wind_kt = float(wind_kt_interp(t))
-            else:
-                wind_kt = 0
-            air = {
-                "time": t / 1e6,
-                "static_press": d.data["baro_pressure_pa"][i],
-                "diff_press": 0.0, 
-                "temp": d.data["baro_temp_celcius"][i],
-                "airspeed": asi,
-                "alt_press": d.data["baro_alt_meter"][i],
-                "alt_true": 0,
-                "tecs_error_total": 0,
-                "tecs_error_diff": 0,
-                "wind_dir": wind_deg,
-                "wind_speed": wind_kt,
-                "pitot_scale": 1
-            }
-            result["air"].append(air)
+        t = d.data["timestamp"]
+        n = len(t)
+        if airspeed is not None:
+            asi = interp_extrapolate(t, airspeed.data["timestamp"],
+                                     airspeed.data["indicated_airspeed_m_s"] * mps2kt)
+        else:
+            asi = np.zeros(n)
+        if wind is not None:
+            wind_deg = interp_extrapolate(t, wind[0], wind[1])
+            wind_kt = interp_extrapolate(t, wind[0], wind[2])
+        else:
+            wind_deg = np.zeros(n)
+            wind_kt = np.zeros(n)
+        return FlightChannel({
+            "time": t / 1e6,
+            "static_press": d.data["baro_pressure_pa"],
+            "diff_press": np.zeros(n),
+            "temp": d.data["baro_temp_celcius"],
+            "airspeed": asi,
+            "alt_press": d.data["baro_alt_meter"],
+            "alt_true": np.zeros(n, dtype=int),
+            "tecs_error_total": np.zeros(n, dtype=int),
+            "tecs_error_diff": np.zeros(n, dtype=int),
+            "wind_dir": wind_deg,
+            "wind_speed": wind_kt,
+            "pitot_scale": np.ones(n, dtype=int)
+        })
+    elif airspeed is not None:
+        t = airspeed.data["timestamp"]
+        air = FlightChannel({
+            "time": t / 1e6,
+            "airspeed": airspeed.data["indicated_airspeed_m_s"] * mps2kt,
+            "pitot_scale": np.ones(len(t), dtype=int)
+        })
+        if wind is not None:
+            air["wind_dir"] = interp_extrapolate(t, wind[0], wind[1])
+            air["wind_speed"] = interp_extrapolate(t, wind[0], wind[2])
+        return air
     else:
-        d = get_section(data, "airspeed", 0)
-        if d is not None:
-            airspeed = []
-            for i in range(len(d.data["timestamp"])):
-                t = d.data["timestamp"][i]
-                air = {
-                    "time": t / 1e6,
-                    "airspeed": d.data["indicated_airspeed_m_s"][i] * mps2kt,
-                    "pitot_scale": 1
-                }
-                if wind_deg_interp is not None:
-                    air["wind_dir"] = float(wind_deg_interp(t))
-                    air["wind_speed"] = float(wind_kt_interp(t))
-                result["air"].append(air)
-
-    d = get_section(data, "vehicle_local_position", 0)
-    
-    d = get_section(data, "vehicle_global_position", 0)
-    if d is not None:
-        poses = []
-        for i in range(len(d.data["timestamp"])):
-            if "vel_n" in d.data:
-                vn = d.data["vel_n"][i]
-                ve = d.data["vel_e"][i]
-                vd = d.data["vel_d"][i]
-            else:
-                vn = 0
-                ve = 0
-                vd = 0
-            pos = [
-                d.data["timestamp"][i],
-                d.data["lat"][i],
-                d.data["lon"][i],
-                d.data["alt"][i],
-                vn,
-                ve,
-                vd
-            ]
-            poses.append(pos)
-        poses = np.array(poses)
-        lat_interp = interpolate.interp1d(poses[:,0], poses[:,1],
-                                          bounds_error=False,
-                                          fill_value='extrapolate')
-        lon_interp = interpolate.interp1d(poses[:,0], poses[:,2],
-                                          bounds_error=False,
-                                          fill_value='extrapolate')
-        alt_interp = interpolate.interp1d(poses[:,0], poses[:,3],
-                                          bounds_error=False,
-                                          fill_value='extrapolate')
-        vn_interp = interpolate.interp1d(poses[:,0], poses[:,4],
-                                         bounds_error=False,
-                                         fill_value='extrapolate')
-        ve_interp = interpolate.interp1d(poses[:,0], poses[:,5],
-                                         bounds_error=False,
-                                         fill_value='extrapolate')
-        vd_interp = interpolate.interp1d(poses[:,0], poses[:,6],
-                                         bounds_error=False,
-                                         fill_value='extrapolate')
-
-    d = get_section(data, "vehicle_attitude", 0)
-    if d is not None:
-        for i in range(len(d.data["timestamp"])):
-            q = [ d.data["q[0]"][i],
-                  d.data["q[1]"][i],
-                  d.data["q[2]"][i],
-                  d.data["q[3]"][i] ]
-            (phi, the, psi) = px4_quat2euler(q)
-            t = d.data["timestamp"][i]
-            nav = {
-                "time": t / 1e6,
-                "lat": float(lat_interp(t))*d2r,
-                "lon": float(lon_interp(t))*d2r,
-                "alt": float(alt_interp(t)),
-                "vn": float(vn_interp(t)),
-                "ve": float(ve_interp(t)),
-                "vd": float(vd_interp(t)),
-                "phi": phi,
-                "the": the,
-                "psi": psi,
-                "psix": math.cos(psi),
-                "psiy": math.sin(psi),
-                "p_bias": 0,
-                "q_bias": 0,
-                "r_bias": 0,
-                "ax_bias": 0,
-                "ay_bias": 0,
-                "az_bias": 0
-            }
-            result["filter"].append(nav)
-
-    d = get_section(data, "vehicle_attitude_setpoint", 0)
-    if d is not None:
-        for i in range(len(d.data["timestamp"])):
-            t = d.data["timestamp"][i]
-            ap = {
-                "time": t / 1e6,
-                "hdg": d.data["yaw_body"][i],
-                "roll": d.data["roll_body"][i],
-                "pitch": d.data["pitch_body"][i],
-                "alt": 0,
-                "speed": 0
-            }
-            result["ap"].append(ap)
-
-    d = get_section(data, "actuator_outputs", 0)
-    if d is not None:
-        for i in range(len(d.data["timestamp"])):
-            t = d.data["timestamp"][i]
-            act = {
-                "time": t / 1e6,
-                "aileron": (d.data["output[0]"][i] - 1500) / 500,
-                "elevator": (d.data["output[1]"][i] - 1500) / 500,
-                "throttle": (d.data["output[2]"][i] - 1000) / 1000,
-                "rudder": -(d.data["output[3]"][i] - 1500) / 500,
-                "flaps": (d.data["output[5]"][i] - 1500) / 500,
-                "output[0]": d.data["output[0]"][i],
-                "output[1]": d.data["output[1]"][i],
-                "output[2]": d.data["output[2]"][i],
-                "output[3]": d.data["output[3]"][i],
-                "output[4]": d.data["output[4]"][i],
-                "output[5]": d.data["output[5]"][i],
-                "output[6]": d.data["output[6]"][i],
-            }
-            result["act"].append(act)
+        return FlightChannel()
 
-    return result
+# attitude from vehicle_attitude, position and velocity interpolated from
+# vehicle_global_position (nan without a global position)
+def filter_channel(index):
+    d = get_section(index, "vehicle_attitude", 0)
+    if d is None:
+        return FlightChannel()
+    t = d.data["timestamp"]
+    n = len(t)
+    (phi, the, psi) = px4_quat2euler_array(d.data["q[0]"], d.data["q[1]"],
+                                           d.data["q[2]"], d.data["q[3]"])
+    pos = {}
+    g = get_section(index, "vehicle_global_position", 0)
+    for key in [ "lat", "lon", "alt", "vel_n", "vel_e", "vel_d" ]:
+        if g is None:
+            pos[key] = np.full(n, np.nan)
+        elif key in g.data:
+            pos[key] = interp_extrapolate(t, g.data["timestamp"], g.data[key])
+        else:
+            pos[key] = np.zeros(n)
+    zeros = np.zeros(n, dtype=int)
+    return FlightChannel({
+        "time": t / 1e6,
+        "lat": pos["lat"]*d2r,
+        "lon": pos["lon"]*d2r,
+        "alt": pos["alt"],
+        "vn": pos["vel_n"],
+        "ve": pos["vel_e"],
+        "vd": pos["vel_d"],
+        "phi": phi,
+        "the": the,
+        "psi": psi,
+        "p_bias": zeros,
+        "q_bias": zeros,
+        "r_bias": zeros,
+        "ax_bias": zeros,
+        "ay_bias": zeros,
+        "az_bias": zeros
+    })
+
+def ap_channel(index):
+    d = get_section(index, "vehicle_attitude_setpoint", 0)
+    if d is None:
+        return FlightChannel()
+    n = len(d.data["timestamp"])
+    return FlightChannel({
+        "time": d.data["timestamp"] / 1e6,
+        "hdg": d.data["yaw_body"],
+        "roll": d.data["roll_body"],
+        "pitch": d.data["pitch_body"],
+        "alt": np.zeros(n, dtype=int),
+        "speed": np.zeros(n, dtype=int)
+    })
+
+def act_channel(index):
+    d = get_section(index, "actuator_outputs", 0)
+    if d is None:
+        return FlightChannel()
+    out = [ d.data["output[%d]" % i] for i in range(7) ]
+    act = FlightChannel({
+        "time": d.data["timestamp"] / 1e6,
+        "aileron": (out[0] - 1500) / 500,
+        "elevator": (out[1] - 1500) / 500,
+        "throttle": (out[2] - 1000) / 1000,
+        "rudder": -(out[3] - 1500) / 500,
+        "flaps": (out[5] - 1500) / 500
+    })
+    for i in range(7):
+        act["output[%d]" % i] = out[i]
+    return act
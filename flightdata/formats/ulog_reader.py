@@ -0,0 +1,317 @@
+# read px4 ulog files (no pyulog dependency)
+#
+# The file is memory mapped and walked a block at a time.  The message
+# boundaries of a block are found with array operations: every offset
+# whose type byte is a known message type is a candidate header, each
+# candidate points at the candidate its size leads to and the chain from
+# the first message is picked out with chain.follow().  After corrupt
+# data (an unknown message type) the walk resyncs after the next sync
+# marker.  The format ('F'), subscription ('A') and unsubscription ('R')
+# definitions are handled in log order, and each subscription covers the
+# data messages between its 'A' message and its 'R' message (or a new
+# 'A' message with the same msg_id.)
+#
+# Only the data ('D') messages of the subscribed topics we ask for are
+# decoded: all the messages of one topic have the same layout, so they
+# are gathered in bulk into a numpy structured array (a dtype built from
+# the format, viewed over the message bytes.)  Field names follow pyulog:
+# arrays are flattened to "name[i]", nested types to "name.field",
+# padding is dropped and the types are the same as in pyulog (bool and
+# char as int8.)
+#
+# chunks() decodes the file chunk_bytes at a time for streaming.
+
+import mmap
+import numpy as np
+
+from .chain import follow
+
+ulog_magic = b"ULog\x01\x12\x35"
+sync_magic = b"\x2F\x73\x13\x20\x25\x0C\xBB\x12"
+header_size = 16
+
+# ulog primitive type -> numpy type
+ulog_types = {
+    "int8_t": "i1",
+    "uint8_t": "u1",
+    "int16_t": "<i2",
+    "uint16_t": "<u2",
+    "int32_t": "<i4",
+    "uint32_t": "<u4",
+    "int64_t": "<i8",
+    "uint64_t": "<u8",
+    "float": "<f4",
+    "double": "<f8",
+    "bool": "i1",
+    "char": "i1",
+}
+
+# message types we act on or know how to skip
+msg_format = ord("F")
+msg_add_logged = ord("A")
+msg_remove_logged = ord("R")
+msg_data = ord("D")
+known_types = np.zeros(256, dtype=bool)
+for c in "BFIMPQARDLCSO":
+    known_types[ord(c)] = True
+
+class Topic():
+    def __init__(self, name, multi_id, msg_id, data):
+        self.name = name
+        self.multi_id = multi_id
+        self.msg_id = msg_id
+        self.data = data        # field name -> array
+
+# a topic subscribed to under msg_id from the 'A' message at start to
+# end (None = the end of the log)
+class Subscription():
+    def __init__(self, msg_id, name, multi_id, start):
+        self.msg_id = msg_id
+        self.name = name
+        self.multi_id = multi_id
+        self.start = start
+        self.end = None
+
+class ULogReader():
+    # topics is a list of topic names to decode (None = all)
+    def __init__(self, filename, topics=None):
+        self.topics = topics
+        self.formats = {}        # format name -> list of (type, name)
+        self.dtypes = {}         # format name -> numpy dtype (flattened)
+        self.sizes = {}          # format name -> size with trailing padding
+        self.subscriptions = []  # Subscription, in log order
+        self.active = {}         # msg_id -> current Subscription
+        with open(filename, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buf = np.frombuffer(self.mm, dtype=np.uint8)
+        if self.mm[:len(ulog_magic)] != ulog_magic:
+            self.close()
+            raise ValueError("not a ulog file: " + str(filename))
+        self.start_timestamp = int(self.buf[8:16].view("<u8")[0])
+        self.syncs = find_syncs(self.mm)
+
+    def close(self):
+        self.buf = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # decode the whole log, returns a list of Topic (like pyulog's
+    # data_list)
+    def read(self):
+        offsets = [ np.zeros(0, dtype=np.int64) ]
+        for chunk in self.walk(None):
+            offsets.append(chunk)
+        return self.decode(np.concatenate(offsets))
+
+    # iterate over the log chunk_bytes at a time, each step yields a list
+    # of Topic with the data messages of that stretch of the file
+    def chunks(self, chunk_bytes=1 << 26):
+        for offsets in self.walk(chunk_bytes):
+            yield self.decode(offsets)
+
+    # walk the messages from the start of the file block_bytes at a time,
+    # the definitions are handled as they come and the offsets of the data
+    # messages are yielded every chunk_bytes (or once at the end)
+    def walk(self, chunk_bytes, block_bytes=1 << 22):
+        buf = self.buf
+        n = len(buf)
+        pos = header_size
+        boundary = pos + chunk_bytes if chunk_bytes else n + 1
+        data = []
+        while pos is not None and pos + 3 <= n:
+            (offsets, pos) = self.walk_block(pos, min(pos + block_bytes, n))
+            types = buf[offsets + 2]
+            for i in np.flatnonzero(types != msg_data):
+                self.definition(int(offsets[i]), types[i])
+            data.append(offsets[types == msg_data])
+            if pos is not None and pos >= boundary:
+                yield np.concatenate(data)
+                data = []
+                boundary = pos + chunk_bytes
+        yield np.concatenate(data + [ np.zeros(0, dtype=np.int64) ])
+
+    # offsets of the messages that start in [pos, end) and the position
+    # the walk continues from (None at the end of the log)
+    def walk_block(self, pos, end):
+        buf = self.buf
+        n = len(buf)
+        stop = min(end, n - 2)
+        # positions relative to the block from here on
+        block = buf[pos:stop+2]
+        cand = np.flatnonzero(np.take(known_types, block[2:])).astype(np.int32)
+        target = (block[cand + 1].astype(np.int32) << 8) | block[cand]
+        target += cand + 3
+        whole = target <= n - pos
+        if not whole.all():
+            cand = cand[whole]
+            target = target[whole]
+        m = len(cand)
+        # block position -> candidate index (-1 = not a candidate)
+        slot = np.full(end - pos + 1, -1, dtype=np.int32)
+        slot[cand] = np.arange(m, dtype=np.int32)
+        if slot[0] < 0:
+            return cand[:0].astype(np.int64), self.resume(pos)
+        # the chain stops at a message leading out of the block or to
+        # something that is not a message
+        nxt = slot[np.minimum(target, end - pos)]
+        nxt[nxt < 0] = m
+        on = np.flatnonzero(follow(nxt, slot[0]))
+        last = pos + int(target[on[-1]])
+        if last < end:
+            last = self.resume(last)
+        return pos + cand[on].astype(np.int64), last
+
+    # where the walk goes on from a position that is not a message: after
+    # the next sync marker for corrupt data (an unknown message type), or
+    # nowhere (None) for a message running past the end of the log
+    def resume(self, pos):
+        n = len(self.buf)
+        if pos + 3 > n or known_types[self.buf[pos + 2]]:
+            return None
+        k = np.searchsorted(self.syncs, pos + 1)
+        if k == len(self.syncs):
+            return None
+        return int(self.syncs[k]) + len(sync_magic)
+
+    # handle a format or (un)subscription message at pos
+    def definition(self, pos, typ):
+        mm = self.mm
+        size = mm[pos] | (mm[pos+1] << 8)
+        end = pos + 3 + size
+        if typ == msg_format:
+            self.add_format(mm[pos+3:end].decode("utf-8", "replace"))
+        elif typ == msg_add_logged:
+            multi_id = mm[pos+3]
+            msg_id = mm[pos+4] | (mm[pos+5] << 8)
+            name = mm[pos+6:end].decode("utf-8", "replace")
+            if msg_id in self.active:
+                self.active[msg_id].end = pos
+            self.active[msg_id] = Subscription(msg_id, name, multi_id, pos)
+            self.subscriptions.append(self.active[msg_id])
+        elif typ == msg_remove_logged:
+            msg_id = mm[pos+3] | (mm[pos+4] << 8)
+            if msg_id in self.active:
+                self.active.pop(msg_id).end = pos
+
+    def add_format(self, text):
+        (name, fields) = text.split(":", 1)
+        self.formats[name] = []
+        for field in fields.split(";"):
+            if field.strip() == "":
+                continue
+            (type, fname) = field.strip().split(" ", 1)
+            self.formats[name].append( (type, fname) )
+
+    # flattened numpy dtype of a format (built on first use), the itemsize
+    # stops at the last real field: the logger may leave out the trailing
+    # padding
+    def dtype(self, name):
+        if name not in self.dtypes:
+            names = []
+            formats = []
+            offsets = []
+            size = self.layout(name, "", 0, names, formats, offsets)
+            used = 0
+            for (t, o) in zip(formats, offsets):
+                used = max(used, o + t.itemsize)
+            self.sizes[name] = size
+            self.dtypes[name] = np.dtype({ "names": names, "formats": formats,
+                                           "offsets": offsets,
+                                           "itemsize": used })
+        return self.dtypes[name]
+
+    # append the fields of a format (at offset, names prefixed) to the
+    # dtype lists, returns the offset past the end
+    def layout(self, name, prefix, offset, names, formats, offsets):
+        for (type, fname) in self.formats[name]:
+            count = None
+            if type.endswith("]"):
+                (type, count) = type[:-1].split("[")
+                count = int(count)
+            for i in range(count if count is not None else 1):
+                if count is None:
+                    field = prefix + fname
+                else:
+                    field = prefix + "%s[%d]" % (fname, i)
+                if type in ulog_types:
+                    np_type = np.dtype(ulog_types[type])
+                    if not fname.startswith("_padding"):
+                        names.append(field)
+                        formats.append(np_type)
+                        offsets.append(offset)
+                    offset += np_type.itemsize
+                else:
+                    # nested message type
+                    offset = self.layout(type, field + ".", offset, names,
+                                         formats, offsets)
+        return offset
+
+    # decode the data messages at the given offsets for the selected
+    # topics, one Topic per (name, multi_id) with data (in subscription
+    # order)
+    def decode(self, offsets):
+        buf = self.buf
+        ids = buf[offsets + 3].astype(np.int64) | \
+            (buf[offsets + 4].astype(np.int64) << 8)
+        groups = {}
+        for sub in self.subscriptions:
+            if self.topics is not None and sub.name not in self.topics:
+                continue
+            if sub.name not in self.formats:
+                continue
+            groups.setdefault( (sub.name, sub.multi_id), [] ).append(sub)
+        result = []
+        for (name, multi_id) in groups:
+            dtype = self.dtype(name)
+            pieces = []
+            for sub in groups[(name, multi_id)]:
+                at = offsets[ids == sub.msg_id]
+                if sub.end is None:
+                    pieces.append(at[at > sub.start])
+                else:
+                    pieces.append(at[(at > sub.start) & (at < sub.end)])
+            at = np.concatenate(pieces)
+            if len(pieces) > 1:
+                at = np.sort(at)
+            # skip messages whose size does not match the format (with or
+            # without the trailing padding)
+            size = buf[at].astype(np.int64) | (buf[at + 1].astype(np.int64) << 8)
+            at = at[(size >= dtype.itemsize + 2) &
+                    (size <= self.sizes[name] + 2)]
+            if not len(at):
+                # like pyulog, only the topics with data are returned
+                continue
+            rows = unpack(buf, at + 5, dtype)
+            data = {}
+            for field in dtype.names:
+                data[field] = rows[field]
+            msg_id = groups[(name, multi_id)][0].msg_id
+            result.append(Topic(name, multi_id, msg_id, data))
+        return result
+
+# offsets of the sync markers in the file
+def find_syncs(mm):
+    syncs = []
+    pos = mm.find(sync_magic)
+    while pos >= 0:
+        syncs.append(pos)
+        pos = mm.find(sync_magic, pos + 1)
+    return np.array(syncs, dtype=np.int64)
+
+# structured array of the records of dtype starting at the given offsets
+def unpack(buf, offsets, dtype):
+    length = dtype.itemsize
+    count = max(len(buf) - length + 1, 0)
+    if not len(offsets) or not count:
+        return np.zeros(0, dtype=dtype)
+    # row k of this view is the length bytes starting at offset k
+    rows = np.lib.stride_tricks.as_strided(buf, shape=(count, length),
+                                           strides=(1, 1), writeable=False)
+    return np.ascontiguousarray(rows[offsets]).view(dtype).reshape(-1)
@@ -10,11 +10,13 @@ join = os.path.join
 import numpy as np
 from scipy import io as sio
 
+from ..flight_data import project, want
+
 mps2kt = 1.94384
 
 class dict2struct(): pass
 
-def load(mat_filename):
+def load(mat_filename, channels=None, fields=None):
     # Name of .mat file that exists in the directory defined above and
     # has the flight_data and flight_info structures
     filepath = mat_filename
@@ -151,9 +153,10 @@ def load(mat_filename):
             'hz': float(hf[2]),
             'temp': 15.0
         }
-        result['imu'].append(imu_pt)
+        if want(channels, 'imu'):
+            result['imu'].append(imu_pt)
 
-        if abs(alt[k] - last_gps_alt) > 0.0001:
+        if want(channels, 'gps') and abs(alt[k] - last_gps_alt) > 0.0001:
             last_gps_alt = alt[k]
             gps_pt = {
                 'time': float(t[k]),
@@ -175,7 +178,8 @@ def load(mat_filename):
             'altitude': float(flight_data.h[k]),
             'alt_true': float(flight_data.navalt[k])
         }
-        result['air'].append(air_pt)
+        if want(channels, 'air'):
+            result['air'].append(air_pt)
         
         nav = {
             'time': float(t[k]),
@@ -195,30 +199,34 @@ def load(mat_filename):
             'ay_bias': float(flight_data.ay_bias[k]),
             'az_bias': float(flight_data.az_bias[k])
         }
-        result['filter'].append(nav)
+        if want(channels, 'filter'):
+            result['filter'].append(nav)
 
         k += 1
 
     dir = os.path.dirname(mat_filename)
     print('dir:', dir)
     
-    filename = os.path.join(dir, 'imu-0.txt')
-    f = open(filename, 'w')
-    for imupt in result['imu']:
-        line = [ '%.5f' % imupt['time'], '%.4f' % imupt['p'], '%.4f' % imupt['q'], '%.4f' % imupt['r'], '%.4f' % imupt['ax'], '%.4f' % imupt['ay'], '%.4f' % imupt['az'], '%.4f' % imupt['hx'], '%.4f' % imupt['hy'], '%.4f' % imupt['hz'], '%.4f' % imupt['temp'], '0' ]
-        f.write(','.join(line) + '\n')
-
-    filename = os.path.join(dir, 'gps-0.txt')
-    f = open(filename, 'w')
-    for gpspt in result['gps']:
-        line = [ '%.5f' % gpspt['time'], '%.10f' % gpspt['lat'], '%.10f' % gpspt['lon'], '%.4f' % gpspt['alt'], '%.4f' % gpspt['vn'], '%.4f' % gpspt['ve'], '%.4f' % gpspt['vd'], '%.4f' % gpspt['time'], '8', '0' ]
-        f.write(','.join(line) + '\n')
-
-    filename = os.path.join(dir, 'filter-0.txt')
-    f = open(filename, 'w')
-    r2d = 180.0 / math.pi
-    for filtpt in result['filter']:
-        line = [ '%.5f' % filtpt['time'], '%.10f' % filtpt['lat'], '%.10f' % filtpt['lon'], '%.4f' % filtpt['alt'], '%.4f' % filtpt['vn'], '%.4f' % filtpt['ve'], '%.4f' % filtpt['vd'], '%.4f' % (filtpt['phi']*r2d), '%.4f' % (filtpt['the']*r2d), '%.4f' % (filtpt['psi']*r2d), '0' ]
-        f.write(','.join(line) + '\n')
-
-    return result
+    if want(channels, 'imu'):
+        filename = os.path.join(dir, 'imu-0.txt')
+        f = open(filename, 'w')
+        for imupt in result['imu']:
+            line = [ '%.5f' % imupt['time'], '%.4f' % imupt['p'], '%.4f' % imupt['q'], '%.4f' % imupt['r'], '%.4f' % imupt['ax'], '%.4f' % imupt['ay'], '%.4f' % imupt['az'], '%.4f' % imupt['hx'], '%.4f' % imupt['hy'], '%.4f' % imupt['hz'], '%.4f' % imupt['temp'], '0' ]
+            f.write(','.join(line) + '\n')
+
+    if want(channels, 'gps'):
+        filename = os.path.join(dir, 'gps-0.txt')
+        f = open(filename, 'w')
+        for gpspt in result['gps']:
+            line = [ '%.5f' % gpspt['time'], '%.10f' % gpspt['lat'], '%.10f' % gpspt['lon'], '%.4f' % gpspt['alt'], '%.4f' % gpspt['vn'], '%.4f' % gpspt['ve'], '%.4f' % gpspt['vd'], '%.4f' % gpspt['time'], '8', '0' ]
+            f.write(','.join(line) + '\n')
+
+    if want(channels, 'filter'):
+        filename = os.path.join(dir, 'filter-0.txt')
+        f = open(filename, 'w')
+        r2d = 180.0 / math.pi
+        for filtpt in result['filter']:
+            line = [ '%.5f' % filtpt['time'], '%.10f' % filtpt['lat'], '%.10f' % filtpt['lon'], '%.4f' % filtpt['alt'], '%.4f' % filtpt['vn'], '%.4f' % filtpt['ve'], '%.4f' % filtpt['vd'], '%.4f' % (filtpt['phi']*r2d), '%.4f' % (filtpt['the']*r2d), '%.4f' % (filtpt['psi']*r2d), '0' ]
+            f.write(','.join(line) + '\n')
+
+    return project(result, channels, fields)